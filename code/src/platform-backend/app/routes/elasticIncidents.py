@@ -1,57 +1,410 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Response
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from elasticsearch import AsyncElasticsearch, Elasticsearch, BadRequestError, NotFoundError
 import pandas as pd
 from pydantic import BaseModel
 from datetime import datetime, timedelta, timezone
+import asyncio
 import calendar
+import json
+import os
 import random
+import threading
+import time
+from typing import List, Optional
+
+from app.routes.embeddingCache import EmbeddingCache, DEFAULT_CACHE_PATH
+from app.routes.embeddingService import EmbeddingService
+from app.routes.encoderBackends import create_encoder
+from app.routes.hitTransforms import format_incident_list, weekday_counts
+from app.routes.incidentAggregations import (SEVERITY_LEVELS, build_overview_query, build_seven_days_query,
+                                             even_split, month_starts)
+from app.routes.incidentCategories import DEFAULT_MIN_SIMILARITY, get_categorizer
+from app.routes.incidentCategories import configure as configure_categories
+from app.routes.incidentIngest import (REQUIRED_COLUMNS, build_incident_text, build_incident_document,
+                                       backfill_derived_fields, bulk_index_documents, content_fingerprint,
+                                       derive_incident_fields, fetch_stored_sources, outdated_derived_fields_query,
+                                       stream_index_incidents)
+from app.routes.incidentLookup import (INCIDENT_DETAIL_FIELDS, MAX_LOOKUP_IDS, backfill_id_keywords,
+                                       build_incident_id_query, build_legacy_incident_id_query,
+                                       build_source_lookup, by_document_id, by_incident_id, exact_hits,
+                                       unique_ids)
+from app.routes.incidentPaging import CursorError, iter_pages, search_page
+from app.routes.incidentRollup import (ROLLUP_INDEX, apply_rollup_changes, delete_rollup_index, ensure_rollup_index,
+                                       rebuild_rollup, build_rollup_seven_days_query, build_rollup_six_months_query,
+                                       seven_days_from_rollup, six_months_from_rollup)
+from app.routes.incidentSearch import (SEARCH_MODES, build_filters, build_knn_search, build_exact_search,
+                                       build_lexical_search, build_more_like_this, build_msearch,
+                                       exclude_documents, merge_query_results, reciprocal_rank_fusion,
+                                       format_hits)
+from app.routes.indexLayout import (build_index_mapping, embedding_fetch_options, hit_embedding, is_quantized,
+                                    put_added_fields)
+from app.routes.queryCache import DEFAULT_SIMILARITY_THRESHOLD, SemanticQueryCache
+from app.routes.responseCache import ResponseCache, SharedGeneration
+from app.routes.vectorIndex import IncidentVectorIndex, UnsupportedFilter
+from app.routes.writeBehind import QueueFullError, WriteBehindQueue
 
 # Initialize FastAPI app and router
 app = FastAPI()
 router = APIRouter()
 
-# Connect to Elasticsearch (without certificates)
-es = Elasticsearch("http://localhost:9200")  # Use "https://localhost:9200" if security is enabled
+# Connect to Elasticsearch (without certificates). The clients are created by the startup hook
+# (see open_elasticsearch_clients), so importing this module opens no connection pool.
+ELASTICSEARCH_URL = "http://localhost:9200"  # Use "https://localhost:9200" if security is enabled
+es = None
 
-# Load pre-trained model for generating embeddings
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Non-blocking client for the read routes. The pool is sized for the concurrent requests of one worker
+# (the default of 10 connections per node queues requests under load).
+ES_ASYNC_CONNECTIONS = int(os.getenv("ES_ASYNC_CONNECTIONS", "50"))
+es_async = None
+
+# Pre-trained model for generating embeddings (loaded lazily, see get_model)
+MODEL_NAME = 'all-MiniLM-L6-v2'
+model = None
+
+# Encoder backend (torch or onnx) and intra-op thread count used for the model
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or None
+_model_lock = threading.Lock()
+
+# Content-addressed embedding cache (memory LRU + on-disk SQLite store), opened by the startup hook
+# so importing this module never touches the filesystem (see open_embedding_cache)
+embedding_cache = None
+_cache_lock = threading.Lock()
 
 # Index name
 index_name = "incidents_final"
 
-# Create Elasticsearch index if it doesn't exist
-if not es.indices.exists(index=index_name):
-    mapping = {
-        "mappings": {
-            "properties": {
-                "sysId": {"type": "text"},
-                "IncidentId": {"type": "text"},
-                "title": {"type": "text"},
-                "description": {"type": "text"},
-                "rootCause": {"type": "text"},
-                "createdDate": {"type": "date"},  # ISO 8601 format
-                "priority": {"type": "keyword"},
-                "status": {"type": "keyword"},  # New field for status
-                "closedDate": {"type": "date", "null_value": None},  # New field for resolution date
-                "embedding": {
-                    "type": "dense_vector",
-                    "dims": 384,
-                    "index": True,
-                    "similarity": "cosine"
-                }
-            }
-        }
-    }
-    es.indices.create(index=index_name, body=mapping)
-    print(f"Index '{index_name}' created.")
-else:
-    print(f"Index '{index_name}' already exists.")
+# Embedding storage layout used when the index is created: float, int8 or bbq (see indexLayout)
+INDEX_LAYOUT = os.getenv("INCIDENT_INDEX_LAYOUT", "float")
+
+# Quantized layouts rescore this many times `size` kNN candidates at full precision
+RESCORE_OVERSAMPLE = 3
+_index_lock = threading.Lock()
+
+# Start-up progress reported by /ready
+warmup_state = {
+    "modelLoaded": False,
+    "modelLoadSeconds": None,
+    "indexPresent": False,
+    "warmupEncodeMs": None,
+    "vectorIndexReady": False,
+    "errors": []
+}
+
+
+def get_model():
+    """Load the encoder backend on first use; concurrent callers wait for the same load."""
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                started = time.perf_counter()
+                model = create_encoder(EMBEDDING_BACKEND, MODEL_NAME, EMBEDDING_THREADS)
+                warmup_state["modelLoadSeconds"] = round(time.perf_counter() - started, 3)
+                warmup_state["modelLoaded"] = True
+    return model
+
+
+def ensure_index():
+    """Create the Elasticsearch index if it doesn't exist (runs once per process)."""
+    if warmup_state["indexPresent"]:
+        return
+    with _index_lock:
+        if warmup_state["indexPresent"]:
+            return
+        if not es.indices.exists(index=index_name):
+            try:
+                es.indices.create(index=index_name, body=build_index_mapping(INDEX_LAYOUT))
+                print(f"Index '{index_name}' created.")
+            except BadRequestError as e:
+                # Another worker created it first
+                if e.error != "resource_already_exists_exception":
+                    raise
+        else:
+            print(f"Index '{index_name}' already exists.")
+            put_added_fields(es, index_name)
+        warmup_state["indexPresent"] = True
+
+
+def _record_warmup_error(step, error):
+    message = f"{step}: {error}"
+    print(f"Warm-up error - {message}")
+    warmup_state["errors"] = (warmup_state["errors"] + [message])[-10:]
+
+
+def warm_up(index_retry_seconds=5.0):
+    """
+    Background start-up: load the model and run one warm-up encode, then bootstrap the index
+    (retrying while Elasticsearch is unreachable) and build the optional in-process vector index.
+    """
+    try:
+        get_model()
+        started = time.perf_counter()
+        encode_batch(["warm-up"])
+        warmup_state["warmupEncodeMs"] = round((time.perf_counter() - started) * 1000, 3)
+    except Exception as e:
+        _record_warmup_error("model", e)
+
+    while not warmup_state["indexPresent"]:
+        try:
+            ensure_index()
+        except Exception as e:
+            _record_warmup_error("index", e)
+            time.sleep(index_retry_seconds)
+
+    if CATEGORY_CENTROID_FALLBACK:
+        try:
+            configure_categories(get_categorizer().mapping, True, generate_embeddings)
+        except Exception as e:
+            _record_warmup_error("categories", e)
+
+    if VECTOR_MIRROR_ENABLED:
+        rebuild_vector_index()
+
+    if ROLLUP_ENABLED:
+        try:
+            if not es.indices.exists(index=ROLLUP_INDEX):
+                # First start with the rollup enabled: build it from the existing incidents
+                rebuild_rollup(es, index_name)
+        except Exception as e:
+            _record_warmup_error("rollup", e)
+
+
+def open_embedding_cache(db_path=None):
+    """Open the embedding cache once per process (EMBEDDING_CACHE_PATH unless `db_path` is given)."""
+    global embedding_cache
+    if embedding_cache is None:
+        with _cache_lock:
+            if embedding_cache is None:
+                embedding_cache = EmbeddingCache(MODEL_NAME,
+                                                 db_path=db_path or os.getenv("EMBEDDING_CACHE_PATH",
+                                                                              DEFAULT_CACHE_PATH))
+    return embedding_cache
+
+
+def open_elasticsearch_clients():
+    """Create the sync and async Elasticsearch clients once per process."""
+    global es, es_async
+    if es is None:
+        es = Elasticsearch(ELASTICSEARCH_URL)
+    if es_async is None:
+        es_async = AsyncElasticsearch(ELASTICSEARCH_URL, connections_per_node=ES_ASYNC_CONNECTIONS,
+                                      request_timeout=30)
+    return es, es_async
+
+
+# Registered first: every other startup hook (warm-up, write-behind recovery) uses the clients
+@router.on_event("startup")
+def start_elasticsearch_clients():
+    open_elasticsearch_clients()
+
+
+@router.on_event("startup")
+def start_embedding_cache():
+    open_embedding_cache()
+
+
+@router.on_event("startup")
+def start_warm_up():
+    threading.Thread(target=warm_up, name="incidents-warm-up", daemon=True).start()
+
+
+@router.get("/ready")
+async def ready():
+    """Readiness probe: 200 once the model is loaded, a warm-up encode ran and the index exists."""
+    is_ready = (warmup_state["modelLoaded"] and warmup_state["warmupEncodeMs"] is not None
+                and warmup_state["indexPresent"])
+    body = {"ready": is_ready, "backend": EMBEDDING_BACKEND, **warmup_state}
+    return JSONResponse(status_code=200 if is_ready else 503, content=body)
+
+
+# Helper function to generate embeddings for many texts in a single batched encode call (bypasses the cache)
+def encode_batch(texts, batch_size=64):
+    return get_model().encode(texts, batch_size=batch_size)
+
+
+# Helper function to generate embeddings for many texts, encoding only cache misses
+def generate_embeddings(texts):
+    return open_embedding_cache().encode(list(texts), encode_batch)
 
 
 # Helper function to generate embeddings
 def generate_embedding(text):
-    return model.encode(text).tolist()
+    return generate_embeddings([text])[0].tolist()
+
+
+# Micro-batching encoder shared by request handlers (add_exception, similarity_search)
+embedding_service = EmbeddingService(generate_embeddings, max_batch_size=32, max_wait_ms=5)
+
+
+async def embed_text(text):
+    """Embedding for a request handler: memory cache first, then the batching service (disk cache + model)."""
+    cached = open_embedding_cache().peek(text)
+    if cached is not None:
+        return cached.tolist()
+    return await embedding_service.encode(text)
+
+
+@router.on_event("shutdown")
+def stop_embedding_service():
+    embedding_service.stop()
+    if embedding_cache is not None:
+        embedding_cache.close()
+
+
+@router.on_event("shutdown")
+async def close_async_client():
+    if es_async is not None:
+        await es_async.close()
+
+
+# Optional in-process ANN mirror of the incident embeddings (enable with INCIDENT_VECTOR_MIRROR=1)
+VECTOR_MIRROR_ENABLED = os.getenv("INCIDENT_VECTOR_MIRROR", "0") == "1"
+vector_index = IncidentVectorIndex(dims=384)
+
+
+def mirror_documents(docs):
+    """Write hook: keep the in-process vector index current with documents just written to Elasticsearch."""
+    if not VECTOR_MIRROR_ENABLED or not docs:
+        return
+    vector_index.upsert(
+        [doc["sysId"] for doc in docs],
+        [doc["embedding"] for doc in docs],
+        [{key: value for key, value in doc.items() if key != "embedding"} for doc in docs]
+    )
+
+
+def mirror_metadata(updates):
+    """Write hook for partial updates [(sysId, changed_fields)] that leave the embedding untouched."""
+    if VECTOR_MIRROR_ENABLED and updates:
+        vector_index.update_metadata(updates)
+
+
+def rebuild_vector_index():
+    try:
+        count = vector_index.build_from_elasticsearch(es, index_name,
+                                                      fetch_options=embedding_fetch_options(INDEX_LAYOUT))
+        warmup_state["vectorIndexReady"] = True
+        print(f"In-process vector index built with {count} incidents in {vector_index.last_build_seconds}s.")
+    except Exception as e:
+        _record_warmup_error("vector index", e)
+
+
+@router.post("/vector_index/rebuild")
+async def vector_index_rebuild():
+    """Rebuild the in-process vector index from Elasticsearch (the source of truth)."""
+    if not VECTOR_MIRROR_ENABLED:
+        raise HTTPException(status_code=400, detail="In-process vector index is disabled (INCIDENT_VECTOR_MIRROR)")
+    await run_in_threadpool(rebuild_vector_index)
+    return vector_index.stats()
+
+
+@router.get("/vector_index/stats")
+async def vector_index_stats():
+    return {"enabled": VECTOR_MIRROR_ENABLED, **vector_index.stats()}
+
+
+@router.get("/embedding_stats")
+async def embedding_stats():
+    """Embedding service counters (queue depth, batch size, batch latency) and cache hit/miss rates."""
+    return {"service": embedding_service.stats(),
+            "cache": embedding_cache.stats() if embedding_cache is not None else None}
+
+
+# Dashboard response cache: (ttl, stale-while-revalidate window) in seconds per endpoint
+DASHBOARD_CACHE_TTLS = {
+    "incident_list": (15, 45),
+    "incidents-overview": (60, 240),
+    "latest_seven_days_incidents": (60, 240),
+    "latest_six_months_incidents": (300, 900)
+}
+dashboard_cache = ResponseCache()
+
+# Semantic cache of /similarity_search results: exact (normalized) text first, then near-identical query
+# embeddings with cosine similarity >= SIMILARITY_CACHE_THRESHOLD. Off by default.
+QUERY_CACHE_ENABLED = os.getenv("SIMILARITY_CACHE", "0") == "1"
+query_cache = SemanticQueryCache(max_entries=int(os.getenv("SIMILARITY_CACHE_SIZE", "1000")),
+                                 ttl=float(os.getenv("SIMILARITY_CACHE_TTL", "300")),
+                                 threshold=float(os.getenv("SIMILARITY_CACHE_THRESHOLD",
+                                                           str(DEFAULT_SIMILARITY_THRESHOLD))))
+
+# Both caches live in each worker process. Writes replace this marker file so the other workers of the host
+# drop their entries on their next cached request; empty disables it (other workers then rely on the TTLs).
+INDEX_GENERATION_PATH = os.getenv("INDEX_GENERATION_PATH",
+                                  os.path.join(os.path.expanduser("~"), ".cache", "incident_index_generation"))
+index_generation = SharedGeneration(INDEX_GENERATION_PATH) if INDEX_GENERATION_PATH else None
+
+
+def sync_index_caches():
+    """Drop the cached responses when another worker changed the incident index."""
+    if index_generation is not None and index_generation.changed():
+        dashboard_cache.invalidate()
+        query_cache.invalidate()
+
+
+async def cached_dashboard_response(response, endpoint, compute, *params):
+    """Serve a dashboard endpoint from the response cache and report the cache state in headers."""
+    ttl, stale = DASHBOARD_CACHE_TTLS[endpoint]
+    sync_index_caches()
+    value, status, age = await dashboard_cache.get((endpoint,) + params, compute, ttl, stale)
+    response.headers["X-Cache"] = status
+    response.headers["X-Cache-Age"] = str(int(age))
+    response.headers["X-Cache-Hit-Ratio"] = f"{dashboard_cache.hit_ratio():.2f}"
+    return value
+
+
+def invalidate_index_caches():
+    """Called by every endpoint that changes the incident index; other workers see it through index_generation."""
+    dashboard_cache.invalidate()
+    query_cache.invalidate()
+    if index_generation is not None:
+        try:
+            index_generation.bump()
+        except OSError as e:
+            print(f"Could not signal the index change to other workers: {e}")
+
+
+@router.get("/dashboard_cache/stats")
+async def dashboard_cache_stats():
+    return dashboard_cache.stats()
+
+
+# Assign incidents without any category keyword to the nearest keyword centroid (INCIDENT_CATEGORY_FALLBACK=centroid)
+CATEGORY_CENTROID_FALLBACK = os.getenv("INCIDENT_CATEGORY_FALLBACK", "") == "centroid"
+
+# Optional daily rollup (INCIDENT_ROLLUP=1): maintained on every write and read by the week/month endpoints
+ROLLUP_ENABLED = os.getenv("INCIDENT_ROLLUP", "0") == "1"
+
+
+def previous_sources(ids):
+    """Versions about to be overwritten, needed to move their rollup contribution (empty when disabled)."""
+    return fetch_stored_sources(es, index_name, ids) if ROLLUP_ENABLED else {}
+
+
+def rollup_changes(changes):
+    """Write hook: apply [(previous_source, new_source)] to the daily rollup. Drift is repaired by a rebuild."""
+    if not ROLLUP_ENABLED or not changes:
+        return
+    try:
+        apply_rollup_changes(es, changes)
+    except Exception as e:
+        print(f"Rollup update failed, run /rollup/rebuild to repair: {e}")
+
+
+@router.post("/rollup/rebuild")
+async def rollup_rebuild():
+    """
+    Recompute the daily rollup from the incident index (consistency repair) into a new index; dashboards
+    keep reading the current rollup until the alias is switched.
+    """
+    try:
+        rows = await run_in_threadpool(rebuild_rollup, es, index_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rebuilding rollup: {str(e)}")
+    invalidate_index_caches()
+    return {"message": "Rollup rebuilt", "rows": rows}
 
 
 # Helper function to convert date to ISO 8601 format
@@ -71,11 +424,19 @@ def convert_to_iso_date(date_str):
 async def delete_index():
     if es.indices.exists(index=index_name):
         es.indices.delete(index=index_name)
+        warmup_state["indexPresent"] = False
+        vector_index.clear()
+        if ROLLUP_ENABLED:
+            # Start again from an empty rollup with the proper mapping
+            delete_rollup_index(es)
+            ensure_rollup_index(es)
+        invalidate_index_caches()
         return {"message": f"Index '{index_name}' deleted successfully."}
     else:
         return {"error": f"Index '{index_name}' does not exist."}
 
 
+# Per-row helpers; list endpoints use the columnar versions in hitTransforms
 def calculate_activity(created_date):
     now = datetime.now(timezone.utc)
     created_dt = datetime.strptime(created_date, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
@@ -115,182 +476,255 @@ def get_progress_value(status):
         return random.randint(10, 30)  # Default for other statuses
 
 
+# Fields read for /incident_list rows
+INCIDENT_LIST_FIELDS = ["IncidentId", "createdDate", "priority", "status"]
+
+# Cursor page size bounds of /incident_list and page size of the NDJSON export
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_PAGE_SIZE = 1000
+
+
 @router.get("/incident_list")
-async def get_incidents(limit: int = Query(None, description="Number of records to return")):
+async def get_incidents(response: Response,
+                        limit: int = Query(None, description="Number of records to return"),
+                        page_size: int = Query(None, gt=0, le=MAX_PAGE_SIZE,
+                                               description="Cursor pagination: incidents per page"),
+                        cursor: str = Query(None, description="Cursor pagination: nextCursor of the previous page"),
+                        stream: bool = Query(False, description="Stream every incident as NDJSON")):
+    """
+    Without paging parameters the original list response is returned (cached, see DASHBOARD_CACHE_TTLS).
+    With page_size/cursor the response is {"incidents": [...], "nextCursor": ...}, paged with a point in
+    time and search_after (newest first). With stream=true every incident is streamed as one JSON object
+    per line, with bounded memory.
+    """
+    if stream:
+        return StreamingResponse(stream_incident_list(), media_type="application/x-ndjson")
+    if page_size or cursor:
+        return await run_in_threadpool(incident_list_page, page_size or DEFAULT_PAGE_SIZE, cursor)
+    return await cached_dashboard_response(response, "incident_list", lambda: compute_incident_list(limit), limit)
+
+
+def incident_list_page(page_size, cursor=None):
+    try:
+        hits, next_cursor = search_page(es, index_name, page_size, INCIDENT_LIST_FIELDS, cursor)
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except NotFoundError:
+        raise HTTPException(status_code=410, detail="Cursor expired, start again without a cursor")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching incidents: {str(e)}")
+    return {"incidents": format_incident_list(hits), "nextCursor": next_cursor}
+
+
+def stream_incident_list():
+    """NDJSON export: one incident per line, read page by page through a point in time."""
+    try:
+        for hits in iter_pages(es, index_name, STREAM_PAGE_SIZE, INCIDENT_LIST_FIELDS):
+            # One columnar transform per page, one line per incident
+            yield "".join(json.dumps(item) + "\n" for item in format_incident_list(hits))
+    except Exception as e:
+        # Headers are already sent; end the stream with an error line the client can detect
+        print(f"Incident list stream failed: {e}")
+        yield json.dumps({"error": f"Error fetching incidents: {str(e)}"}) + "\n"
+
+
+async def compute_incident_list(limit=None):
     try:
         query = {
             "size": limit if limit else 1000,  # Use limit if provided, else return all
             "query": {"match_all": {}},
-            "_source": ["IncidentId", "createdDate", "priority", "status"]
+            "_source": INCIDENT_LIST_FIELDS
         }
-        response = es.search(index=index_name, body=query)
-
-        incidents = []
-        for hit in response["hits"]["hits"]:
-            source = hit["_source"]
-            created_date = source["createdDate"]
-            status = source["status"]
-            activity = calculate_activity(created_date)
-
-            incident_data = {
-                "avatar": {"src": "avatar1.png", "status": "success"},
-                "incident": {
-                    "name": source["IncidentId"],
-                    "new": source["status"] == "New",
-                    "registered": created_date
-                },
-                "progress": {
-                    "value": get_progress_value(status),
-                    "period": created_date,
-                    "color": get_status_color(status)
-                },
-                "priority": source["priority"],
-                "activity": activity
-            }
-            incidents.append(incident_data)
+        response = await es_async.search(index=index_name, body=query)
 
-        return incidents
+        return format_incident_list(response["hits"]["hits"])
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching incidents: {str(e)}")
 
 
 @router.get("/incidents_elastic")
-def get_incident_by_id(incident_id: str):
-    query = {
-        "query": {
-            "match": {
-                "IncidentId": incident_id  # Match a specific IncidentId
-            }
-        },
-        "_source": ["IncidentId", "createdDate", "priority", "status", "title", "description", "rootCause", "closedDate"]  # Retrieve all details needed
-    }
+async def get_incident_by_id(incident_id: Optional[str] = None, sys_id: Optional[str] = None):
+    """
+    One incident by exact IncidentId (keyword term query) or by sysId (document get). IncidentIds the
+    keyword lookup misses are looked up again with the match query documents indexed before the keyword
+    subfield still need.
+    """
+    if not incident_id and not sys_id:
+        raise HTTPException(status_code=400, detail="Either incident_id or sys_id is required")
 
     try:
-        # Execute the query and retrieve the result
-        response = es.search(index=index_name, body=query)
-
-        # Check if any hits were returned
-        if response["hits"]["total"]["value"] > 0:
-            # Return the first matching document
-            return response["hits"]["hits"][0]["_source"]
-        else:
-            print(f"No incident found with IncidentId: {incident_id}")
-            return None
+        if sys_id:
+            response = await es_async.get(index=index_name, id=sys_id, source_includes=INCIDENT_DETAIL_FIELDS)
+            return response["_source"]
+
+        response = await es_async.search(index=index_name, body=build_incident_id_query([incident_id]))
+        hits = response["hits"]["hits"]
+        if not hits:
+            response = await es_async.search(index=index_name, body=build_legacy_incident_id_query([incident_id]))
+            hits = exact_hits(response["hits"]["hits"], incident_id)
+        if hits:
+            return hits[0]["_source"]
+        print(f"No incident found with IncidentId: {incident_id}")
+        return None
 
+    except NotFoundError:
+        print(f"No incident found with sysId: {sys_id}")
+        return None
     except Exception as e:
         print(f"Error fetching incident from Elasticsearch: {e}")
         return None
 
 
-def get_incident_color(priority):
-    """Return the color based on incident priority."""
-    return {
-        "High": "danger",
-        "Medium": "warning",
-        "Low": "success",
-        "Planned": "primary"
-    }.get(priority, "secondary")  # Default if unknown
-
+class IncidentLookupModel(BaseModel):
+    incidentIds: List[str] = []
+    sysIds: List[str] = []
 
-category_mapping = {
-    "Network": ["router", "latency", "network", "connection"],
-    "Hardware": ["server", "malfunction", "hard disk", "power failure"],
-    "Software": ["software", "crash", "update", "bug"],
-    "Security": ["unauthorized", "hacked", "phishing", "breach"]
-}
 
+@router.post("/incidents_elastic/batch")
+async def get_incidents_by_ids(lookup: IncidentLookupModel):
+    """
+    Resolve many incidents at once: IncidentIds with one terms query, sysIds with one mget, both issued
+    concurrently. IncidentIds the terms query misses get one legacy match query (documents indexed before
+    the keyword subfield). Unknown ids map to null.
+    """
+    incident_ids = unique_ids(lookup.incidentIds)
+    sys_ids = unique_ids(lookup.sysIds)
+    if len(incident_ids) + len(sys_ids) > MAX_LOOKUP_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LOOKUP_IDS} ids can be looked up at once")
+
+    async def by_incident_ids():
+        if not incident_ids:
+            return {}
+        response = await es_async.search(index=index_name, body=build_incident_id_query(incident_ids))
+        found = by_incident_id(response["hits"]["hits"], incident_ids)
+        missing = [i for i, source in found.items() if source is None]
+        if missing:
+            response = await es_async.search(index=index_name, body=build_legacy_incident_id_query(missing))
+            found.update(by_incident_id(response["hits"]["hits"], missing))
+        return found
+
+    async def by_sys_ids():
+        if not sys_ids:
+            return {}
+        response = await es_async.mget(index=index_name, ids=sys_ids, source_includes=INCIDENT_DETAIL_FIELDS)
+        return by_document_id(response["docs"])
 
-@router.get("/incidents-overview")
-async def get_incidents_overview(limit: int = None):
-    """Fetch incident summary and metrics for the dashboard."""
     try:
-        query = {
-            "size": limit if limit else 1000,  # Fetch limited records if requested, otherwise all
-            "query": {"match_all": {}},
-            "_source": ["title", "status", "priority", "createdDate", "closedDate", "description"]
-        }
-        response = es.search(index=index_name, body=query)
-
-        # Severity and type counts
-        severity_counts = {"Low": 0, "Medium": 0, "High": 0, "Critical": 0}
-        type_counts = {"Network": 0, "Hardware": 0, "Software": 0, "Security": 0}
-
-        # Get last 6 months in 'MMM' format
-        current_date = datetime.utcnow()
-        last_six_months = [(current_date - timedelta(days=30 * i)).strftime("%b") for i in range(5, -1, -1)]
-
-        # Initialize incident count & resolution times
-        incident_count = {month: 0 for month in last_six_months}
-        resolution_times = {month: [] for month in last_six_months}
+        incidents, documents = await asyncio.gather(by_incident_ids(), by_sys_ids())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching incidents: {str(e)}")
 
-        all_incidents = []  # Store all incidents to sort later
+    missing = [i for i, source in incidents.items() if source is None]
+    missing += [i for i, source in documents.items() if source is None]
+    return {"incidentIds": incidents, "sysIds": documents, "missing": missing}
 
-        for hit in response["hits"]["hits"]:
-            source = hit["_source"]
-            priority = source["priority"]
-            status = source["status"]
-            created_date = source.get("createdDate")
-            closed_date = source.get("closedDate")
 
-            print(f"source === {source}")
+# Endpoint to index the keyword subfields of IncidentId/sysId on documents written before they existed
+@router.post("/id_keywords/backfill")
+async def backfill_id_keywords_endpoint(batch_size: int = Query(500, gt=0)):
+    """Reindex older documents in place so exact IncidentId lookups find them."""
+    ensure_index()
+    try:
+        report = await run_in_threadpool(backfill_id_keywords, es, index_name, INDEX_LAYOUT, batch_size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error backfilling id keywords: {str(e)}")
+    return {"message": "Id keywords backfilled" if report["failed"] == 0
+            else "Id keywords backfilled with failures", **report}
 
-            # Ensure valid createdDate
-            if not created_date:
-                continue
 
-            # Store incident data for sorting
-            all_incidents.append({
-                "color": get_incident_color(priority),
-                "title": source["title"],
-                "status": status,
-                "priority": priority,
-                "system": "Random",
-                "reportedTime": created_date,  # Keep full datetime string
-                "createdDate": created_date  # Keep full datetime for sorting
-            })
+def get_incident_color(priority):
+    """Return the color based on incident priority."""
+    return {
+        "High": "danger",
+        "Medium": "warning",
+        "Low": "success",
+        "Planned": "primary"
+    }.get(priority, "secondary")  # Default if unknown
 
-            # Convert string date to datetime object
-            created_dt = datetime.strptime(created_date, "%Y-%m-%dT%H:%M:%S")
-            month = created_dt.strftime("%b")  # Extract month as 'Jan', 'Feb', etc.
 
-            # Count severity levels
-            if priority in severity_counts:
-                severity_counts[priority] += 1
+class CategoryConfigModel(BaseModel):
+    mapping: dict
+    centroidFallback: bool = False
+    minSimilarity: float = DEFAULT_MIN_SIMILARITY
 
-            # Track incidents over time
-            if month in incident_count:
-                incident_count[month] += 1
 
-            description = source["description"].lower()
-            assigned_category = None
+@router.get("/categories")
+async def get_categories():
+    """Active keyword categorizer configuration."""
+    return get_categorizer().config()
 
-            # Check for keyword matches
-            for category, keywords in category_mapping.items():
-                if any(keyword in description for keyword in keywords):
-                    assigned_category = category
-                    break  # Stop checking once a category is assigned
 
-            # Ensure each incident gets exactly one category
-            if assigned_category is None:
-                assigned_category = random.choice(list(type_counts.keys()))  # Assign randomly if no match
+@router.put("/categories")
+async def put_categories(config: CategoryConfigModel):
+    """
+    Replace the keyword categories at runtime. New writes use them immediately; run
+    /derived_fields/backfill?force=true to recategorize stored incidents.
+    """
+    try:
+        categorizer = await run_in_threadpool(configure_categories, config.mapping, config.centroidFallback,
+                                              generate_embeddings, config.minSimilarity)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    invalidate_index_caches()
+    return categorizer.config()
 
-            type_counts[assigned_category] += 1
 
-            # Store resolution time for resolved incidents
-            if closed_date:
-                closed_dt = datetime.strptime(closed_date, "%Y-%m-%dT%H:%M:%S")
-                resolution_time = (closed_dt - created_dt).days  # Resolution time in days
-                if month in resolution_times:
-                    resolution_times[month].append(max(resolution_time, 1))  # Avoid 0-day resolutions
+@router.get("/incidents-overview")
+async def get_incidents_overview(response: Response, limit: int = None):
+    return await cached_dashboard_response(response, "incidents-overview",
+                                           lambda: compute_incidents_overview(limit), limit)
 
-        # Sort all incidents by `createdDate` (latest first) and pick the latest 4
-        incidents_summary = sorted(all_incidents, key=lambda x: x["createdDate"], reverse=True)[:4]
 
-        # Ensure each month has a value (use average if exists, otherwise 0)
-        avg_resolution_times = [
-            int(sum(times) / len(times)) if times else 0
-            for times in resolution_times.values()
+async def compute_incidents_overview(limit=None):
+    """
+    Fetch incident summary and metrics for the dashboard.
+    Everything is computed by one aggregation query, so the work here is a fixed number of buckets
+    whatever the index size. `limit` caps the latest incidents of the summary (at most 4); metrics always
+    cover every incident.
+    """
+    try:
+        current_date = datetime.utcnow()
+        category_mapping = get_categorizer().mapping
+        body = build_overview_query(category_mapping, current_date, latest=min(limit, 4) if limit else 4,
+                                    derived_fields=await derived_fields_complete())
+        response = await es_async.search(index=index_name, body=body)
+        aggregations = response["aggregations"]
+
+        # Severity counts
+        severity_buckets = {b["key"]: b["doc_count"] for b in aggregations["severity"]["buckets"]}
+        severity_counts = {level: severity_buckets.get(level, 0) for level in SEVERITY_LEVELS}
+
+        # Type counts; incidents matching no keyword are spread evenly over the categories
+        type_counts = {category: aggregations["types"]["buckets"][category]["doc_count"]
+                       for category in category_mapping}
+        uncategorized = response["hits"]["total"]["value"] - sum(type_counts.values())
+        for category, extra in even_split(max(uncategorized, 0), list(type_counts)).items():
+            type_counts[category] += extra
+
+        # Incidents and average resolution time per month over the last 6 months
+        month_buckets = {b["key_as_string"]: b for b in aggregations["recent"]["months"]["buckets"]}
+        incident_count = {}
+        avg_resolution_times = []
+        for month_start in month_starts(current_date):
+            bucket = month_buckets.get(month_start.strftime("%Y-%m"))
+            incident_count[month_start.strftime("%b")] = bucket["doc_count"] if bucket else 0
+            resolution_days = bucket["resolved"]["resolutionDays"]["value"] if bucket else None
+            avg_resolution_times.append(int(resolution_days) if resolution_days else 0)
+
+        # Latest 4 incidents (fewer with a smaller limit)
+        incidents_summary = [
+            {
+                "color": get_incident_color(hit["_source"]["priority"]),
+                "title": hit["_source"]["title"],
+                "status": hit["_source"]["status"],
+                "priority": hit["_source"]["priority"],
+                "system": "Random",
+                "reportedTime": hit["_source"]["createdDate"],  # Keep full datetime string
+                "createdDate": hit["_source"]["createdDate"]
+            }
+            for hit in aggregations["latest"]["hits"]["hits"]
         ]
 
         return {
@@ -310,12 +744,80 @@ async def get_incidents_overview(limit: int = None):
         raise HTTPException(status_code=500, detail=f"Error fetching incidents overview: {str(e)}")
 
 
+# Endpoint to compute the derived analytics fields on documents indexed before they existed
+# Whether every incident carries the current derived fields; rechecked while false (see derived_fields_complete)
+DERIVED_FIELDS_RECHECK_SECONDS = 300
+derived_fields_state = {"complete": False, "checkedAt": None}
+
+
+async def derived_fields_complete():
+    """
+    The dashboard aggregations average the stored resolution fields only once no document lacks them;
+    until then they compute the resolution times with a script (averaging the stored fields would skip
+    older documents). Every write stores the current fields, so a complete index stays complete.
+    """
+    checked_at = derived_fields_state["checkedAt"]
+    if not derived_fields_state["complete"] and (
+            checked_at is None or time.monotonic() - checked_at >= DERIVED_FIELDS_RECHECK_SECONDS):
+        derived_fields_state["checkedAt"] = time.monotonic()
+        try:
+            response = await es_async.count(index=index_name, query=outdated_derived_fields_query())
+            derived_fields_state["complete"] = response["count"] == 0
+        except Exception as e:
+            print(f"Could not check the derived fields, resolution times use the script: {e}")
+    return derived_fields_state["complete"]
+
+
+@router.post("/derived_fields/backfill")
+async def backfill_derived_fields_endpoint(batch_size: int = Query(500, gt=0),
+                                           force: bool = Query(False, description="Recompute every document, "
+                                                                                  "e.g. after changing categories")):
+    """Populate category, resolution time and created month/weekday on existing documents."""
+    ensure_index()
+    try:
+        report = await run_in_threadpool(backfill_derived_fields, es, index_name, INDEX_LAYOUT, batch_size, force)
+        if ROLLUP_ENABLED:
+            # Categories may have changed; recompute the rollup rows from the updated documents
+            es.indices.refresh(index=index_name)
+            await run_in_threadpool(rebuild_rollup, es, index_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error backfilling derived fields: {str(e)}")
+    finally:
+        invalidate_index_caches()
+        # Recheck on the next dashboard query
+        derived_fields_state["checkedAt"] = None
+    return {"message": "Derived fields backfilled" if report["failed"] == 0
+            else "Derived fields backfilled with failures", **report}
+
+
 # Endpoint to index incidents from a CSV file
 @router.post("/index_incidents")
-async def index_incidents(file_path: str):
+async def index_incidents(file_path: str,
+                          stream: bool = Query(False, description="Stream the CSV in chunks with batched "
+                                                                  "encoding and bulk indexing"),
+                          chunk_size: int = Query(500, gt=0, description="Rows per chunk in streaming mode"),
+                          incremental: bool = Query(False, description="Only re-embed new or changed incidents; "
+                                                                       "implies stream=true")):
     """
     Accepts a file path as input, reads the CSV file, and indexes the records into Elasticsearch.
+    With stream=true the file is processed chunk by chunk and a per-chunk progress/failure report is returned.
+    With incremental=true the report also counts created, re-embedded, metadata-updated and skipped incidents.
     """
+    ensure_index()
+
+    if stream or incremental:
+        try:
+            report = await run_in_threadpool(stream_index_incidents, es, index_name, file_path,
+                                             generate_embeddings, chunk_size, mirror_documents,
+                                             incremental, INDEX_LAYOUT, mirror_metadata,
+                                             rollup_changes if ROLLUP_ENABLED else None)
+        except (OSError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
+        finally:
+            invalidate_index_caches()
+        return {"message": "Incidents indexed successfully" if report["failed"] == 0
+                else "Incidents indexed with failures", **report}
+
     try:
         # Read the CSV file from the provided file path
         df = pd.read_csv(file_path)
@@ -323,43 +825,39 @@ async def index_incidents(file_path: str):
         raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
 
     # Ensure required columns are present
-    required_columns = ["sysId", "IncidentId", "title", "description", "rootCause", "createdDate", "priority", "status",
-                        "closedDate"]
-    if not all(col in df.columns for col in required_columns):
-        raise HTTPException(status_code=400, detail=f"CSV file must contain the following columns: {required_columns}")
+    if not all(col in df.columns for col in REQUIRED_COLUMNS):
+        raise HTTPException(status_code=400, detail=f"CSV file must contain the following columns: {REQUIRED_COLUMNS}")
+
+    # Encoding and the per-row writes run in a worker thread so the event loop keeps serving requests
+    await run_in_threadpool(index_rows, df)
+    invalidate_index_caches()
+    return {"message": "Incidents indexed successfully"}
+
 
+def index_rows(df):
+    """Original per-row indexing path of /index_incidents."""
     # Index each incident into Elasticsearch
     for _, row in df.iterrows():
         # Convert dates to ISO 8601 format
         created_date_iso = convert_to_iso_date(row['createdDate'])
         closed_date_iso = convert_to_iso_date(row['closedDate']) if pd.notna(row['closedDate']) else None
 
-        text_to_embed = (f"Title: {row['title']}. Description: {row['description']}. Root Cause: {row['rootCause']}. "
-                         f"Priority: {row['priority']}. Status: {row['status']}.")
+        text_to_embed = build_incident_text(row['title'], row['description'], row['rootCause'], row['priority'],
+                                            row['status'])
 
         embedding = generate_embedding(text_to_embed)
 
-        doc = {
-            "sysId": row['sysId'],
-            "IncidentId": row['IncidentId'],
-            "title": row['title'],
-            "description": row['description'],
-            "rootCause": row['rootCause'],
-            "createdDate": created_date_iso,
-            "priority": row['priority'],
-            "status": row['status'],
-            "closedDate": closed_date_iso,  # Only included if status is 'Resolved' or 'Closed'
-            "embedding": embedding
-        }
+        doc = build_incident_document(row, created_date_iso, closed_date_iso, embedding)
+        previous = previous_sources([row['sysId']])
         es.index(index=index_name, id=row['sysId'], body=doc)
-
-    return {"message": "Incidents indexed successfully"}
+        mirror_documents([doc])
+        rollup_changes([(previous.get(str(row['sysId'])), doc)])
 
 
 # Endpoint to get the latest 10 incidents
 @router.get("/latest_incidents")
 async def latest_incidents():
-    response = es.search(
+    response = await es_async.search(
         index=index_name,
         size=10,
         body={
@@ -382,114 +880,49 @@ async def latest_incidents():
 
 
 @router.get("/latest_seven_days_incidents")
-async def latest_seven_days_incidents():
+async def latest_seven_days_incidents(response: Response):
+    return await cached_dashboard_response(response, "latest_seven_days_incidents",
+                                           compute_latest_seven_days_incidents)
+
+
+async def compute_latest_seven_days_incidents():
     """
     Fetches incident counts for the last 7 days, calculates the percentage of incidents
     compared to total incidents, computes the average resolution time,
     calculates the incident resolution rate, and provides a status-wise breakdown.
     """
     try:
-        # Query to count total incidents
-        total_count_query = {"track_total_hits": True, "query": {"match_all": {}}}
-        total_response = es.search(index=index_name, body=total_count_query)
-        total_incidents = total_response["hits"]["total"]["value"]
-
-        # Query to fetch last 7 days' incidents
-        last_seven_days_query = {
-            "size": 10000,
-            "query": {
-                "range": {
-                    "createdDate": {
-                        "gte": "now-7d/d",
-                        "lte": "now/d"
-                    }
-                }
-            },
-            "_source": ["createdDate", "status"],
-            "sort": [{"createdDate": {"order": "desc"}}]
-        }
-
-        # Query to fetch all resolved/closed incidents
-        resolution_time_query = {
-            "size": 10000,
-            "query": {
-                "bool": {
-                    "must": [{"exists": {"field": "closedDate"}}]
-                }
-            },
-            "_source": ["createdDate", "closedDate"]
-        }
-
-        # Queries to count incidents by status
-        status_queries = {
-            "New": {"track_total_hits": True, "query": {"term": {"status": "New"}}},
-            "Resolved": {"track_total_hits": True, "query": {"term": {"status": "Resolved"}}},
-            "Closed": {"track_total_hits": True, "query": {"term": {"status": "Closed"}}},
-            "Unresolved": {
-                "track_total_hits": True,
-                "query": {
-                    "bool": {
-                        "must_not": [{"exists": {"field": "closedDate"}}]
-                    }
-                }
-            }
-        }
-
-        # Execute searches
-        last_seven_days_response = es.search(index=index_name, body=last_seven_days_query)
-        resolution_time_response = es.search(index=index_name, body=resolution_time_query)
-
-        # Fetch status counts
-        status_counts = {}
-        for status, query in status_queries.items():
-            response = es.search(index=index_name, body=query)
-            status_counts[status] = response["hits"]["total"]["value"]
+        # One aggregation query: total, daily counts of the last week, average resolution and status counts
+        if ROLLUP_ENABLED:
+            response = seven_days_from_rollup(
+                await es_async.search(index=ROLLUP_INDEX, body=build_rollup_seven_days_query()))
+        else:
+            body = build_seven_days_query(derived_fields=await derived_fields_complete())
+            response = await es_async.search(index=index_name, body=body)
+        aggregations = response["aggregations"]
+        total_incidents = response["hits"]["total"]["value"]
+        status_counts = {status: bucket["doc_count"]
+                         for status, bucket in aggregations["statuses"]["buckets"].items()}
 
         # Generate last 7 days' weekday labels
         today = datetime.today()
         last_week_dates = [(today - timedelta(days=i)).strftime('%A') for i in range(6, -1, -1)]
 
-        # Initialize data structures
-        week_data = {day: 0 for day in last_week_dates}
-        resolution_times = []  # Stores resolution durations
-
-        # Process last 7 days' response
-        for hit in last_seven_days_response["hits"]["hits"]:
-            source = hit["_source"]
-            created_date_str = source.get("createdDate")
-
-            if created_date_str:
-                try:
-                    created_date = datetime.strptime(created_date_str, "%Y-%m-%dT%H:%M:%S")
-                    weekday = created_date.strftime('%A')
-                    if weekday in week_data:
-                        week_data[weekday] += 1
-                except ValueError:
-                    continue  # Skip malformed dates
+        # Fold the daily buckets onto weekday labels
+        day_buckets = aggregations["lastWeek"]["days"]["buckets"]
+        week_data = dict(zip(last_week_dates, weekday_counts(
+            pd.to_datetime(pd.Series([b["key_as_string"] for b in day_buckets], dtype=object), format="%Y-%m-%d"),
+            [b["doc_count"] for b in day_buckets], last_week_dates)))
 
         # Total last week incidents
         last_week_incidents = sum(week_data.values())
 
-        # Process resolution time response
-        for hit in resolution_time_response["hits"]["hits"]:
-            source = hit["_source"]
-            created_date_str = source.get("createdDate")
-            closed_date_str = source.get("closedDate")
-
-            if created_date_str and closed_date_str:
-                try:
-                    created_date = datetime.strptime(created_date_str, "%Y-%m-%dT%H:%M:%S")
-                    closed_date = datetime.strptime(closed_date_str, "%Y-%m-%dT%H:%M:%S")
-                    resolution_time = (closed_date - created_date).total_seconds() / 3600  # Convert to hours
-                    resolution_times.append(resolution_time)
-                except ValueError:
-                    continue  # Skip malformed dates
-
         # Calculate percentage of last week incidents
         percentage_last_week = (last_week_incidents / total_incidents * 100) if total_incidents > 0 else 0
 
-        # Calculate average resolution time (in hours)
-        avg_resolution_time = round(sum(resolution_times) / len(resolution_times), 2) if resolution_times else 0
+        # Average resolution time (in hours) over every closed incident
+        avg_hours = aggregations["resolved"]["resolutionHours"]["value"]
+        avg_resolution_time = round(avg_hours, 2) if avg_hours is not None else 0
 
         # Calculate Incident Resolution Rate
         resolution_rate = (status_counts["Resolved"] + status_counts[
@@ -524,7 +957,12 @@ async def latest_seven_days_incidents():
 
 
 @router.get("/latest_six_months_incidents")
-async def latest_six_months_incidents():
+async def latest_six_months_incidents(response: Response):
+    return await cached_dashboard_response(response, "latest_six_months_incidents",
+                                           compute_latest_six_months_incidents)
+
+
+async def compute_latest_six_months_incidents():
     try:
         # Define status colors (matching the UI styles)
         status_colors = {
@@ -563,7 +1001,13 @@ async def latest_six_months_incidents():
             }
         }
 
-        last_six_months_response = es.search(index=index_name, body=last_six_months_query)
+        if ROLLUP_ENABLED:
+            # O(days) rollup rows instead of O(incidents) documents
+            last_six_months_response = six_months_from_rollup(
+                await es_async.search(index=ROLLUP_INDEX, body=build_rollup_six_months_query(start_date, status_colors)),
+                status_colors)
+        else:
+            last_six_months_response = await es_async.search(index=index_name, body=last_six_months_query)
 
         # Process last 6 months' response
         monthly_labels = []
@@ -642,66 +1086,378 @@ class ExceptionModel(BaseModel):
     priority: str
 
 
+def exception_document(exception, iso_date, embedding):
+    """Incident document of an /add_exception payload (a dict of ExceptionModel fields)."""
+    return {
+        "sysId": exception["sysId"],
+        "IncidentId": exception["IncidentId"],
+        "title": exception["title"],
+        "description": exception["description"],
+        "rootCause": exception["rootCause"],
+        "createdDate": iso_date,  # Use the converted ISO 8601 date
+        "priority": exception["priority"],
+        "contentHash": content_fingerprint(exception["title"], exception["description"], exception["rootCause"]),
+        **derive_incident_fields(exception["description"], iso_date, None, embedding),
+        "embedding": embedding
+    }
+
+
+def write_exception_batch(records):
+    """
+    Write-behind flush of queued /add_exception payloads (createdDate already converted): one encode call
+    and one bulk request for the whole batch. Returns one error message (or None) per record.
+    """
+    ensure_index()
+    embeddings = generate_embeddings([record["description"] for record in records])
+    docs = [exception_document(record, record["createdDate"], embedding.tolist())
+            for record, embedding in zip(records, embeddings)]
+
+    previous = previous_sources([doc["sysId"] for doc in docs])
+    _, errors, failed_ids = bulk_index_documents(es, index_name, docs)
+    written = [doc for doc in docs if doc["sysId"] not in failed_ids]
+
+    changes = []
+    for doc in written:
+        # The same sysId may be queued twice in one batch: each version replaces the one before it
+        changes.append((previous.get(doc["sysId"]), doc))
+        previous[doc["sysId"]] = doc
+    mirror_documents(written)
+    rollup_changes(changes)
+    if written:
+        invalidate_index_caches()
+
+    error_by_id = {error["sysId"]: error["error"] for error in errors}
+    return [error_by_id.get(doc["sysId"], "Bulk indexing failed") if doc["sysId"] in failed_ids else None
+            for doc in docs]
+
+
+# Write-behind buffer of /add_exception?write_behind=true: bounded queue, batched writes, spill file.
+# Each worker process journals to its own file next to ADD_EXCEPTION_SPILL_PATH (empty disables the journal).
+ADD_EXCEPTION_SPILL_PATH = os.getenv("ADD_EXCEPTION_SPILL_PATH",
+                                     os.path.join(os.path.expanduser("~"), ".cache", "add_exception_spill.jsonl"))
+exception_writer = None
+_writer_lock = threading.Lock()
+
+
+def open_exception_writer():
+    """Create the write-behind queue once per process."""
+    global exception_writer
+    if exception_writer is None:
+        with _writer_lock:
+            if exception_writer is None:
+                exception_writer = WriteBehindQueue(write_exception_batch,
+                                                    max_queue=int(os.getenv("ADD_EXCEPTION_QUEUE_SIZE", "10000")),
+                                                    max_batch_size=int(os.getenv("ADD_EXCEPTION_BATCH_SIZE", "200")),
+                                                    max_wait_ms=float(os.getenv("ADD_EXCEPTION_FLUSH_MS", "500")),
+                                                    spill_path=ADD_EXCEPTION_SPILL_PATH or None,
+                                                    max_retries=int(os.getenv("ADD_EXCEPTION_MAX_RETRIES", "5")),
+                                                    name="add-exception-writer")
+    return exception_writer
+
+
+@router.on_event("startup")
+def start_exception_writer():
+    """Create the write-behind queue and requeue the exceptions exited processes accepted but never wrote."""
+    try:
+        requeued = open_exception_writer().recover()
+        if requeued:
+            print(f"Requeued {requeued} exceptions from {ADD_EXCEPTION_SPILL_PATH}")
+    except Exception as e:
+        print(f"Could not recover queued exceptions: {e}")
+
+
+@router.on_event("shutdown")
+def stop_exception_writer():
+    if exception_writer is not None:
+        exception_writer.stop()
+
+
 # Endpoint to add a single exception
 @router.post("/add_exception")
-async def add_exception(exception: ExceptionModel):
+async def add_exception(exception: ExceptionModel,
+                        write_behind: bool = Query(False, description="Validate, queue and answer 202 with a "
+                                                                      "tracking id; written in batches")):
     """
     Accepts a single exception as JSON input, generates an embedding for the description,
     and indexes the record into Elasticsearch.
     """
+    if write_behind:
+        iso_date = convert_to_iso_date(exception.createdDate)
+        try:
+            # submit() journals and fsyncs the record: keep that off the event loop
+            tracking_id = await run_in_threadpool(open_exception_writer().submit,
+                                                  {**exception.dict(), "createdDate": iso_date})
+        except QueueFullError as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+        return JSONResponse(status_code=202, content={
+            "message": "Exception queued",
+            "trackingId": tracking_id,
+            "statusUrl": f"/add_exception/status/{tracking_id}"
+        })
+
     try:
+        ensure_index()
+
         # Convert createdDate to ISO 8601 format
         iso_date = convert_to_iso_date(exception.createdDate)
 
-        # Generate embedding for the description
-        embedding = generate_embedding(exception.description)
+        # Generate embedding for the description (batched with concurrent requests, off the event loop)
+        embedding = await embed_text(exception.description)
 
         # Prepare the document to be indexed
-        doc = {
-            "sysId": exception.sysId,
-            "IncidentId": exception.IncidentId,
-            "title": exception.title,
-            "description": exception.description,
-            "rootCause": exception.rootCause,
-            "createdDate": iso_date,  # Use the converted ISO 8601 date
-            "priority": exception.priority,
-            "embedding": embedding
-        }
+        doc = exception_document(exception.dict(), iso_date, embedding)
 
         # Index the document into Elasticsearch
+        previous = previous_sources([exception.sysId])
         es.index(index=index_name, id=exception.sysId, body=doc)
+        mirror_documents([doc])
+        rollup_changes([(previous.get(exception.sysId), doc)])
+        invalidate_index_caches()
 
         return {"message": "Exception added successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding exception: {str(e)}")
 
 
+@router.get("/add_exception/status/{tracking_id}")
+async def add_exception_status(tracking_id: str):
+    """
+    State of a write-behind exception: queued, written or failed (with the error). States are kept by
+    the worker process that accepted the exception, so another worker answers 404 for its tracking id.
+    """
+    status = open_exception_writer().status(tracking_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown tracking id: {tracking_id}")
+    return {"trackingId": tracking_id, **status}
+
+
+@router.get("/add_exception/stats")
+async def add_exception_stats():
+    return open_exception_writer().stats()
+
+
 # Endpoint to perform similarity search
 @router.post("/similarity_search")
-async def similarity_search(query_text: str, size: int = 10):
+async def similarity_search(query_text: str, response: Response, size: int = 10,
+                            mode: str = Query("knn", description="knn (HNSW), exact (script_score over every "
+                                                                 "document) or hybrid (kNN + BM25 fused with RRF)"),
+                            num_candidates: int = Query(100, gt=0, description="HNSW candidates per shard"),
+                            priority: Optional[List[str]] = Query(None),
+                            status: Optional[List[str]] = Query(None),
+                            created_from: Optional[str] = Query(None, description="createdDate lower bound"),
+                            created_to: Optional[str] = Query(None, description="createdDate upper bound"),
+                            source: str = Query("auto", description="auto (in-process index when ready) or "
+                                                                    "elasticsearch")):
     if not query_text:
         raise HTTPException(status_code=400, detail="Missing query_text")
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid mode: {mode}. Expected one of {list(SEARCH_MODES)}")
+
+    # Same question asked again (verbatim or rephrased): serve the cached results
+    cache_params = (mode, size, num_candidates, tuple(priority or ()), tuple(status or ()), created_from,
+                    created_to, source)
+    if QUERY_CACHE_ENABLED:
+        sync_index_caches()
+        cached = query_cache.get_exact(query_text, cache_params)
+        if cached is not None:
+            response.headers["X-Query-Cache"] = "EXACT"
+            return cached
+    generation = query_cache.generation
+
+    filters = build_filters(priority, status, created_from, created_to)
+
+    # The BM25 side of hybrid search does not need the embedding: run it while the query is encoded
+    window = max(size, min(num_candidates, 100))
+    lexical = None
+    if mode == "hybrid":
+        lexical = asyncio.ensure_future(
+            es_async.search(index=index_name, body=build_lexical_search(query_text, window, filters)))
 
-    query_embedding = generate_embedding(query_text)
-    response = es.search(
-        index=index_name,
-        size=size,
-        body={
-            "query": {
-                "script_score": {
-                    "query": {"match_all": {}},
-                    "script": {
-                        "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                        "params": {
-                            "query_vector": query_embedding
-                        }
-                    }
-                }
-            }
-        }
-    )
-    results = [
-        {"id": hit['_id'], "score": hit['_score'], "data": hit['_source']}
-        for hit in response["hits"]["hits"]
-    ]
-    return results
+    try:
+        query_embedding = await embed_text(query_text)
+    except Exception:
+        if lexical is not None:
+            lexical.cancel()
+        raise
+
+    if QUERY_CACHE_ENABLED:
+        cached = query_cache.get_similar(query_embedding, cache_params)
+        if cached is not None:
+            if lexical is not None:
+                lexical.cancel()
+            response.headers["X-Query-Cache"] = "SEMANTIC"
+            return cached
+
+    async def search():
+        # Serve plain kNN lookups from the in-process mirror when it is ready, falling back to Elasticsearch
+        if mode == "knn" and source != "elasticsearch" and VECTOR_MIRROR_ENABLED and vector_index.ready:
+            try:
+                hits = vector_index.search(query_embedding, size, priority, status, created_from, created_to)
+                return format_hits(hits)
+            except UnsupportedFilter:
+                pass
+            except Exception as e:
+                print(f"In-process vector search failed, falling back to Elasticsearch: {e}")
+
+        if mode == "exact":
+            result = await es_async.search(index=index_name, body=build_exact_search(query_embedding, size, filters))
+            return format_hits(result["hits"]["hits"])
+
+        rescore_window = size * RESCORE_OVERSAMPLE if is_quantized(INDEX_LAYOUT) else None
+
+        if mode == "knn":
+            result = await es_async.search(index=index_name, body=build_knn_search(query_embedding, size,
+                                                                                   num_candidates, filters,
+                                                                                   rescore_window))
+            return format_hits(result["hits"]["hits"])
+
+        # Hybrid: vector and BM25 searches run concurrently, fused with reciprocal rank fusion
+        vector = es_async.search(index=index_name, body=build_knn_search(
+            query_embedding, window, num_candidates, filters,
+            window * RESCORE_OVERSAMPLE if rescore_window else None))
+        try:
+            results = await asyncio.gather(vector, lexical)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error running hybrid search: {str(e)}")
+        return format_hits(reciprocal_rank_fusion([result["hits"]["hits"] for result in results], size))
+
+    hits = await search()
+    if QUERY_CACHE_ENABLED:
+        query_cache.put(query_text, cache_params, query_embedding, hits, generation)
+        response.headers["X-Query-Cache"] = "MISS"
+    return hits
+
+
+@router.get("/similarity_cache/stats")
+async def similarity_cache_stats():
+    return {"enabled": QUERY_CACHE_ENABLED, **query_cache.stats()}
+
+
+class SimilarityQueryModel(BaseModel):
+    queryText: str
+    size: int = 10
+    priority: Optional[List[str]] = None
+    status: Optional[List[str]] = None
+    createdFrom: Optional[str] = None
+    createdTo: Optional[str] = None
+
+
+class BatchSimilarityModel(BaseModel):
+    queries: List[SimilarityQueryModel]
+    mode: str = "knn"
+    numCandidates: int = 100
+    dedupe: bool = False
+    dedupeSize: Optional[int] = None
+
+
+# Upper bound of queries in one /similarity_search/batch request
+MAX_BATCH_QUERIES = 50
+
+
+def similarity_bodies(query, embedding, mode, num_candidates):
+    """Search bodies of one batch query: one for knn/exact, vector + BM25 for hybrid (fused afterwards)."""
+    filters = build_filters(query.priority, query.status, query.createdFrom, query.createdTo)
+    if mode == "exact":
+        return [build_exact_search(embedding, query.size, filters)]
+    quantized = is_quantized(INDEX_LAYOUT)
+    if mode == "knn":
+        return [build_knn_search(embedding, query.size, num_candidates, filters,
+                                 query.size * RESCORE_OVERSAMPLE if quantized else None)]
+    window = max(query.size, min(num_candidates, 100))
+    return [build_knn_search(embedding, window, num_candidates, filters,
+                             window * RESCORE_OVERSAMPLE if quantized else None),
+            build_lexical_search(query.queryText, window, filters)]
+
+
+# Endpoint to run several similarity searches with one encode call and one msearch round-trip
+@router.post("/similarity_search/batch")
+async def similarity_search_batch(batch: BatchSimilarityModel):
+    """
+    Results are grouped per query in request order; a query whose search failed carries an "error" instead
+    of hits. With `dedupe` the incidents of every query are also merged into one list with summed scores.
+    """
+    if not batch.queries:
+        raise HTTPException(status_code=400, detail="Missing queries")
+    if len(batch.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    if any(not query.queryText for query in batch.queries):
+        raise HTTPException(status_code=400, detail="Missing queryText")
+    if batch.mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400,
+                            detail=f"Invalid mode: {batch.mode}. Expected one of {list(SEARCH_MODES)}")
+
+    # One encode call for every query text (cache hits are not re-encoded)
+    embeddings = await run_in_threadpool(generate_embeddings, [query.queryText for query in batch.queries])
+
+    bodies = [similarity_bodies(query, embedding.tolist(), batch.mode, batch.numCandidates)
+              for query, embedding in zip(batch.queries, embeddings)]
+    try:
+        response = await es_async.msearch(searches=build_msearch(index_name, [b for group in bodies for b in group]))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error running batch similarity search: {str(e)}")
+
+    responses = iter(response["responses"])
+    results = []
+    for query, group in zip(batch.queries, bodies):
+        group_responses = [next(responses) for _ in group]
+        errors = [r["error"] for r in group_responses if "error" in r]
+        if errors:
+            results.append({"queryText": query.queryText, "error": str(errors[0]), "hits": []})
+            continue
+        hit_lists = [r["hits"]["hits"] for r in group_responses]
+        hits = reciprocal_rank_fusion(hit_lists, query.size) if batch.mode == "hybrid" else hit_lists[0]
+        results.append({"queryText": query.queryText, "hits": format_hits(hits)})
+
+    body = {"results": results}
+    if batch.dedupe:
+        body["merged"] = merge_query_results([result["hits"] for result in results], batch.dedupeSize)
+    return body
+
+
+# Endpoint to find incidents similar to a stored one, using its stored embedding (no encoding)
+@router.get("/similar_incidents")
+async def similar_incidents(incident_id: Optional[str] = None, sys_id: Optional[str] = None, size: int = 10,
+                            num_candidates: int = Query(100, gt=0, description="HNSW candidates per shard"),
+                            priority: Optional[List[str]] = Query(None),
+                            status: Optional[List[str]] = Query(None),
+                            created_from: Optional[str] = Query(None, description="createdDate lower bound"),
+                            created_to: Optional[str] = Query(None, description="createdDate upper bound")):
+    """
+    "More like this incident": a kNN search with the incident's stored vector, excluding the incident itself.
+    Incidents without a stored vector fall back to a lexical more_like_this query. Two Elasticsearch calls.
+    """
+    if not incident_id and not sys_id:
+        raise HTTPException(status_code=400, detail="Either incident_id or sys_id is required")
+
+    try:
+        lookup = await es_async.search(index=index_name, body=build_source_lookup(incident_id, sys_id, INDEX_LAYOUT))
+        hits = lookup["hits"]["hits"]
+        if not hits and not sys_id:
+            # Incidents indexed before the IncidentId keyword subfield
+            lookup = await es_async.search(index=index_name,
+                                           body=build_source_lookup(incident_id, layout=INDEX_LAYOUT, legacy=True))
+            hits = exact_hits(lookup["hits"]["hits"], incident_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching incident: {str(e)}")
+    if not hits:
+        raise HTTPException(status_code=404, detail=f"Incident not found: {incident_id or sys_id}")
+
+    source_hit = hits[0]
+    embedding = hit_embedding(source_hit)
+    filters = exclude_documents(build_filters(priority, status, created_from, created_to), [source_hit["_id"]])
+    if embedding is not None:
+        method = "knn"
+        rescore_window = size * RESCORE_OVERSAMPLE if is_quantized(INDEX_LAYOUT) else None
+        body = build_knn_search(embedding, size, num_candidates, filters, rescore_window)
+    else:
+        method = "more_like_this"
+        body = build_more_like_this(index_name, source_hit["_id"], size, filters)
+
+    try:
+        response = await es_async.search(index=index_name, body=body)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error running similar incidents search: {str(e)}")
+
+    source = {key: value for key, value in source_hit["_source"].items() if key != "embedding"}
+    return {"source": {"id": source_hit["_id"], **source}, "method": method,
+            "hits": format_hits(response["hits"]["hits"])}
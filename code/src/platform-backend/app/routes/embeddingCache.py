@@ -0,0 +1,185 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# Default location of the on-disk tier (override with EMBEDDING_CACHE_PATH)
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "incident_embeddings.sqlite3")
+
+# Default byte budget of the in-memory tier (~170k MiniLM vectors)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Approximate per-entry bookkeeping cost in the LRU (key string + OrderedDict node)
+_ENTRY_OVERHEAD = 160
+
+
+def normalize_text(text):
+    """Normalize text before hashing: unicode NFC and collapsed whitespace (the tokenizer ignores both)."""
+    return " ".join(unicodedata.normalize("NFC", str(text)).split())
+
+
+class EmbeddingCache:
+    """
+    Two-tier, content-addressed embedding cache.
+
+    Keys are sha256(model name + normalized text). The first tier is an in-memory LRU bounded by a
+    byte budget, the second a SQLite table of float32 blobs that survives restarts.
+    """
+
+    def __init__(self, model_name, db_path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.model_name = model_name
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+        self._db = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT NOT NULL, "
+                "dims INTEGER NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        """Insert into the memory tier and evict least recently used entries over the byte budget."""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes + _ENTRY_OVERHEAD
+        while self._memory_bytes > self.max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes + _ENTRY_OVERHEAD
+
+    def peek(self, text):
+        """Memory-tier lookup only (never touches disk); counts a hit but not a miss."""
+        key = self.key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._memory_hits += 1
+        return vector
+
+    def get_many(self, texts):
+        """Look up many texts. Returns a list with a float32 vector or None for each text."""
+        keys = [self.key(text) for text in texts]
+        results = [None] * len(keys)
+        missing = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._memory_hits += 1
+                    results[i] = vector
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing and self._db is not None:
+                found = self._load(list(missing))
+                for key, vector in found.items():
+                    self._remember(key, vector)
+                    for i in missing.pop(key):
+                        results[i] = vector
+                        self._disk_hits += 1
+
+            self._misses += sum(len(positions) for positions in missing.values())
+        return results
+
+    def get(self, text):
+        return self.get_many([text])[0]
+
+    def put_many(self, texts, vectors):
+        """Store vectors for texts in both tiers."""
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                # Own copy: a row view would keep the caller's whole buffer alive (and uncounted by the budget)
+                vector = np.array(vector, dtype=np.float32, copy=True)
+                self._remember(key, vector)
+                rows.append((key, self.model_name, vector.shape[0], vector.tobytes()))
+            if rows and self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+
+    def put(self, text, vector):
+        self.put_many([text], [vector])
+
+    def _load(self, keys):
+        found = {}
+        # SQLite limits the number of bound parameters per statement
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for key, vector in self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch):
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def encode(self, texts, encode_batch):
+        """Return embeddings for texts, encoding only the cache misses in a single batch."""
+        cached = self.get_many(texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            # Encode each distinct missing text once
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = encode_batch(unique)
+            self.put_many(unique, encoded)
+            by_text = dict(zip(unique, (np.asarray(v, dtype=np.float32) for v in encoded)))
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+        return np.vstack(cached) if cached else np.empty((0, 0), dtype=np.float32)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings WHERE model = ?", (self.model_name,))
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._memory_hits + self._disk_hits + self._misses
+            disk_entries = None
+            if self._db is not None:
+                disk_entries = self._db.execute(
+                    "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)).fetchone()[0]
+            return {
+                "model": self.model_name,
+                "memoryHits": self._memory_hits,
+                "diskHits": self._disk_hits,
+                "misses": self._misses,
+                "hitRate": round((self._memory_hits + self._disk_hits) / lookups, 4) if lookups else 0,
+                "memoryEntries": len(self._memory),
+                "memoryBytes": self._memory_bytes,
+                "memoryBudgetBytes": self.max_bytes,
+                "diskEntries": disk_entries
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,139 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Sentinel placed on the queue to stop the worker thread
+_STOP = object()
+
+
+class EmbeddingService:
+    """
+    In-process micro-batching encoder.
+
+    Concurrent callers submit single texts; a dedicated worker thread groups whatever is waiting
+    (up to `max_batch_size`, waiting at most `max_wait_ms` for more) into one `encode_batch` call.
+    The event loop only awaits a future, so it is never blocked by the model.
+    """
+
+    def __init__(self, encode_batch, max_batch_size=32, max_wait_ms=5.0, name="embedding-service"):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Counters exposed through stats()
+        self._requests = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._last_batch_size = 0
+        self._max_seen_batch_size = 0
+        self._last_latency = 0.0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def start(self):
+        """Start the worker thread (called lazily on the first submit)."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the worker thread after the already queued requests have been served."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def submit(self, text):
+        """Queue one text for encoding. Returns a concurrent.futures.Future resolving to a list of floats."""
+        if self._thread is None:
+            self.start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    async def encode(self, text):
+        """Encode one text from async code without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def encode_sync(self, text, timeout=None):
+        """Encode one text from synchronous code, sharing batches with async callers."""
+        return self.submit(text).result(timeout)
+
+    def stats(self):
+        """Queue depth, batch size and per-batch latency counters."""
+        batches = self._batches
+        return {
+            "queueDepth": self._queue.qsize(),
+            "requests": self._requests,
+            "batches": batches,
+            "failedBatches": self._failed_batches,
+            "lastBatchSize": self._last_batch_size,
+            "avgBatchSize": round(self._requests / batches, 2) if batches else 0,
+            "maxBatchSize": self._max_seen_batch_size,
+            "lastBatchLatencyMs": round(self._last_latency * 1000, 3),
+            "avgBatchLatencyMs": round(self._total_latency / batches * 1000, 3) if batches else 0,
+            "maxBatchLatencyMs": round(self._max_latency * 1000, 3)
+        }
+
+    def _collect_batch(self, first):
+        """Collect requests following `first` until the batch is full or max_wait has elapsed."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        stop = False
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run_batch(self, batch):
+        # Drop requests whose caller already gave up
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        try:
+            vectors = self.encode_batch([text for text, _ in batch])
+        except Exception as e:
+            self._failed_batches += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        latency = time.perf_counter() - started
+
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result([float(x) for x in vector])
+
+        self._requests += len(batch)
+        self._batches += 1
+        self._last_batch_size = len(batch)
+        self._max_seen_batch_size = max(self._max_seen_batch_size, len(batch))
+        self._last_latency = latency
+        self._total_latency += latency
+        self._max_latency = max(self._max_latency, latency)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect_batch(first)
+            self._run_batch(batch)
+            if stop:
+                return
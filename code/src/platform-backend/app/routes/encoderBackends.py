@@ -0,0 +1,160 @@
+"""
+Pluggable CPU encoder backends for the incident embedding model.
+
+  torch - SentenceTransformer on PyTorch (original behaviour)
+  onnx  - ONNX Runtime session over the same transformer, with mean pooling and L2 normalization done
+          in NumPy; needs the optional `onnxruntime` package and exports the model on first use
+
+Both backends take an explicit intra-op thread count and encode length-bucketed batches so short titles
+are never padded to the length of long descriptions.
+"""
+import os
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx")
+
+# all-MiniLM-L6-v2 truncates inputs at 256 word pieces
+DEFAULT_MAX_LENGTH = 256
+
+
+def length_bucketed_batches(texts, batch_size):
+    """
+    Yield (positions, texts) batches of similar length. Texts are sorted by length so every batch pads
+    to a similar size; callers scatter results back using the positions.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        positions = order[start:start + batch_size]
+        yield positions, [texts[i] for i in positions]
+
+
+class EncoderBackend:
+    """Common batching logic; subclasses implement _encode_batch for one padded batch."""
+
+    name = None
+
+    def __init__(self, model_name, threads=None):
+        self.model_name = model_name
+        self.threads = threads
+
+    def _encode_batch(self, texts):
+        raise NotImplementedError
+
+    def encode(self, texts, batch_size=64, convert_to_numpy=True):
+        """Encode a string or a list of strings into L2-normalized float32 vectors."""
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        result = None
+        for positions, batch in length_bucketed_batches(texts, batch_size):
+            vectors = np.asarray(self._encode_batch(batch), dtype=np.float32)
+            if result is None:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[positions] = vectors
+        if result is None:
+            result = np.empty((0, 0), dtype=np.float32)
+        return result[0] if single else result
+
+
+class TorchEncoder(EncoderBackend):
+    name = "torch"
+
+    def __init__(self, model_name, threads=None):
+        super().__init__(model_name, threads)
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self._torch = torch
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def _encode_batch(self, texts):
+        with self._torch.inference_mode():
+            return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+
+def export_onnx_model(model_name, onnx_path, max_length=DEFAULT_MAX_LENGTH):
+    """Export the transformer of a SentenceTransformer model to ONNX (one-off, needs torch)."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    class LastHiddenState(torch.nn.Module):
+        # Fixed positional signature so the exporter does not depend on the model's keyword arguments
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.transformer(input_ids=input_ids, attention_mask=attention_mask,
+                                    token_type_ids=token_type_ids).last_hidden_state
+
+    tokenizer = AutoTokenizer.from_pretrained(f"sentence-transformers/{model_name}")
+    transformer = AutoModel.from_pretrained(f"sentence-transformers/{model_name}").eval()
+    sample = tokenizer(["warm-up"], padding=True, truncation=True, max_length=max_length, return_tensors="pt")
+
+    directory = os.path.dirname(onnx_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    dynamic = {0: "batch", 1: "sequence"}
+    export_args = dict(
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "token_type_ids": dynamic,
+                      "last_hidden_state": dynamic},
+        opset_version=14
+    )
+    inputs = (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"])
+    try:
+        # Newer torch versions default to the dynamo exporter, which needs onnxscript
+        torch.onnx.export(LastHiddenState(transformer).eval(), inputs, onnx_path, dynamo=False, **export_args)
+    except TypeError:
+        torch.onnx.export(LastHiddenState(transformer).eval(), inputs, onnx_path, **export_args)
+    return onnx_path
+
+
+class OnnxEncoder(EncoderBackend):
+    name = "onnx"
+
+    def __init__(self, model_name, threads=None, onnx_path=None, max_length=DEFAULT_MAX_LENGTH):
+        super().__init__(model_name, threads)
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx embedding backend needs the onnxruntime package (pip install onnxruntime)")
+        from transformers import AutoTokenizer
+
+        self.max_length = max_length
+        self.onnx_path = onnx_path or os.path.join(os.path.expanduser("~"), ".cache", "onnx", f"{model_name}.onnx")
+        if not os.path.exists(self.onnx_path):
+            export_onnx_model(model_name, self.onnx_path, max_length)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(f"sentence-transformers/{model_name}")
+
+    def _encode_batch(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length,
+                                return_tensors="np")
+        feeds = {name: tokens[name].astype(np.int64) for name in self.input_names if name in tokens}
+        hidden = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalization (the SentenceTransformer pipeline)
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+
+def create_encoder(backend, model_name, threads=None, **kwargs):
+    """Instantiate an encoder backend by name."""
+    if backend == "torch":
+        return TorchEncoder(model_name, threads)
+    if backend == "onnx":
+        return OnnxEncoder(model_name, threads, **kwargs)
+    raise ValueError(f"Unknown embedding backend: {backend}. Expected one of {list(BACKENDS)}")
@@ -0,0 +1,102 @@
+"""
+Columnar transforms of Elasticsearch hits.
+
+A page of hits is turned into one DataFrame; dates are parsed once per column and the derived values
+(relative activity, progress, colors, resolution hours, weekdays) are computed with NumPy/pandas
+instead of per-row Python calls. The output keeps the JSON shapes the endpoints always returned.
+"""
+import numpy as np
+import pandas as pd
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+STATUS_COLORS = {
+    "New": "blue",
+    "Resolved": "green",
+    "Unresolved": "red",
+    "Closed": "gray"
+}
+DEFAULT_STATUS_COLOR = "yellow"
+
+# Inclusive (low, high) ranges of the random progress value per status; fixed values for New/Closed
+PROGRESS_RANGES = {
+    "New": (0, 0),
+    "Closed": (100, 100),
+    "Resolved": (70, 90),
+    "Unresolved": (40, 60)
+}
+DEFAULT_PROGRESS_RANGE = (10, 30)
+
+
+def hits_to_frame(hits, fields):
+    """One row per hit, one column per requested _source field (missing fields become None)."""
+    return pd.DataFrame([hit["_source"] for hit in hits], columns=fields).astype(object).where(
+        lambda frame: frame.notna(), None)
+
+
+def parse_dates(values):
+    """Parse ISO 8601 strings (no timezone) as UTC timestamps; missing or malformed values become NaT."""
+    return pd.to_datetime(pd.Series(values, dtype=object), format=ISO_FORMAT, errors="coerce", utc=True)
+
+
+def activity_strings(created, now=None):
+    """Vectorized calculate_activity: "N sec/min/hrs/days ago" relative to `now` (None for NaT)."""
+    now = now or pd.Timestamp.now(tz="UTC")
+    seconds = (now - created).dt.total_seconds().to_numpy()
+    valid = ~np.isnan(seconds)
+    seconds = np.where(valid, seconds, 0.0)
+    amounts = np.select(
+        [seconds < 60, seconds < 3600, seconds < 86400],
+        [np.trunc(seconds), seconds // 60, seconds // 3600],
+        seconds // 86400
+    ).astype(np.int64)
+    units = np.select([seconds < 60, seconds < 3600, seconds < 86400], ["sec", "min", "hrs"], "days")
+    text = np.char.add(np.char.add(amounts.astype(str), " "), np.char.add(units, " ago")).astype(object)
+    text[~valid] = None
+    return text
+
+
+def progress_values(statuses, rng=None):
+    """Vectorized get_progress_value: a random value in the status' range."""
+    rng = rng or np.random.default_rng()
+    statuses = pd.Series(statuses, dtype=object)
+    low = statuses.map(lambda s: PROGRESS_RANGES.get(s, DEFAULT_PROGRESS_RANGE)[0]).to_numpy(dtype=np.int64)
+    high = statuses.map(lambda s: PROGRESS_RANGES.get(s, DEFAULT_PROGRESS_RANGE)[1]).to_numpy(dtype=np.int64)
+    return rng.integers(low, high + 1) if len(statuses) else np.empty(0, dtype=np.int64)
+
+
+def status_colors(statuses):
+    return pd.Series(statuses, dtype=object).map(STATUS_COLORS).fillna(DEFAULT_STATUS_COLOR).to_numpy()
+
+
+def resolution_hours(created, closed):
+    """Hours between two parsed date columns (NaN where either is missing)."""
+    return ((closed - created).dt.total_seconds() / 3600).to_numpy()
+
+
+def weekday_counts(dates, counts, labels):
+    """Sum `counts` per weekday name of the parsed `dates`, in the order of `labels` (other days dropped)."""
+    totals = pd.Series(np.asarray(counts), index=dates.dt.day_name().to_numpy()).groupby(level=0).sum()
+    return [int(totals.get(label, 0)) for label in labels]
+
+
+def format_incident_list(hits, now=None, rng=None):
+    """Shape a page of hits as /incident_list rows (same JSON as the per-row implementation)."""
+    frame = hits_to_frame(hits, ["IncidentId", "createdDate", "priority", "status"])
+    if frame.empty:
+        return []
+    activity = activity_strings(parse_dates(frame["createdDate"]), now)
+    progress = progress_values(frame["status"], rng)
+    colors = status_colors(frame["status"])
+    return [
+        {
+            "avatar": {"src": "avatar1.png", "status": "success"},
+            "incident": {"name": name, "new": status == "New", "registered": created},
+            "progress": {"value": int(value), "period": created, "color": color},
+            "priority": priority,
+            "activity": active
+        }
+        for name, created, priority, status, active, value, color in zip(
+            frame["IncidentId"], frame["createdDate"], frame["priority"], frame["status"], activity, progress,
+            colors)
+    ]
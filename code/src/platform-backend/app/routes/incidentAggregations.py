@@ -0,0 +1,141 @@
+# Aggregation bodies for the dashboard endpoints (computed by Elasticsearch instead of over fetched hits)
+from datetime import datetime
+
+SEVERITY_LEVELS = ["Low", "Medium", "High", "Critical"]
+
+# Whole days between creation and closure, at least 1 (same rule as the original Python loop). The stored
+# resolutionDays field holds the same value, but averaging it skips documents written before the derived
+# fields, so the script is used (derived_fields=False) until every document carries them.
+RESOLUTION_DAYS_SCRIPT = (
+    "Math.max(ChronoUnit.DAYS.between(doc['createdDate'].value, doc['closedDate'].value), 1L)"
+)
+
+
+def month_starts(now, count=6):
+    """First day of each of the last `count` calendar months, oldest first (current month included)."""
+    months = []
+    year, month = now.year, now.month
+    for _ in range(count):
+        months.append(datetime(year, month, 1))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return months[::-1]
+
+
+def _keyword_clause(keyword):
+    # Substring match like the original `keyword in description.lower()`, phrase match for multi-word keywords
+    if " " in keyword:
+        return {"match_phrase": {"description": keyword}}
+    return {"wildcard": {"description": {"value": f"*{keyword}*", "case_insensitive": True}}}
+
+
+def category_filters(category_mapping):
+    """
+    Exclusive filters per category. Documents with a stored `category` (set at write time, possibly by the
+    embedding fallback) are counted under it; older documents without one fall back to keyword matching,
+    where an incident belongs to the first category whose keywords match.
+    """
+    filters = {}
+    earlier = []
+    for category, keywords in category_mapping.items():
+        matches = {"bool": {"should": [_keyword_clause(k) for k in keywords], "minimum_should_match": 1}}
+        unstored = {"bool": {"filter": [matches],
+                             "must_not": [{"exists": {"field": "category"}}] + list(earlier)}}
+        filters[category] = {"bool": {"should": [{"term": {"category": category}}, unstored],
+                                      "minimum_should_match": 1}}
+        earlier.append(matches)
+    return filters
+
+
+def _resolution_avg(field, script, derived_fields):
+    # Average of the stored derived field, or of the Painless script computing it per document
+    return {"avg": {"field": field} if derived_fields else {"script": {"source": script}}}
+
+
+def build_overview_query(category_mapping, now, months=6, latest=4, derived_fields=False):
+    """Single size-0 search answering /incidents-overview."""
+    starts = month_starts(now, months)
+    return {
+        "size": 0,
+        "track_total_hits": True,
+        "query": {"exists": {"field": "createdDate"}},
+        "aggs": {
+            "severity": {"terms": {"field": "priority", "size": 20}},
+            "types": {"filters": {"filters": category_filters(category_mapping)}},
+            "recent": {
+                "filter": {"range": {"createdDate": {"gte": starts[0].strftime("%Y-%m-%dT%H:%M:%S")}}},
+                "aggs": {
+                    "months": {
+                        "date_histogram": {
+                            "field": "createdDate",
+                            "calendar_interval": "month",
+                            "format": "yyyy-MM",
+                            "min_doc_count": 0,
+                            "extended_bounds": {"min": starts[0].strftime("%Y-%m"),
+                                                "max": starts[-1].strftime("%Y-%m")}
+                        },
+                        "aggs": {
+                            "resolved": {
+                                "filter": {"exists": {"field": "closedDate"}},
+                                "aggs": {"resolutionDays": _resolution_avg("resolutionDays", RESOLUTION_DAYS_SCRIPT,
+                                                                           derived_fields)}
+                            }
+                        }
+                    }
+                }
+            },
+            "latest": {
+                "top_hits": {
+                    "size": latest,
+                    "sort": [{"createdDate": {"order": "desc"}}],
+                    "_source": ["title", "status", "priority", "createdDate"]
+                }
+            }
+        }
+    }
+
+
+def even_split(total, keys):
+    """Distribute `total` over `keys` as evenly as possible (earlier keys get the remainder)."""
+    share, remainder = divmod(total, len(keys))
+    return {key: share + (1 if i < remainder else 0) for i, key in enumerate(keys)}
+
+
+# Hours between creation and closure: fallback for the stored resolutionHours field (see RESOLUTION_DAYS_SCRIPT)
+RESOLUTION_HOURS_SCRIPT = (
+    "(doc['closedDate'].value.toInstant().toEpochMilli() - "
+    "doc['createdDate'].value.toInstant().toEpochMilli()) / 3600000.0"
+)
+
+
+def build_seven_days_query(derived_fields=False):
+    """Single size-0 search answering /latest_seven_days_incidents (no documents are transferred)."""
+    return {
+        "size": 0,
+        "track_total_hits": True,
+        "query": {"match_all": {}},
+        "aggs": {
+            "lastWeek": {
+                "filter": {"range": {"createdDate": {"gte": "now-7d/d", "lte": "now/d"}}},
+                "aggs": {
+                    "days": {"date_histogram": {"field": "createdDate", "calendar_interval": "day",
+                                                "format": "yyyy-MM-dd"}}
+                }
+            },
+            "resolved": {
+                "filter": {"bool": {"filter": [{"exists": {"field": "createdDate"}},
+                                               {"exists": {"field": "closedDate"}}]}},
+                "aggs": {"resolutionHours": _resolution_avg("resolutionHours", RESOLUTION_HOURS_SCRIPT,
+                                                            derived_fields)}
+            },
+            "statuses": {
+                "filters": {
+                    "filters": {
+                        "New": {"term": {"status": "New"}},
+                        "Resolved": {"term": {"status": "Resolved"}},
+                        "Closed": {"term": {"status": "Closed"}},
+                        "Unresolved": {"bool": {"must_not": [{"exists": {"field": "closedDate"}}]}}
+                    }
+                }
+            }
+        }
+    }
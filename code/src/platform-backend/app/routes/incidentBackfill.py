@@ -0,0 +1,170 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from app.routes.encoderBackends import create_encoder
+from app.routes.incidentIngest import (MAX_ERRORS_PER_CHUNK, build_incident_text, build_incident_document,
+                                       bulk_index_documents, prepare_chunk, read_incident_chunks, relaxed_refresh)
+from app.routes.indexLayout import build_index_mapping
+
+# Encoder loaded once per worker process by _init_worker
+_worker_encoder = None
+
+
+def _init_worker(backend, model_name, threads):
+    global _worker_encoder
+    _worker_encoder = create_encoder(backend, model_name, threads)
+
+
+def _create_shared_memory(size):
+    """Create a block the parent will unlink; keep the worker's resource tracker from reclaiming it."""
+    try:
+        return shared_memory.SharedMemory(create=True, size=size, track=False)
+    except TypeError:
+        # Python < 3.13 has no track flag
+        block = shared_memory.SharedMemory(create=True, size=size)
+        resource_tracker.unregister(block._name, "shared_memory")
+        return block
+
+
+def _encode_chunk(chunk_number, texts):
+    """
+    Worker task: encode texts and write the float32 matrix into a new shared memory block.
+    Only the block name and shape travel back through the pipe, not the vectors.
+    """
+    vectors = np.ascontiguousarray(_worker_encoder.encode(texts), dtype=np.float32)
+    block = _create_shared_memory(max(vectors.nbytes, 1))
+    np.ndarray(vectors.shape, dtype=np.float32, buffer=block.buf)[:] = vectors
+    name = block.name
+    block.close()
+    return chunk_number, name, vectors.shape
+
+
+def read_shared_vectors(name, shape):
+    """Attach to a worker's block, copy nothing, and return (array, block) - close/unlink the block when done."""
+    block = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=np.float32, buffer=block.buf), block
+
+
+class Checkpoint:
+    """Set of completed chunk numbers for one input file, persisted atomically after every chunk."""
+
+    def __init__(self, path, file_path, chunk_size):
+        self.path = path
+        self.key = {"file": os.path.abspath(file_path), "chunkSize": chunk_size}
+        self.completed = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("file") == self.key["file"] and data.get("chunkSize") == chunk_size:
+                self.completed = set(data.get("completed", []))
+
+    def mark(self, chunk_number):
+        self.completed.add(chunk_number)
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({**self.key, "completed": sorted(self.completed)}, f)
+        os.replace(tmp_path, self.path)
+
+
+def run_backfill(es, index_name, file_path, chunk_size=2000, workers=None, backend="torch",
+                 model_name="all-MiniLM-L6-v2", threads_per_worker=1, checkpoint_path=None, cache=None,
+                 layout="float", max_in_flight=None, log=print):
+    """
+    Backfill incidents from a large CSV using a pool of encoder processes.
+
+    The parent reads and validates chunks (same logic as /index_incidents?stream=true), workers encode
+    them and hand the vectors back through shared memory, and the parent is the single bulk-indexing
+    stage. Chunks indexed without bulk failures are checkpointed so an interrupted run resumes where it
+    stopped; chunks with failed documents are reported in `retryChunks` and indexed again by the next run.
+    """
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    max_in_flight = max_in_flight or workers * 2
+    checkpoint = Checkpoint(checkpoint_path, file_path, chunk_size)
+    started = time.perf_counter()
+    report = {"chunks": 0, "skippedChunks": 0, "totalRows": 0, "indexed": 0, "failed": 0, "errors": [],
+              "retryChunks": []}
+
+    if not es.indices.exists(index=index_name):
+        es.indices.create(index=index_name, body=build_index_mapping(layout))
+
+    pending = {}
+
+    def finish(future):
+        chunk_number, name, shape = future.result()
+        records, created, closed, errors, invalid_count, texts, cached = pending.pop(chunk_number)
+        shared, block = read_shared_vectors(name, shape)
+        try:
+            # Copy out of the block before it is unlinked: the cache keeps these vectors beyond this chunk
+            vectors = np.array(shared, copy=True)
+        finally:
+            del shared
+            block.close()
+            block.unlink()
+
+        embeddings = cached
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        for position, i in enumerate(missing):
+            embeddings[i] = vectors[position]
+        if cache is not None and missing:
+            cache.put_many([texts[i] for i in missing], vectors)
+        docs = [
+            build_incident_document(record, created_date, closed_date, [float(x) for x in embedding])
+            for record, created_date, closed_date, embedding in zip(records, created, closed, embeddings)
+        ]
+
+        indexed, bulk_errors, failed_ids = bulk_index_documents(es, index_name, docs)
+        failed = invalid_count + (len(docs) - indexed)
+        report["chunks"] += 1
+        report["indexed"] += indexed
+        report["failed"] += failed
+        report["errors"] = (report["errors"] + errors + bulk_errors)[:MAX_ERRORS_PER_CHUNK]
+        if failed_ids:
+            # Not checkpointed: the next run indexes the whole chunk again (writes are idempotent by sysId)
+            report["retryChunks"].append(chunk_number)
+        else:
+            checkpoint.mark(chunk_number)
+        log(f"chunk {chunk_number}: {indexed} indexed, {failed} failed"
+            f"{' (not checkpointed, bulk failures)' if failed_ids else ''} "
+            f"({report['indexed']} indexed in {time.perf_counter() - started:.1f}s)")
+
+    with relaxed_refresh(es, index_name), \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                initargs=(backend, model_name, threads_per_worker)) as pool:
+        in_flight = set()
+        for chunk_number, chunk in read_incident_chunks(file_path, chunk_size):
+            first_row = report["totalRows"]
+            report["totalRows"] += len(chunk)
+            if chunk_number in checkpoint.completed:
+                report["skippedChunks"] += 1
+                continue
+
+            records, created, closed, errors, invalid_count = prepare_chunk(chunk, first_row)
+            texts = [
+                build_incident_text(r["title"], r["description"], r["rootCause"], r["priority"], r["status"])
+                for r in records
+            ]
+            cached = cache.get_many(texts) if cache is not None else [None] * len(texts)
+            to_encode = [text for text, vector in zip(texts, cached) if vector is None]
+
+            pending[chunk_number] = (records, created, closed, errors, invalid_count, texts, cached)
+            in_flight.add(pool.submit(_encode_chunk, chunk_number, to_encode))
+
+            # Bound memory: wait for the oldest work before reading further ahead
+            while len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+
+        for future in list(in_flight):
+            finish(future)
+
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    report["rowsPerSecond"] = round(report["totalRows"] / report["seconds"], 1) if report["seconds"] else None
+    return report
@@ -0,0 +1,118 @@
+import re
+import threading
+
+import numpy as np
+
+# Keyword categories of incidents (the first category with a matching keyword wins)
+CATEGORY_MAPPING = {
+    "Network": ["router", "latency", "network", "connection"],
+    "Hardware": ["server", "malfunction", "hard disk", "power failure"],
+    "Software": ["software", "crash", "update", "bug"],
+    "Security": ["unauthorized", "hacked", "phishing", "breach"]
+}
+
+# Minimum cosine similarity to a centroid for the embedding fallback to assign a category
+DEFAULT_MIN_SIMILARITY = 0.2
+
+
+class Categorizer:
+    """
+    Keyword categorizer compiled once into a single case-insensitive regex.
+
+    One scan of a description tries every position, overlapping keywords included; the category listed
+    first in the mapping wins, exactly like the original nested loop. Optionally, descriptions without any keyword are assigned
+    to the category whose centroid embedding is most similar (vectorized over a whole batch).
+    """
+
+    def __init__(self, mapping, centroids=None, min_similarity=DEFAULT_MIN_SIMILARITY):
+        self.mapping = {category: list(keywords) for category, keywords in mapping.items()}
+        self.categories = list(self.mapping)
+        self.min_similarity = min_similarity
+        # Keyword (lowercase) -> index of the first category listing it
+        self._priority = {}
+        for index, keywords in enumerate(self.mapping.values()):
+            for keyword in keywords:
+                self._priority.setdefault(keyword.lower(), index)
+        # A lookahead matches at every position, so overlapping keywords ("serverouter") are all seen; at each
+        # position the alternation takes the keyword of the first category, so the minimum stays exact
+        alternation = "|".join(re.escape(k) for k in sorted(self._priority, key=self._priority.get))
+        self._pattern = re.compile(f"(?=({alternation}))", re.IGNORECASE) if alternation else None
+        self.centroids = None
+        if centroids is not None:
+            self.centroids = _normalize(np.asarray([centroids[c] for c in self.categories], dtype=np.float32))
+
+    def _keyword_index(self, description):
+        if not description or self._pattern is None:
+            return None
+        found = [self._priority[match.lower()] for match in self._pattern.findall(str(description))]
+        return min(found) if found else None
+
+    def categorize(self, description, embedding=None):
+        """Category of one description, or None when nothing matches."""
+        return self.categorize_many([description], None if embedding is None else [embedding])[0]
+
+    def categorize_many(self, descriptions, embeddings=None):
+        """Categorize a batch; `embeddings` (same order) enable the centroid fallback when configured."""
+        indexes = [self._keyword_index(description) for description in descriptions]
+        if self.centroids is not None and embeddings is not None:
+            missing = [i for i, index in enumerate(indexes) if index is None and embeddings[i] is not None]
+            if missing:
+                vectors = _normalize(np.asarray([embeddings[i] for i in missing], dtype=np.float32))
+                similarities = vectors @ self.centroids.T
+                best = np.argmax(similarities, axis=1)
+                for row, i in enumerate(missing):
+                    if similarities[row, best[row]] >= self.min_similarity:
+                        indexes[i] = int(best[row])
+        return [None if index is None else self.categories[index] for index in indexes]
+
+    def config(self):
+        return {
+            "mapping": self.mapping,
+            "centroidFallback": self.centroids is not None,
+            "minSimilarity": self.min_similarity
+        }
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def keyword_centroids(mapping, encode_batch):
+    """Centroid per category: normalized mean embedding of its keywords (no labelled data needed)."""
+    centroids = {}
+    for category, keywords in mapping.items():
+        vectors = _normalize(np.asarray(encode_batch(list(keywords)), dtype=np.float32))
+        centroids[category] = vectors.mean(axis=0)
+    return centroids
+
+
+_lock = threading.Lock()
+_active = Categorizer(CATEGORY_MAPPING)
+
+
+def get_categorizer():
+    return _active
+
+
+def configure(mapping=None, centroid_fallback=False, encode_batch=None, min_similarity=DEFAULT_MIN_SIMILARITY):
+    """
+    Replace the active categorizer (takes effect for every following write). With `centroid_fallback`
+    the keyword centroids are encoded with `encode_batch`.
+    """
+    global _active
+    mapping = mapping or CATEGORY_MAPPING
+    for category, keywords in mapping.items():
+        if (not isinstance(category, str) or not category.strip() or not isinstance(keywords, list) or not keywords
+                or any(not isinstance(keyword, str) or not keyword.strip() for keyword in keywords)):
+            raise ValueError(f"Category {category!r} needs a non-empty list of non-empty keyword strings")
+    centroids = keyword_centroids(mapping, encode_batch) if centroid_fallback else None
+    categorizer = Categorizer(mapping, centroids, min_similarity)
+    with _lock:
+        _active = categorizer
+    return categorizer
+
+
+def categorize(description, embedding=None):
+    """Category of an incident description with the active categorizer, or None when nothing matches."""
+    return _active.categorize(description, embedding)
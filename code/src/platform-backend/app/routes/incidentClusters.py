@@ -0,0 +1,214 @@
+"""
+Offline near-duplicate clustering of incident embeddings.
+
+Every stored embedding is loaded into one contiguous float32 matrix of unit vectors. Cosine similarities
+are computed block by block (memory bounded by block_size^2 floats) and every pair at or above the
+threshold is joined with union-find, so clusters are the connected components of the "near-duplicate"
+graph. Each document gets a `clusterId`; singletons get one too, which marks them as already clustered.
+
+Cluster ids are the smallest sysId of the component on a full run. Incremental runs only compare the
+documents without a clusterId against every document (existing clusters are kept as they are). New
+documents join the cluster they connect to. If a new document bridges several existing clusters, they
+are merged under the smallest of their ids.
+"""
+import time
+
+import numpy as np
+from elasticsearch import helpers
+
+from app.routes.incidentIngest import bulk_write, fetch_stored_sources
+from app.routes.indexLayout import (EMBEDDING_DIMS, embedding_fetch_options, fetch_embeddings, hit_embedding,
+                                    is_quantized)
+
+# Cosine similarity from which two incidents count as near-duplicates
+DEFAULT_THRESHOLD = 0.95
+
+# Rows per similarity block; one block of similarities takes block_size^2 * 4 bytes
+DEFAULT_BLOCK_SIZE = 2048
+
+
+class UnionFind:
+    """Disjoint sets over 0..size-1 with union by size and path halving."""
+
+    def __init__(self, size):
+        self.parent = np.arange(size, dtype=np.int64)
+        self.size = np.ones(size, dtype=np.int64)
+
+    def find(self, node):
+        parent = self.parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+    def roots(self):
+        return np.array([self.find(node) for node in range(len(self.parent))], dtype=np.int64)
+
+
+def load_embeddings(es, index_name, layout="float", batch_size=1000):
+    """
+    Scroll every document with a vector. Returns (ids, matrix, cluster_ids): matrix is a contiguous
+    float32 array of unit vectors in the order of `ids`; cluster_ids holds the stored clusterId or None.
+    """
+    query = {"query": {"exists": {"field": "embedding"}}, **embedding_fetch_options(layout)}
+    query["_source"] = ["clusterId"] if is_quantized(layout) else ["clusterId", "embedding"]
+
+    ids, cluster_ids, blocks, rows = [], [], [], []
+    for hit in helpers.scan(es, index=index_name, query=query, size=batch_size):
+        embedding = hit_embedding(hit)
+        if embedding is None:
+            continue
+        ids.append(hit["_id"])
+        cluster_ids.append(hit["_source"].get("clusterId"))
+        rows.append(embedding)
+        if len(rows) == batch_size:
+            blocks.append(np.asarray(rows, dtype=np.float32))
+            rows = []
+    if rows:
+        blocks.append(np.asarray(rows, dtype=np.float32))
+
+    matrix = np.vstack(blocks) if blocks else np.empty((0, EMBEDDING_DIMS), dtype=np.float32)
+    del blocks
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1.0, norms)
+    return ids, np.ascontiguousarray(matrix), cluster_ids
+
+
+def similar_pairs(matrix, threshold, block_size=DEFAULT_BLOCK_SIZE, start=0):
+    """
+    Yield (rows, cols) index arrays of every pair with cosine similarity >= threshold and col < row,
+    for rows >= start. With start=0 this covers all pairs; with start=n only the rows from n on are
+    compared (with every earlier row and with each other).
+    """
+    count = len(matrix)
+    for row_start in range(start, count, block_size):
+        row_end = min(row_start + block_size, count)
+        block = matrix[row_start:row_end]
+        for col_start in range(0, row_end, block_size):
+            col_end = min(col_start + block_size, row_end)
+            rows, cols = np.nonzero(block @ matrix[col_start:col_end].T >= threshold)
+            rows += row_start
+            cols += col_start
+            keep = cols < rows
+            if keep.any():
+                yield rows[keep], cols[keep]
+
+
+def cluster_labels(ids, roots, stored_labels=None):
+    """
+    Label of every document: the smallest stored clusterId in its component (incremental runs), otherwise
+    the smallest sysId of the component.
+    """
+    best = {}
+    for index, root in enumerate(roots):
+        stored = stored_labels[index] if stored_labels else None
+        candidate = (0, stored) if stored else (1, ids[index])
+        if root not in best or candidate < best[root]:
+            best[root] = candidate
+    return [best[root][1] for root in roots]
+
+
+def cluster_embeddings(ids, matrix, threshold=DEFAULT_THRESHOLD, block_size=DEFAULT_BLOCK_SIZE,
+                       stored_labels=None):
+    """
+    Cluster labels of the loaded embeddings plus the number of pairs found. With `stored_labels`
+    (incremental) documents that already have a clusterId are kept together and only the others are compared.
+    """
+    union_find = UnionFind(len(ids))
+    start = 0
+    if stored_labels is not None:
+        # Existing documents come first (see order_for_incremental); pre-join the members of each cluster
+        first_member = {}
+        for index, label in enumerate(stored_labels):
+            if label is None:
+                break
+            if label in first_member:
+                union_find.union(first_member[label], index)
+            else:
+                first_member[label] = index
+            start = index + 1
+
+    pairs = 0
+    for rows, cols in similar_pairs(matrix, threshold, block_size, start):
+        pairs += len(rows)
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            union_find.union(row, col)
+    return cluster_labels(ids, union_find.roots(), stored_labels), pairs
+
+
+def order_for_incremental(ids, matrix, cluster_ids):
+    """Put the already clustered documents first, as cluster_embeddings expects for incremental runs."""
+    order = sorted(range(len(ids)), key=lambda index: cluster_ids[index] is None)
+    return [ids[i] for i in order], np.ascontiguousarray(matrix[order]), [cluster_ids[i] for i in order]
+
+
+def write_cluster_ids(es, index_name, updates, layout="float", batch_size=500):
+    """
+    Store {sysId: clusterId}. Float layouts get partial updates; quantized layouts keep the vector out of
+    _source, so those documents are rewritten with their stored source and vector.
+    Returns (updated, errors, failed_ids).
+    """
+    def actions():
+        items = list(updates.items())
+        for offset in range(0, len(items), batch_size):
+            batch = items[offset:offset + batch_size]
+            if not is_quantized(layout):
+                for doc_id, label in batch:
+                    yield {"_op_type": "update", "_index": index_name, "_id": doc_id, "doc": {"clusterId": label}}
+                continue
+            ids = [doc_id for doc_id, _ in batch]
+            sources = fetch_stored_sources(es, index_name, ids)
+            vectors = fetch_embeddings(es, index_name, ids, layout)
+            for doc_id, label in batch:
+                if doc_id in sources and vectors.get(doc_id) is not None:
+                    yield {"_index": index_name, "_id": doc_id,
+                           "_source": {**sources[doc_id], "clusterId": label, "embedding": vectors[doc_id]}}
+
+    return bulk_write(es, actions(), batch_size)
+
+
+def cluster_incidents(es, index_name, layout="float", threshold=DEFAULT_THRESHOLD, block_size=DEFAULT_BLOCK_SIZE,
+                      incremental=False, batch_size=1000):
+    """Run the clustering job end to end. Returns a report with counts and per-phase wall times."""
+    started = time.perf_counter()
+    ids, matrix, cluster_ids = load_embeddings(es, index_name, layout, batch_size)
+    loaded = time.perf_counter()
+
+    stored_labels = None
+    if incremental:
+        ids, matrix, cluster_ids = order_for_incremental(ids, matrix, cluster_ids)
+        stored_labels = cluster_ids
+    labels, pairs = cluster_embeddings(ids, matrix, threshold, block_size, stored_labels)
+    clustered = time.perf_counter()
+
+    updates = {doc_id: label for doc_id, label, stored in zip(ids, labels, cluster_ids) if label != stored}
+    updated, errors, failed_ids = write_cluster_ids(es, index_name, updates, layout)
+    written = time.perf_counter()
+
+    sizes = np.unique(np.asarray(labels, dtype=object), return_counts=True)[1] if labels else np.empty(0)
+    return {
+        "documents": len(ids),
+        "newDocuments": sum(1 for label in cluster_ids if label is None),
+        "matrixBytes": int(matrix.nbytes),
+        "pairs": pairs,
+        "clusters": int((sizes > 1).sum()),
+        "clusteredDocuments": int(sizes[sizes > 1].sum()),
+        "largestCluster": int(sizes.max()) if len(sizes) else 0,
+        "updated": updated,
+        "failed": len(failed_ids),
+        "errors": errors,
+        "loadSeconds": round(loaded - started, 3),
+        "clusterSeconds": round(clustered - loaded, 3),
+        "writeSeconds": round(written - clustered, 3),
+        "wallSeconds": round(written - started, 3)
+    }
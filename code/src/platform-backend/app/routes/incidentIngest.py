@@ -0,0 +1,416 @@
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+from elasticsearch import helpers
+
+from app.routes.embeddingCache import normalize_text
+from app.routes.incidentCategories import categorize, get_categorizer
+from app.routes.indexLayout import embedding_fetch_options, fetch_embeddings, hit_embedding, is_quantized
+
+# Columns every incident CSV must provide
+REQUIRED_COLUMNS = ["sysId", "IncidentId", "title", "description", "rootCause", "createdDate", "priority", "status",
+                    "closedDate"]
+
+# Date formats accepted for createdDate / closedDate (same as convert_to_iso_date)
+DATE_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"]
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Maximum number of row errors kept per chunk in the ingestion report
+MAX_ERRORS_PER_CHUNK = 20
+
+# Fields whose text is fingerprinted for change detection (a change means the incident is re-embedded)
+FINGERPRINT_FIELDS = ["title", "description", "rootCause"]
+
+# Fields updated in place when only metadata changed
+METADATA_FIELDS = ["IncidentId", "createdDate", "priority", "status", "closedDate"]
+
+# Bump when the rules of derive_incident_fields change so the backfill recomputes every document
+# (2: resolutionHours is stored unrounded, so its average matches the one computed from the dates)
+DERIVED_FIELDS_VERSION = 2
+
+
+def build_incident_text(title, description, root_cause, priority, status):
+    """Text that is embedded for an incident (kept identical to the original per-row format)."""
+    return (f"Title: {title}. Description: {description}. Root Cause: {root_cause}. "
+            f"Priority: {priority}. Status: {status}.")
+
+
+def _clean(value):
+    """Convert pandas missing values (NaN/NA) to None so they serialize as JSON null."""
+    return None if pd.isna(value) else value
+
+
+def content_fingerprint(title, description, root_cause):
+    """Fingerprint of the embedded text fields, stored as contentHash for incremental re-indexing."""
+    parts = ["" if _clean(value) is None else normalize_text(value) for value in (title, description, root_cause)]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _parse_iso(value):
+    try:
+        return datetime.strptime(value, ISO_FORMAT) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def derive_incident_fields(description, created_date_iso, closed_date_iso, embedding=None, category=None):
+    """
+    Analytics fields computed once at write time: keyword category, resolution time and the
+    month/weekday of creation. Resolution days follow the dashboard rule (whole days, at least 1).
+    `embedding` enables the categorizer's centroid fallback; a precomputed `category` skips categorization.
+    """
+    created = _parse_iso(created_date_iso)
+    closed = _parse_iso(closed_date_iso)
+    resolution_seconds = (closed - created).total_seconds() if created and closed else None
+    return {
+        "category": category or categorize(_clean(description), embedding),
+        "resolutionHours": resolution_seconds / 3600 if resolution_seconds is not None else None,
+        "resolutionDays": max((closed - created).days, 1) if resolution_seconds is not None else None,
+        "createdMonth": created.strftime("%Y-%m") if created else None,
+        "createdWeekday": created.strftime("%A") if created else None,
+        "derivedVersion": DERIVED_FIELDS_VERSION
+    }
+
+
+def build_incident_document(row, created_date_iso, closed_date_iso, embedding, category=None):
+    """Build the Elasticsearch document for one incident row."""
+    return {
+        "sysId": _clean(row["sysId"]),
+        "IncidentId": _clean(row["IncidentId"]),
+        "title": _clean(row["title"]),
+        "description": _clean(row["description"]),
+        "rootCause": _clean(row["rootCause"]),
+        "createdDate": created_date_iso,
+        "priority": _clean(row["priority"]),
+        "status": _clean(row["status"]),
+        "closedDate": closed_date_iso,  # Only included if status is 'Resolved' or 'Closed'
+        "contentHash": content_fingerprint(row["title"], row["description"], row["rootCause"]),
+        **derive_incident_fields(row["description"], created_date_iso, closed_date_iso, embedding, category),
+        "embedding": embedding
+    }
+
+
+def convert_dates_to_iso(series):
+    """
+    Vectorized version of convert_to_iso_date for a whole column.
+    Returns a Series of ISO 8601 strings, with None for missing or unparsable values.
+    """
+    values = series.astype("object").where(series.notna(), None)
+    parsed = pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]")
+    for fmt in DATE_FORMATS:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(values[missing], format=fmt, errors="coerce")
+    iso = parsed.dt.strftime(ISO_FORMAT)
+    return iso.astype("object").where(parsed.notna(), None)
+
+
+def read_incident_chunks(file_path, chunk_size):
+    """Stream the CSV in chunks of `chunk_size` rows, validating the header on the first chunk."""
+    reader = pd.read_csv(file_path, chunksize=chunk_size, dtype=str)
+    with reader:
+        for chunk_number, chunk in enumerate(reader):
+            if chunk_number == 0:
+                missing = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+                if missing:
+                    raise ValueError(f"CSV file must contain the following columns: {REQUIRED_COLUMNS}")
+            yield chunk_number, chunk
+
+
+def prepare_chunk(chunk, first_row_number=0):
+    """
+    Convert the dates of a chunk in one pass and split it into valid rows and row errors.
+    Returns (records, created_dates, closed_dates, errors, invalid_count), where records are plain dicts.
+    """
+    created_iso = convert_dates_to_iso(chunk["createdDate"])
+    closed_iso = convert_dates_to_iso(chunk["closedDate"])
+
+    bad_created = created_iso.isna()
+    bad_closed = chunk["closedDate"].notna() & closed_iso.isna()
+    invalid = bad_created | bad_closed
+
+    errors = []
+    for position in invalid.to_numpy().nonzero()[0][:MAX_ERRORS_PER_CHUNK]:
+        row = chunk.iloc[position]
+        column = "createdDate" if bad_created.iloc[position] else "closedDate"
+        errors.append({
+            "row": first_row_number + int(position),
+            "sysId": _clean(row["sysId"]),
+            "error": f"Invalid {column}: {row[column]}. Expected format: 'YYYY-MM-DD HH:MM:SS' or "
+                     f"'YYYY-MM-DDTHH:MM:SS'."
+        })
+
+    valid = ~invalid
+    records = chunk[valid].to_dict("records")
+    return records, created_iso[valid].tolist(), closed_iso[valid].tolist(), errors, int(invalid.sum())
+
+
+def build_chunk_documents(records, created_dates, closed_dates, encode_batch):
+    """Encode all incident texts of a chunk in a single batch and build their documents."""
+    texts = [
+        build_incident_text(r["title"], r["description"], r["rootCause"], r["priority"], r["status"])
+        for r in records
+    ]
+    embeddings = encode_batch(texts) if texts else []
+    # One categorizer pass for the whole chunk (the centroid fallback is a single matrix product)
+    categories = get_categorizer().categorize_many([_clean(r["description"]) for r in records], embeddings)
+    return [
+        build_incident_document(record, created, closed, [float(x) for x in embedding], category)
+        for record, created, closed, embedding, category in zip(records, created_dates, closed_dates, embeddings,
+                                                                 categories)
+    ]
+
+
+def bulk_write(es, actions, chunk_size=500):
+    """Send index/update actions through the bulk helper. Returns (ok_count, errors, failed_ids)."""
+    succeeded = 0
+    errors = []
+    failed_ids = set()
+    for ok, item in helpers.streaming_bulk(es, actions, chunk_size=chunk_size, raise_on_error=False,
+                                           raise_on_exception=False):
+        if ok:
+            succeeded += 1
+            continue
+        result = next(iter(item.values())) if item else {}
+        failed_ids.add(result.get("_id"))
+        if len(errors) < MAX_ERRORS_PER_CHUNK:
+            errors.append({"sysId": result.get("_id"), "error": str(result.get("error"))})
+    return succeeded, errors, failed_ids
+
+
+def bulk_index_documents(es, index_name, docs, chunk_size=500):
+    """Send documents through the bulk helper. Returns (indexed_count, errors, failed_ids)."""
+    actions = ({"_index": index_name, "_id": doc["sysId"], "_source": doc} for doc in docs)
+    return bulk_write(es, actions, chunk_size)
+
+
+def _same(stored, new):
+    stored, new = _clean(stored), _clean(new)
+    if stored is None or new is None:
+        return stored is None and new is None
+    return str(stored) == str(new)
+
+
+def fetch_stored_sources(es, index_name, ids):
+    """Stored version (real-time, without embedding) of the given documents as {id: source}."""
+    ids = [str(doc_id) for doc_id in ids if doc_id is not None]
+    if not ids:
+        return {}
+    response = es.mget(index=index_name, ids=ids, _source_excludes=["embedding"])
+    return {doc["_id"]: doc["_source"] for doc in response["docs"] if doc.get("found")}
+
+
+def classify_records(es, index_name, records, created_dates, closed_dates):
+    """
+    Compare a chunk against what is stored (one real-time mget).
+    Returns {"reembed": [...], "metadata": [...], "skip": [...]} lists of (position, stored_source, changes);
+    records that do not exist yet are re-embedded with a None stored_source.
+    """
+    ids = [_clean(record["sysId"]) for record in records]
+    stored_by_id = fetch_stored_sources(es, index_name, ids)
+
+    result = {"reembed": [], "metadata": [], "skip": []}
+    for position, record in enumerate(records):
+        stored = stored_by_id.get(str(ids[position]))
+        if stored is None:
+            result["reembed"].append((position, None, None))
+            continue
+
+        stored_hash = stored.get("contentHash") or content_fingerprint(
+            stored.get("title"), stored.get("description"), stored.get("rootCause"))
+        if stored_hash != content_fingerprint(record["title"], record["description"], record["rootCause"]):
+            result["reembed"].append((position, stored, None))
+            continue
+
+        new_values = {**{field: _clean(record[field]) for field in METADATA_FIELDS},
+                      "createdDate": created_dates[position], "closedDate": closed_dates[position]}
+        changes = {field: value for field, value in new_values.items() if not _same(stored.get(field), value)}
+        if "contentHash" not in stored:
+            changes["contentHash"] = stored_hash
+        if changes:
+            # Text is unchanged, so is its category (which may come from the embedding fallback)
+            changes.update(derive_incident_fields(record["description"], created_dates[position],
+                                                  closed_dates[position], category=stored.get("category")))
+        result["metadata" if changes else "skip"].append((position, stored, changes))
+    return result
+
+
+def incremental_index_chunk(es, index_name, records, created_dates, closed_dates, encode_batch, layout="float",
+                            chunk_size=500):
+    """
+    Incremental write of one chunk: re-embed documents whose text changed (or are new), partially update
+    documents where only metadata changed, and skip identical ones.
+    Returns (counts, errors, written_docs, metadata_updates, changes) where changes pairs the stored
+    source of every written document (None when new) with its new source. Counts only cover the writes
+    the bulk response acknowledged; rejected ones are counted in bulkFailed.
+    """
+    classified = classify_records(es, index_name, records, created_dates, closed_dates)
+
+    reembed_positions = [position for position, _, _ in classified["reembed"]]
+    previous = {str(_clean(records[position]["sysId"])): stored for position, stored, _ in classified["reembed"]}
+    docs = build_chunk_documents([records[p] for p in reembed_positions],
+                                 [created_dates[p] for p in reembed_positions],
+                                 [closed_dates[p] for p in reembed_positions], encode_batch)
+    actions = [{"_index": index_name, "_id": doc["sysId"], "_source": doc} for doc in docs]
+
+    updates = [(str(_clean(records[position]["sysId"])), stored, changes)
+               for position, stored, changes in classified["metadata"]]
+    if is_quantized(layout):
+        # Vectors are not in _source, so a partial update would drop them: rewrite with the stored vector
+        vectors = fetch_embeddings(es, index_name, [doc_id for doc_id, _, _ in updates], layout)
+        actions += [{"_index": index_name, "_id": doc_id,
+                     "_source": {**stored, **changes, "embedding": vectors.get(doc_id)}}
+                    for doc_id, stored, changes in updates]
+    else:
+        actions += [{"_op_type": "update", "_index": index_name, "_id": doc_id, "doc": changes}
+                    for doc_id, _, changes in updates]
+
+    _, errors, failed_ids = bulk_write(es, actions, chunk_size)
+    written = [doc for doc in docs if doc["sysId"] not in failed_ids]
+    metadata_updates = [(doc_id, changes) for doc_id, _, changes in updates if doc_id not in failed_ids]
+    changes = [(previous.get(str(doc["sysId"])), doc) for doc in written]
+    changes += [(stored, {**stored, **fields}) for doc_id, stored, fields in updates if doc_id not in failed_ids]
+    created = sum(1 for doc in written if previous.get(str(doc["sysId"])) is None)
+    counts = {
+        "created": created,
+        "reembedded": len(written) - created,
+        "metadataUpdated": len(metadata_updates),
+        "skipped": len(classified["skip"]),
+        "bulkFailed": len(failed_ids)
+    }
+    return counts, errors, written, metadata_updates, changes
+
+
+def outdated_derived_fields_query():
+    """Documents without the current derived fields (written before them or under an older version)."""
+    return {"bool": {"must_not": [{"term": {"derivedVersion": DERIVED_FIELDS_VERSION}}]}}
+
+
+def backfill_derived_fields(es, index_name, layout="float", batch_size=500, force=False):
+    """
+    Add or refresh the derived analytics fields on documents written before they existed (or with an
+    older DERIVED_FIELDS_VERSION). With `force` every document is recomputed, e.g. after the category
+    configuration changed. Float layouts get partial updates; quantized layouts keep the vector out of
+    _source, so their documents are rewritten with the stored vector.
+    Returns {"updated", "failed", "errors"}.
+    """
+    quantized = is_quantized(layout)
+    # Vectors are needed to rewrite quantized documents and for the categorizer's centroid fallback
+    with_vectors = quantized or get_categorizer().centroids is not None
+    query = {
+        "query": {"match_all": {}} if force else outdated_derived_fields_query(),
+        **(embedding_fetch_options(layout) if with_vectors else {})
+    }
+    if not with_vectors or quantized:
+        query["_source"] = {"excludes": ["embedding"]}
+
+    def actions():
+        for hit in helpers.scan(es, index=index_name, query=query, size=batch_size):
+            source = dict(hit["_source"])
+            embedding = hit_embedding(hit) if with_vectors else None
+            source.pop("embedding", None)
+            derived = derive_incident_fields(source.get("description"), source.get("createdDate"),
+                                             source.get("closedDate"), embedding)
+            if quantized:
+                yield {"_index": index_name, "_id": hit["_id"],
+                       "_source": {**source, **derived, "embedding": embedding}}
+            else:
+                yield {"_op_type": "update", "_index": index_name, "_id": hit["_id"], "doc": derived}
+
+    updated, errors, failed_ids = bulk_write(es, actions(), batch_size)
+    return {"updated": updated, "failed": len(failed_ids), "errors": errors}
+
+
+# Loads currently running per index, and the refresh interval the last of them restores
+_relaxed_loads = {}
+_relaxed_lock = threading.Lock()
+
+
+@contextmanager
+def relaxed_refresh(es, index_name):
+    """
+    Disable periodic refresh while loading, then restore the previous interval and refresh once.
+    Overlapping loads are reference-counted: the first one disables refresh and the last one restores it.
+    A captured "-1" (left behind by a crashed load) is never restored; the index default (None) is used instead.
+    """
+    with _relaxed_lock:
+        count, previous = _relaxed_loads.get(index_name, (0, None))
+        if count == 0:
+            settings = es.indices.get_settings(index=index_name, name="index.refresh_interval")
+            previous = settings.get(index_name, {}).get("settings", {}).get("index", {}).get("refresh_interval")
+            if previous == "-1":
+                previous = None
+            es.indices.put_settings(index=index_name, settings={"index": {"refresh_interval": "-1"}})
+        _relaxed_loads[index_name] = (count + 1, previous)
+    try:
+        yield
+    finally:
+        with _relaxed_lock:
+            count, previous = _relaxed_loads.pop(index_name)
+            if count > 1:
+                _relaxed_loads[index_name] = (count - 1, previous)
+            else:
+                es.indices.put_settings(index=index_name, settings={"index": {"refresh_interval": previous}})
+        es.indices.refresh(index=index_name)
+
+
+def stream_index_incidents(es, index_name, file_path, encode_batch, chunk_size=500, on_indexed=None,
+                           incremental=False, layout="float", on_metadata_updated=None, on_changed=None):
+    """
+    Streaming ingestion: read the CSV chunk by chunk, encode each chunk in one batch and bulk index it.
+    Bad rows are reported per chunk instead of aborting the whole load.
+    `on_indexed(docs)` is called with the successfully indexed documents of every chunk.
+
+    With `incremental=True` only new or changed incidents are re-embedded; metadata-only changes are
+    partial updates (`on_metadata_updated([(id, changes)])`) and identical documents are skipped.
+    Note that the embedded text also contains priority and status, which are treated as metadata here.
+
+    `on_changed([(previous_source, new_source)])` receives every written document with the version it
+    replaced (None when new), e.g. to maintain the daily rollup.
+    """
+    report = {"chunks": [], "totalRows": 0, "indexed": 0, "failed": 0}
+    if incremental:
+        report.update({"created": 0, "reembedded": 0, "metadataUpdated": 0, "skipped": 0})
+
+    with relaxed_refresh(es, index_name):
+        for chunk_number, chunk in read_incident_chunks(file_path, chunk_size):
+            first_row = report["totalRows"]
+            records, created, closed, errors, invalid_count = prepare_chunk(chunk, first_row)
+            chunk_report = {"chunk": chunk_number, "firstRow": first_row, "rows": len(chunk)}
+
+            if incremental:
+                counts, bulk_errors, written, updates, changes = incremental_index_chunk(
+                    es, index_name, records, created, closed, encode_batch, layout, chunk_size)
+                indexed = len(written) + len(updates) + counts["skipped"]
+                failed = invalid_count + counts.pop("bulkFailed")
+                chunk_report.update(counts)
+                for key, value in counts.items():
+                    report[key] += value
+                if on_metadata_updated is not None and updates:
+                    on_metadata_updated(updates)
+            else:
+                written = build_chunk_documents(records, created, closed, encode_batch)
+                previous = fetch_stored_sources(es, index_name, [doc["sysId"] for doc in written]) \
+                    if on_changed is not None else {}
+                indexed, bulk_errors, failed_ids = bulk_index_documents(es, index_name, written, chunk_size)
+                written = [doc for doc in written if doc["sysId"] not in failed_ids]
+                failed = invalid_count + len(failed_ids)
+                changes = [(previous.get(str(doc["sysId"])), doc) for doc in written]
+
+            if on_indexed is not None:
+                on_indexed(written)
+            if on_changed is not None and changes:
+                on_changed(changes)
+
+            chunk_report.update({"indexed": indexed, "failed": failed,
+                                 "errors": (errors + bulk_errors)[:MAX_ERRORS_PER_CHUNK]})
+            report["chunks"].append(chunk_report)
+            report["totalRows"] += len(chunk)
+            report["indexed"] += indexed
+            report["failed"] += failed
+
+    return report
@@ -0,0 +1,142 @@
+# Exact incident lookups: IncidentId through its keyword subfield, sysId through the document id.
+# Documents written before the keyword subfield existed are found by the legacy match on IncidentId until
+# /id_keywords/backfill has run.
+from elasticsearch import helpers
+
+from app.routes.incidentIngest import MAX_ERRORS_PER_CHUNK, bulk_write
+from app.routes.indexLayout import ID_FIELDS, embedding_fetch_options, hit_embedding, is_quantized
+
+# Fields returned by the incident detail lookups
+INCIDENT_DETAIL_FIELDS = ["sysId", "IncidentId", "createdDate", "priority", "status", "title", "description",
+                          "rootCause", "closedDate"]
+
+# Upper bound of ids resolved by one batch lookup
+MAX_LOOKUP_IDS = 1000
+
+
+def unique_ids(ids):
+    """Drop empty and repeated ids, keeping the request order."""
+    return list(dict.fromkeys(str(i) for i in ids if i))
+
+
+def build_incident_id_query(incident_ids, fields=INCIDENT_DETAIL_FIELDS):
+    """
+    Term lookup of incidents by IncidentId. Should an IncidentId be stored under several sysIds, the
+    collapse keeps only the most recently created one, so `size` is exactly the number of ids.
+    """
+    incident_ids = unique_ids(incident_ids)
+    return {
+        "size": len(incident_ids),
+        "query": {"bool": {"filter": [{"terms": {"IncidentId.keyword": incident_ids}}]}},
+        "collapse": {"field": "IncidentId.keyword"},
+        "sort": [{"createdDate": {"order": "desc", "missing": "_last"}}],
+        "_source": fields,
+        "track_total_hits": False
+    }
+
+
+def _legacy_incident_id_clause(incident_id):
+    # Analyzed match on IncidentId restricted to documents without the keyword subfield; callers keep
+    # only hits whose IncidentId is exactly the requested one
+    return {"bool": {"filter": [{"match": {"IncidentId": {"query": incident_id, "operator": "and"}}}],
+                     "must_not": [{"exists": {"field": "IncidentId.keyword"}}]}}
+
+
+# Hits fetched per id by the legacy lookup (the match may also hit ids sharing its tokens)
+LEGACY_HITS_PER_ID = 10
+
+
+def build_legacy_incident_id_query(incident_ids, fields=INCIDENT_DETAIL_FIELDS):
+    """
+    Fallback of build_incident_id_query for documents indexed before the keyword subfield: the original
+    match query on IncidentId. Use by_incident_id on the hits to keep exact matches only.
+    """
+    incident_ids = unique_ids(incident_ids)
+    return {
+        "size": len(incident_ids) * LEGACY_HITS_PER_ID,
+        "query": {"bool": {"should": [_legacy_incident_id_clause(i) for i in incident_ids],
+                           "minimum_should_match": 1}},
+        "sort": [{"createdDate": {"order": "desc", "missing": "_last"}}],
+        "_source": fields,
+        "track_total_hits": False
+    }
+
+
+def build_source_lookup(incident_id=None, sys_id=None, layout="float", legacy=False):
+    """
+    Fetch one incident with its stored embedding (from _source or, in quantized layouts, script_fields),
+    by sysId (document id) or by exact IncidentId; `legacy` matches IncidentId on documents indexed
+    before the keyword subfield (check the hit's IncidentId with exact_hits).
+    """
+    if sys_id:
+        key = {"ids": {"values": [sys_id]}}
+    elif legacy:
+        key = _legacy_incident_id_clause(incident_id)
+    else:
+        key = {"term": {"IncidentId.keyword": incident_id}}
+    fields = ["sysId", "IncidentId", "title"]
+    return {
+        "size": LEGACY_HITS_PER_ID if legacy and not sys_id else 1,
+        "query": {"bool": {"filter": [key]}},
+        "sort": [{"createdDate": {"order": "desc", "missing": "_last"}}],
+        "_source": fields if is_quantized(layout) else fields + ["embedding"],
+        **embedding_fetch_options(layout)
+    }
+
+
+def exact_hits(hits, incident_id):
+    """Hits whose IncidentId is exactly `incident_id` (legacy match lookups also return near misses)."""
+    return [hit for hit in hits if hit["_source"].get("IncidentId") == incident_id]
+
+
+def by_incident_id(hits, incident_ids):
+    """{IncidentId: _source or None} in request order; with several hits per id the first one wins."""
+    found = {}
+    for hit in hits:
+        found.setdefault(hit["_source"].get("IncidentId"), hit["_source"])
+    return {incident_id: found.get(incident_id) for incident_id in unique_ids(incident_ids)}
+
+
+def by_document_id(docs):
+    """{sysId: _source or None} from an mget response's docs (already in request order)."""
+    return {doc["_id"]: doc["_source"] if doc.get("found") else None for doc in docs}
+
+
+def _missing_keyword_query():
+    # Documents holding an id field whose keyword subfield was never indexed (written before the mapping change)
+    return {"bool": {"should": [
+        {"bool": {"filter": [{"exists": {"field": field}}],
+                  "must_not": [{"exists": {"field": f"{field}.keyword"}}]}}
+        for field in ID_FIELDS
+    ], "minimum_should_match": 1}}
+
+
+def backfill_id_keywords(es, index_name, layout="float", batch_size=500):
+    """
+    Reindex in place every document written before the keyword subfields existed, so term lookups find it.
+    Documents are rewritten unchanged, with _update_by_query inside Elasticsearch when _source holds the
+    whole document; quantized layouts keep the vector out of _source, so it is read back from the index
+    and written with them. Returns {"updated", "failed", "errors"}.
+    """
+    quantized = is_quantized(layout)
+    if not quantized:
+        response = es.update_by_query(index=index_name, query=_missing_keyword_query(), conflicts="proceed",
+                                      scroll_size=batch_size, refresh=True)
+        failures = response.get("failures", [])
+        errors = [{"sysId": failure.get("id"), "error": str(failure.get("cause"))}
+                  for failure in failures[:MAX_ERRORS_PER_CHUNK]]
+        return {"updated": response["updated"], "failed": len(failures), "errors": errors}
+
+    # script_fields alone would return no _source: ask for it explicitly
+    query = {"query": _missing_keyword_query(), "_source": True, **embedding_fetch_options(layout)}
+
+    def actions():
+        for hit in helpers.scan(es, index=index_name, query=query, size=batch_size):
+            source = dict(hit["_source"])
+            embedding = hit_embedding(hit) if quantized else None
+            if embedding is not None:
+                source["embedding"] = embedding
+            yield {"_index": index_name, "_id": hit["_id"], "_source": source}
+
+    updated, errors, failed_ids = bulk_write(es, actions(), batch_size)
+    return {"updated": updated, "failed": len(failed_ids), "errors": errors}
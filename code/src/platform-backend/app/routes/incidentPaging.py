@@ -0,0 +1,96 @@
+# Point-in-time + search_after paging over incidents_final (cursor pages and full streaming exports)
+import base64
+import json
+
+# How long Elasticsearch keeps a point in time alive between two page requests
+PIT_KEEP_ALIVE = "2m"
+
+# Newest first; _shard_doc is the PIT tiebreaker that makes the order total and stable
+INCIDENT_SORT = [
+    {"createdDate": {"order": "desc", "missing": "_last"}},
+    {"_shard_doc": "desc"}
+]
+
+
+class CursorError(ValueError):
+    """Raised for malformed cursors."""
+
+
+def encode_cursor(pit_id, search_after):
+    payload = json.dumps({"pit": pit_id, "after": search_after}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return payload["pit"], payload["after"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise CursorError(f"Invalid cursor: {e}")
+
+
+def open_pit(es, index_name):
+    return es.open_point_in_time(index=index_name, keep_alive=PIT_KEEP_ALIVE)["id"]
+
+
+def close_pit(es, pit_id):
+    try:
+        es.close_point_in_time(id=pit_id)
+    except Exception as e:
+        # The PIT expires on its own; closing early only frees resources sooner
+        print(f"Could not close point in time: {e}")
+
+
+def _search_page(es, pit_id, page_size, search_after, source_fields, query=None):
+    body = {
+        "size": page_size,
+        "query": query or {"match_all": {}},
+        "_source": source_fields,
+        "sort": INCIDENT_SORT,
+        "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+        "track_total_hits": False
+    }
+    if search_after is not None:
+        body["search_after"] = search_after
+    response = es.search(body=body)
+    # Elasticsearch may hand back a new PIT id; always continue with the latest one
+    return response["hits"]["hits"], response.get("pit_id", pit_id)
+
+
+def search_page(es, index_name, page_size, source_fields, cursor=None, query=None):
+    """
+    One cursor page. Returns (hits, next_cursor); next_cursor is None on the last page, whose PIT is
+    closed. Without a cursor a new PIT is opened, so later pages see the index as of the first page.
+    """
+    if cursor:
+        pit_id, search_after = decode_cursor(cursor)
+    else:
+        pit_id, search_after = open_pit(es, index_name), None
+
+    hits, pit_id = _search_page(es, pit_id, page_size, search_after, source_fields, query)
+    if len(hits) < page_size:
+        close_pit(es, pit_id)
+        return hits, None
+    return hits, encode_cursor(pit_id, hits[-1]["sort"])
+
+
+def iter_pages(es, index_name, page_size, source_fields, query=None):
+    """Yield every page of hits with bounded memory; the PIT is closed even if the consumer stops early."""
+    pit_id = open_pit(es, index_name)
+    search_after = None
+    try:
+        while True:
+            hits, pit_id = _search_page(es, pit_id, page_size, search_after, source_fields, query)
+            if hits:
+                yield hits
+            if len(hits) < page_size:
+                return
+            search_after = hits[-1]["sort"]
+    finally:
+        close_pit(es, pit_id)
+
+
+def iter_hits(es, index_name, page_size, source_fields, query=None):
+    """Yield every hit, page by page (see iter_pages)."""
+    for hits in iter_pages(es, index_name, page_size, source_fields, query):
+        yield from hits
@@ -0,0 +1,348 @@
+"""
+Daily incident rollup.
+
+One row per (day, priority, status, category) holding the incident count and the sum/count of
+resolution hours. Rows are kept current incrementally from the write paths (every written document
+removes the contribution of its previous version and adds its own) and can be rebuilt from the
+incident index with a composite aggregation when they drift; rebuilds go to a new versioned index that
+the ROLLUP_INDEX alias is switched to.
+Incidents without a createdDate are not rolled up.
+"""
+from datetime import datetime, timezone
+
+from elasticsearch import helpers
+
+# Alias of the rollup: readers and upserts go through it, rebuilds switch it to a new versioned index
+ROLLUP_INDEX = "incidents_daily_rollup"
+
+# Keep-alive of the point in time a rebuild reads from
+PIT_KEEP_ALIVE = "5m"
+
+ROLLUP_MAPPING = {
+    "mappings": {
+        "properties": {
+            "day": {"type": "date", "format": "yyyy-MM-dd"},
+            "priority": {"type": "keyword"},
+            "status": {"type": "keyword"},
+            "category": {"type": "keyword"},
+            "count": {"type": "long"},
+            "resolutionHoursSum": {"type": "double"},
+            "resolutionCount": {"type": "long"}
+        }
+    }
+}
+
+# Scripted upsert adding a (possibly negative) delta to a row. Rows are created at zero and run through the
+# script too, so a row left with no incidents (or never created because its delta is negative) is not stored.
+_APPLY_DELTA = (
+    "ctx._source.count += params.count; "
+    "ctx._source.resolutionHoursSum += params.resolutionHoursSum; "
+    "ctx._source.resolutionCount += params.resolutionCount; "
+    "if (ctx._source.count <= 0) { ctx.op = ctx.op == 'create' ? 'none' : 'delete' }"
+)
+
+_MISSING = "Unknown"
+
+
+def _parse(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S") if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def contribution(source):
+    """(row key, values) one incident adds to the rollup, or None if it has no valid createdDate."""
+    created = _parse(source.get("createdDate"))
+    if created is None:
+        return None
+    closed = _parse(source.get("closedDate"))
+    # Stored values only, bucketed like rebuild_rollup's missing_bucket, so both paths address the same rows
+    key = (created.strftime("%Y-%m-%d"), source.get("priority") or _MISSING, source.get("status") or _MISSING,
+           source.get("category") or _MISSING)
+    return key, {
+        "count": 1,
+        "resolutionHoursSum": (closed - created).total_seconds() / 3600 if closed else 0.0,
+        "resolutionCount": 1 if closed else 0
+    }
+
+
+def rollup_deltas(changes):
+    """Sum the deltas of [(previous_source or None, new_source or None)] per rollup row."""
+    deltas = {}
+    for previous, current in changes:
+        for source, sign in ((previous, -1), (current, 1)):
+            item = contribution(source) if source else None
+            if item is None:
+                continue
+            key, values = item
+            row = deltas.setdefault(key, {"count": 0, "resolutionHoursSum": 0.0, "resolutionCount": 0})
+            for field, value in values.items():
+                row[field] += sign * value
+    return {key: row for key, row in deltas.items() if row["count"] or row["resolutionCount"]
+            or row["resolutionHoursSum"]}
+
+
+def row_id(key):
+    return "|".join(key)
+
+
+def versioned_index_name(rollup_index=ROLLUP_INDEX):
+    """Concrete index behind the `rollup_index` alias, e.g. incidents_daily_rollup-20231002080000123456."""
+    return f"{rollup_index}-{datetime.now(timezone.utc):%Y%m%d%H%M%S%f}"
+
+
+def rollup_indices(es, rollup_index=ROLLUP_INDEX):
+    """Concrete indices behind the rollup alias (or the rollup index itself when it predates the alias)."""
+    if not es.indices.exists(index=rollup_index):
+        return []
+    return list(es.indices.get(index=rollup_index))
+
+
+def ensure_rollup_index(es, rollup_index=ROLLUP_INDEX):
+    """Create a versioned rollup index behind the `rollup_index` alias unless the alias already resolves."""
+    if not es.indices.exists(index=rollup_index):
+        es.indices.create(index=versioned_index_name(rollup_index), body={**ROLLUP_MAPPING,
+                                                                          "aliases": {rollup_index: {}}})
+
+
+def delete_rollup_index(es, rollup_index=ROLLUP_INDEX):
+    """Delete the indices behind the rollup alias (the alias goes with them)."""
+    for concrete in rollup_indices(es, rollup_index):
+        es.indices.delete(index=concrete)
+
+
+def _delta_actions(deltas, rollup_index):
+    actions = []
+    for key, delta in deltas.items():
+        day, priority, status, category = key
+        actions.append({
+            "_op_type": "update",
+            "_index": rollup_index,
+            "_id": row_id(key),
+            "retry_on_conflict": 5,
+            "script": {"source": _APPLY_DELTA, "params": delta},
+            "scripted_upsert": True,
+            "upsert": {"day": day, "priority": priority, "status": status, "category": category,
+                       "count": 0, "resolutionHoursSum": 0.0, "resolutionCount": 0}
+        })
+    return actions
+
+
+def apply_rollup_changes(es, changes, rollup_index=ROLLUP_INDEX):
+    """Apply the rollup deltas of written documents with scripted upserts. Returns the number of rows touched."""
+    deltas = rollup_deltas(changes)
+    if not deltas:
+        return 0
+    actions = _delta_actions(deltas, rollup_index)
+    helpers.bulk(es, actions)
+    return len(actions)
+
+
+_ROW_FIELDS = ("day", "priority", "status", "category")
+_VALUE_FIELDS = ("count", "resolutionHoursSum", "resolutionCount")
+
+
+def _read_rows(es, indices, pit=None, page_size=1000):
+    """{row key: values} of every rollup row in `indices`, from the point in time `pit` when given."""
+    rows = {}
+    if not indices:
+        return rows
+    after = None
+    while True:
+        body = {"size": page_size, "sort": [{field: "asc"} for field in _ROW_FIELDS], "track_total_hits": False}
+        if after:
+            body["search_after"] = after
+        if pit:
+            body["pit"] = {"id": pit["id"], "keep_alive": PIT_KEEP_ALIVE}
+            body["query"] = {"terms": {"_index": indices}}
+            response = es.search(body=body)
+            pit["id"] = response.get("pit_id", pit["id"])
+        else:
+            response = es.search(index=indices, body=body)
+        hits = response["hits"]["hits"]
+        for hit in hits:
+            source = hit["_source"]
+            rows[tuple(source[field] for field in _ROW_FIELDS)] = {field: source[field] for field in _VALUE_FIELDS}
+        if len(hits) < page_size:
+            return rows
+        after = hits[-1]["sort"]
+
+
+def _row_differences(before, after):
+    """Per-row deltas turning the `before` rows into the `after` rows (rows that vanished count as zero)."""
+    zero = {field: 0 for field in _VALUE_FIELDS}
+    deltas = {}
+    for key in before.keys() | after.keys():
+        delta = {field: after.get(key, zero)[field] - before.get(key, zero)[field] for field in _VALUE_FIELDS}
+        if any(delta.values()):
+            deltas[key] = delta
+    return deltas
+
+
+def rebuild_rollup(es, index_name, rollup_index=ROLLUP_INDEX, page_size=1000):
+    """
+    Recompute every rollup row from the incident index (consistency repair). Returns the number of rows.
+
+    The rows are built into a new versioned index while the `rollup_index` alias keeps serving (and taking
+    upserts into) the current one, then the alias is switched in one atomic request and the old index is
+    deleted. The composite aggregation and a copy of the current rows are read from one point in time over
+    both indices, so upserts that reach the current index during the rebuild are replayed on the new one.
+    """
+    sources = [
+        {"day": {"date_histogram": {"field": "createdDate", "calendar_interval": "day", "format": "yyyy-MM-dd"}}},
+        {"priority": {"terms": {"field": "priority", "missing_bucket": True}}},
+        {"status": {"terms": {"field": "status", "missing_bucket": True}}},
+        {"category": {"terms": {"field": "category", "missing_bucket": True}}}
+    ]
+    resolution_hours = (
+        "(doc['closedDate'].value.toInstant().toEpochMilli() - "
+        "doc['createdDate'].value.toInstant().toEpochMilli()) / 3600000.0"
+    )
+    old_indices = rollup_indices(es, rollup_index)
+    new_index = versioned_index_name(rollup_index)
+
+    def rows(pit):
+        after = None
+        while True:
+            composite = {"size": page_size, "sources": sources}
+            if after:
+                composite["after"] = after
+            query = {"bool": {"filter": [{"exists": {"field": "createdDate"}}]}}
+            if old_indices:
+                query["bool"]["must_not"] = [{"terms": {"_index": old_indices}}]
+            body = {
+                "size": 0,
+                "query": query,
+                "pit": {"id": pit["id"], "keep_alive": PIT_KEEP_ALIVE},
+                "aggs": {"rows": {"composite": composite, "aggs": {
+                    "resolved": {
+                        "filter": {"exists": {"field": "closedDate"}},
+                        "aggs": {"hours": {"sum": {"script": {"source": resolution_hours}}}}
+                    }
+                }}}
+            }
+            response = es.search(body=body)
+            pit["id"] = response.get("pit_id", pit["id"])
+            result = response["aggregations"]["rows"]
+            for bucket in result["buckets"]:
+                key = tuple(bucket["key"][name] or _MISSING for name in _ROW_FIELDS)
+                yield {
+                    "_index": new_index,
+                    "_id": row_id(key),
+                    "_source": {"day": key[0], "priority": key[1], "status": key[2], "category": key[3],
+                                "count": bucket["doc_count"],
+                                "resolutionHoursSum": bucket["resolved"]["hours"]["value"],
+                                "resolutionCount": bucket["resolved"]["doc_count"]}
+                }
+            after = result.get("after_key")
+            if not after or not result["buckets"]:
+                return
+
+    es.indices.create(index=new_index, body=ROLLUP_MAPPING)
+    try:
+        es.indices.refresh(index=[index_name, *old_indices])
+        pit = {"id": es.open_point_in_time(index=[index_name, *old_indices], keep_alive=PIT_KEEP_ALIVE)["id"]}
+        try:
+            written, _ = helpers.bulk(es, rows(pit), refresh=True)
+            snapshot = _read_rows(es, old_indices, pit, page_size)
+        finally:
+            es.close_point_in_time(id=pit["id"])
+
+        # Upserts the current index took since the point in time
+        if old_indices:
+            es.indices.refresh(index=old_indices)
+        current = _read_rows(es, old_indices, page_size=page_size)
+        helpers.bulk(es, _delta_actions(_row_differences(snapshot, current), new_index), refresh=True)
+
+        # An index created before the alias existed holds the alias name itself: replace it in the same request
+        actions = [{"remove_index": {"index": old}} if old == rollup_index
+                   else {"remove": {"index": old, "alias": rollup_index}} for old in old_indices]
+        es.indices.update_aliases(actions=actions + [{"add": {"index": new_index, "alias": rollup_index}}])
+    except Exception:
+        es.indices.delete(index=new_index, ignore_unavailable=True)
+        raise
+
+    # Upserts that still reached the old index before the switch
+    old_indices = [old for old in old_indices if old != rollup_index]
+    if old_indices:
+        es.indices.refresh(index=old_indices)
+        late = _row_differences(current, _read_rows(es, old_indices, page_size=page_size))
+        helpers.bulk(es, _delta_actions(late, rollup_index))
+        es.indices.delete(index=old_indices)
+    return written
+
+
+def build_rollup_six_months_query(start_date, statuses):
+    """Rollup equivalent of the /latest_six_months_incidents aggregation."""
+    return {
+        "size": 0,
+        "query": {"range": {"day": {"gte": start_date, "lte": "now/M"}}},
+        "aggs": {
+            "monthly_statuses": {
+                "date_histogram": {"field": "day", "calendar_interval": "month", "format": "yyyy-MM"},
+                "aggs": {
+                    status: {"filter": {"term": {"status": status}}, "aggs": {"count": {"sum": {"field": "count"}}}}
+                    for status in statuses
+                }
+            }
+        }
+    }
+
+
+def build_rollup_seven_days_query():
+    """Rollup equivalent of the /latest_seven_days_incidents aggregation."""
+    return {
+        "size": 0,
+        "aggs": {
+            "total": {"sum": {"field": "count"}},
+            "lastWeek": {
+                "filter": {"range": {"day": {"gte": "now-7d/d", "lte": "now/d"}}},
+                "aggs": {"days": {"date_histogram": {"field": "day", "calendar_interval": "day",
+                                                     "format": "yyyy-MM-dd"},
+                                  "aggs": {"count": {"sum": {"field": "count"}}}}}
+            },
+            "resolutionHoursSum": {"sum": {"field": "resolutionHoursSum"}},
+            "resolutionCount": {"sum": {"field": "resolutionCount"}},
+            "statuses": {"terms": {"field": "status", "size": 50}, "aggs": {"count": {"sum": {"field": "count"}}}}
+        }
+    }
+
+
+def seven_days_from_rollup(response):
+    """
+    Reshape a rollup response like the incident-index aggregation response, so the endpoint code is shared.
+    Unresolved is every rolled-up incident without a closedDate.
+    """
+    aggregations = response["aggregations"]
+    total = int(aggregations["total"]["value"])
+    resolution_count = aggregations["resolutionCount"]["value"]
+    statuses = {b["key"]: int(b["count"]["value"]) for b in aggregations["statuses"]["buckets"]}
+    return {
+        "hits": {"total": {"value": total}},
+        "aggregations": {
+            "lastWeek": {"days": {"buckets": [
+                {"key_as_string": b["key_as_string"], "doc_count": int(b["count"]["value"])}
+                for b in aggregations["lastWeek"]["days"]["buckets"]
+            ]}},
+            "resolved": {"resolutionHours": {
+                "value": aggregations["resolutionHoursSum"]["value"] / resolution_count if resolution_count else None
+            }},
+            "statuses": {"buckets": {
+                "New": {"doc_count": statuses.get("New", 0)},
+                "Resolved": {"doc_count": statuses.get("Resolved", 0)},
+                "Closed": {"doc_count": statuses.get("Closed", 0)},
+                "Unresolved": {"doc_count": total - int(resolution_count)}
+            }}
+        }
+    }
+
+
+def six_months_from_rollup(response, statuses):
+    """Reshape rollup month buckets so each status exposes doc_count like the incident-index aggregation."""
+    buckets = response["aggregations"]["monthly_statuses"]["buckets"]
+    return {"aggregations": {"monthly_statuses": {"buckets": [
+        {"key_as_string": b["key_as_string"],
+         **{status: {"doc_count": int(b[status]["count"]["value"])} for status in statuses}}
+        for b in buckets
+    ]}}}
@@ -0,0 +1,144 @@
+# Query builders for incident similarity search (approximate kNN, exact script_score, BM25, hybrid RRF)
+from app.routes.indexLayout import full_precision_rescore
+
+# Fields used for the lexical (BM25) side of hybrid search
+LEXICAL_FIELDS = ["title^2", "description", "rootCause"]
+
+# Rank constant of reciprocal rank fusion (the value used by Elasticsearch's own RRF)
+RRF_RANK_CONSTANT = 60
+
+SEARCH_MODES = ("knn", "exact", "hybrid")
+
+# Embeddings are never returned to callers (they dominate response size)
+EXCLUDE_EMBEDDING = {"excludes": ["embedding"]}
+
+
+def build_filters(priority=None, status=None, created_from=None, created_to=None):
+    """Build the list of filter clauses shared by every search mode."""
+    filters = []
+    if priority:
+        filters.append({"terms": {"priority": list(priority)}})
+    if status:
+        filters.append({"terms": {"status": list(status)}})
+    if created_from or created_to:
+        date_range = {}
+        if created_from:
+            date_range["gte"] = created_from
+        if created_to:
+            date_range["lte"] = created_to
+        filters.append({"range": {"createdDate": date_range}})
+    return filters
+
+
+def build_knn_search(query_vector, size, num_candidates, filters=None, rescore_window=None):
+    """
+    Approximate (HNSW) kNN search body. Filters are applied during the graph search (pre-filtering).
+    With `rescore_window` (quantized layouts) the kNN runs as a query and the top `rescore_window`
+    candidates are re-ranked with exact cosine on the full-precision vectors.
+    """
+    knn = {
+        "field": "embedding",
+        "query_vector": query_vector,
+        "num_candidates": max(num_candidates, size, rescore_window or 0)
+    }
+    if filters:
+        knn["filter"] = filters
+    if rescore_window:
+        return {
+            "query": {"knn": knn},
+            "size": size,
+            "rescore": full_precision_rescore(query_vector, max(rescore_window, size)),
+            "_source": EXCLUDE_EMBEDDING
+        }
+    knn["k"] = size
+    return {"knn": knn, "size": size, "_source": EXCLUDE_EMBEDDING}
+
+
+def build_exact_search(query_vector, size, filters=None):
+    """Exact brute-force cosine similarity over every (filtered) document, kept for recall comparisons."""
+    base_query = {"bool": {"filter": filters}} if filters else {"match_all": {}}
+    return {
+        "size": size,
+        "_source": EXCLUDE_EMBEDDING,
+        "query": {
+            "script_score": {
+                "query": base_query,
+                "script": {
+                    "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
+                    "params": {"query_vector": query_vector}
+                }
+            }
+        }
+    }
+
+
+def build_lexical_search(query_text, size, filters=None):
+    """BM25 search on title/description/rootCause."""
+    bool_query = {"must": [{"multi_match": {"query": query_text, "fields": LEXICAL_FIELDS}}]}
+    if filters:
+        bool_query["filter"] = filters
+    return {"size": size, "query": {"bool": bool_query}, "_source": EXCLUDE_EMBEDDING}
+
+
+def exclude_documents(filters, doc_ids):
+    """Filter clauses extended to leave out the given documents (e.g. the incident a search started from)."""
+    return list(filters or []) + [{"bool": {"must_not": [{"ids": {"values": list(doc_ids)}}]}}]
+
+
+def build_more_like_this(index_name, doc_id, size, filters=None):
+    """Lexical fallback of "similar to this incident" when it has no stored vector (the source is excluded)."""
+    bool_query = {"must": [{"more_like_this": {
+        "fields": ["title", "description", "rootCause"],
+        "like": [{"_index": index_name, "_id": doc_id}],
+        "min_term_freq": 1,
+        "min_doc_freq": 1
+    }}]}
+    if filters:
+        bool_query["filter"] = filters
+    return {"size": size, "query": {"bool": bool_query}, "_source": EXCLUDE_EMBEDDING}
+
+
+def reciprocal_rank_fusion(result_lists, size, rank_constant=RRF_RANK_CONSTANT):
+    """
+    Fuse several ranked hit lists: score(d) = sum over lists of 1 / (rank_constant + rank(d)).
+    Returns the top `size` hits (first occurrence of each document) with the fused score as `_score`.
+    """
+    scores = {}
+    hits_by_id = {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, start=1):
+            scores[hit["_id"]] = scores.get(hit["_id"], 0.0) + 1.0 / (rank_constant + rank)
+            hits_by_id.setdefault(hit["_id"], hit)
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:size]
+    return [{**hits_by_id[doc_id], "_score": score} for doc_id, score in ranked]
+
+
+def format_hits(hits):
+    """Shape hits the way /similarity_search has always returned them."""
+    return [{"id": hit["_id"], "score": hit["_score"], "data": hit["_source"]} for hit in hits]
+
+
+def build_msearch(index_name, bodies):
+    """Header/body pairs of an msearch request running every search body against `index_name`."""
+    searches = []
+    for body in bodies:
+        searches.extend([{"index": index_name}, body])
+    return searches
+
+
+def merge_query_results(result_lists, size=None):
+    """
+    Deduplicate the formatted hits of several queries: one entry per incident with the summed score
+    (incidents matching several queries rank first), the best single score and the matching query indexes.
+    """
+    merged = {}
+    for query_index, hits in enumerate(result_lists):
+        for hit in hits:
+            entry = merged.setdefault(hit["id"], {"id": hit["id"], "score": 0.0, "maxScore": hit["score"],
+                                                  "queries": [], "data": hit["data"]})
+            entry["score"] += hit["score"]
+            entry["maxScore"] = max(entry["maxScore"], hit["score"])
+            entry["queries"].append(query_index)
+    ranked = sorted(merged.values(), key=lambda entry: entry["score"], reverse=True)
+    return ranked[:size] if size else ranked
@@ -0,0 +1,267 @@
+import math
+import time
+
+# Embedding storage layouts for incidents_final:
+#   float - full-precision HNSW, vector kept in _source (original layout)
+#   int8  - int8 scalar-quantized HNSW, vector kept out of _source
+#   bbq   - binary (better binary quantization) HNSW, vector kept out of _source (Elasticsearch 8.18+)
+LAYOUTS = {
+    "float": None,
+    "int8": "int8_hnsw",
+    "bbq": "bbq_hnsw"
+}
+
+EMBEDDING_DIMS = 384
+
+# Identifier fields: analyzed text (original mapping) plus a keyword subfield for exact lookups.
+# Adding the subfield to an existing index only covers documents written afterwards; older documents
+# are reindexed in place by incidentLookup.backfill_id_keywords.
+ID_FIELDS = {
+    "sysId": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+    "IncidentId": {"type": "text", "fields": {"keyword": {"type": "keyword"}}}
+}
+
+# Fields added after the original mapping; put on existing indexes by put_added_fields
+ADDED_FIELDS = {
+    "contentHash": {"type": "keyword", "index": False},  # Fingerprint of the embedded text
+    # Derived at write time for analytics (see incidentIngest.derive_incident_fields)
+    "category": {"type": "keyword"},
+    "resolutionHours": {"type": "float"},
+    "resolutionDays": {"type": "integer"},
+    "createdMonth": {"type": "keyword"},
+    "createdWeekday": {"type": "keyword"},
+    "derivedVersion": {"type": "integer"},
+    "clusterId": {"type": "keyword"}  # Near-duplicate cluster (see incidentClusters)
+}
+
+# Painless snippet returning the stored full-precision vector (works when the vector is not in _source)
+_VECTOR_SCRIPT = "doc['embedding'].size() == 0 ? null : doc['embedding'].vectorValue"
+
+
+def is_quantized(layout):
+    return LAYOUTS.get(layout) is not None
+
+
+def build_index_mapping(layout="float"):
+    """Index mapping for incidents_final in the given embedding layout."""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown index layout: {layout}. Expected one of {list(LAYOUTS)}")
+
+    embedding = {
+        "type": "dense_vector",
+        "dims": EMBEDDING_DIMS,
+        "index": True,
+        "similarity": "cosine"
+    }
+    mappings = {
+        "properties": {
+            **ID_FIELDS,
+            "title": {"type": "text"},
+            "description": {"type": "text"},
+            "rootCause": {"type": "text"},
+            "createdDate": {"type": "date"},  # ISO 8601 format
+            "priority": {"type": "keyword"},
+            "status": {"type": "keyword"},  # New field for status
+            "closedDate": {"type": "date", "null_value": None},  # New field for resolution date
+            **ADDED_FIELDS,
+            "embedding": embedding
+        }
+    }
+    if is_quantized(layout):
+        # Quantized HNSW for the graph; raw float vectors are still kept in the index for rescoring
+        embedding["index_options"] = {"type": LAYOUTS[layout]}
+        mappings["_source"] = {"excludes": ["embedding"]}
+    return {"mappings": mappings}
+
+
+def put_added_fields(es, index):
+    """Add the newer fields to an index created with an older mapping (no-op when already present)."""
+    es.indices.put_mapping(index=index, properties={**ID_FIELDS, **ADDED_FIELDS})
+
+
+def embedding_fetch_options(layout):
+    """Extra search body options needed to read stored embeddings back in the given layout."""
+    if not is_quantized(layout):
+        return {}
+    return {"script_fields": {"embedding": {"script": {"source": _VECTOR_SCRIPT}}}}
+
+
+def hit_embedding(hit):
+    """Read the embedding of a hit from _source (float layout) or script_fields (quantized layouts)."""
+    embedding = hit.get("_source", {}).get("embedding")
+    if embedding is None:
+        values = hit.get("fields", {}).get("embedding")
+        if values:
+            # script_fields wrap the returned array in a list
+            embedding = values[0] if isinstance(values[0], list) else values
+    return embedding
+
+
+def fetch_embeddings(es, index, ids, layout="float"):
+    """Stored embeddings of the given documents as {id: vector}, in any layout."""
+    ids = list(ids)
+    if not ids:
+        return {}
+    body = {"query": {"ids": {"values": ids}}, "size": len(ids), **embedding_fetch_options(layout)}
+    body["_source"] = False if is_quantized(layout) else ["embedding"]
+    return {hit["_id"]: hit_embedding(hit) for hit in es.search(index=index, body=body)["hits"]["hits"]}
+
+
+def full_precision_rescore(query_vector, window_size):
+    """Rescore clause re-ranking the top candidates with exact cosine on the raw float vectors."""
+    return {
+        "window_size": window_size,
+        "query": {
+            "rescore_query": {
+                "script_score": {
+                    "query": {"match_all": {}},
+                    "script": {
+                        # Same (1 + cosine) / 2 scale as a kNN search on a cosine dense_vector
+                        "source": "(cosineSimilarity(params.query_vector, 'embedding') + 1.0) / 2.0",
+                        "params": {"query_vector": query_vector}
+                    }
+                }
+            },
+            "query_weight": 0.0,
+            "rescore_query_weight": 1.0
+        }
+    }
+
+
+def estimated_vector_memory(layout, count, dims=EMBEDDING_DIMS):
+    """Off-heap memory needed to keep the HNSW vectors resident (Elasticsearch sizing formulas)."""
+    if layout == "int8":
+        per_vector = dims + 4
+    elif layout == "bbq":
+        per_vector = math.ceil(dims / 8) + 14
+    else:
+        per_vector = dims * 4
+    return count * per_vector
+
+
+def create_layout_index(es, index, layout):
+    es.indices.create(index=index, body=build_index_mapping(layout))
+
+
+def reindex_into(es, source_index, target_index, timeout="1h"):
+    """
+    Copy every document into the new layout. The raw vector travels in the source index's _source, so the
+    source must be a float-layout index (quantized layouts keep vectors out of _source).
+    """
+    response = es.reindex(source={"index": source_index}, dest={"index": target_index},
+                          wait_for_completion=True, refresh=True, timeout=timeout)
+    if response.get("failures"):
+        raise RuntimeError(f"Reindex failures: {response['failures'][:5]}")
+    return response
+
+
+def swap_alias(es, alias, new_index):
+    """
+    Point `alias` at `new_index`. When `alias` is still a concrete index (the original layout)
+    it is deleted first, so only run this after the reindex has been verified.
+    """
+    if es.indices.exists_alias(name=alias):
+        actions = [{"remove": {"index": index, "alias": alias}} for index in es.indices.get_alias(name=alias)]
+        actions.append({"add": {"index": new_index, "alias": alias}})
+        es.indices.update_aliases(actions=actions)
+        return
+    if es.indices.exists(index=alias):
+        es.indices.delete(index=alias)
+    es.indices.put_alias(index=new_index, name=alias)
+
+
+def migrate_layout(es, alias, layout, swap=False):
+    """
+    Migration path from the current mapping: create `<alias>_<layout>_<timestamp>` with the new layout,
+    reindex into it, check the document counts and optionally switch `alias` over to it.
+    """
+    target = f"{alias}_{layout}_{int(time.time())}"
+    create_layout_index(es, target, layout)
+    reindex_into(es, alias, target)
+
+    source_count = es.count(index=alias)["count"]
+    target_count = es.count(index=target)["count"]
+    if source_count != target_count:
+        raise RuntimeError(f"Document count mismatch after reindex: {source_count} != {target_count}")
+
+    if swap:
+        swap_alias(es, alias, target)
+    return {"target": target, "documents": target_count, "swapped": swap}
+
+
+def _index_stats(es, index):
+    stats = es.indices.stats(index=index, metric=["store", "segments", "docs"])["_all"]["primaries"]
+    return {
+        "documents": stats["docs"]["count"],
+        "storeBytes": stats["store"]["size_in_bytes"],
+        "segmentsMemoryBytes": stats["segments"].get("memory_in_bytes", 0)
+    }
+
+
+def _knn_ids(es, index, layout, vector, k, num_candidates):
+    body = {
+        "size": k,
+        "query": {"knn": {"field": "embedding", "query_vector": vector, "num_candidates": num_candidates}},
+        "_source": False
+    }
+    if is_quantized(layout):
+        body["rescore"] = full_precision_rescore(vector, k * 2)
+    return [hit["_id"] for hit in es.search(index=index, body=body)["hits"]["hits"]]
+
+
+def _exact_ids(es, index, vector, k):
+    body = {
+        "size": k,
+        "_source": False,
+        "query": {
+            "script_score": {
+                "query": {"match_all": {}},
+                "script": {"source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
+                           "params": {"query_vector": vector}}
+            }
+        }
+    }
+    return [hit["_id"] for hit in es.search(index=index, body=body)["hits"]["hits"]]
+
+
+def sample_query_vectors(es, index, layout, count=50):
+    """Use stored embeddings of random documents as query vectors."""
+    random_docs = {
+        "function_score": {
+            "query": {"exists": {"field": "embedding"}},
+            "random_score": {"seed": 42, "field": "_seq_no"}
+        }
+    }
+    body = {"size": count, "query": random_docs, **embedding_fetch_options(layout)}
+    if is_quantized(layout):
+        body["_source"] = False
+    return [hit_embedding(hit) for hit in es.search(index=index, body=body)["hits"]["hits"]]
+
+
+def compare_layouts(es, indexes, query_vectors, k=10, num_candidates=100):
+    """
+    Side-by-side report for several (index, layout) pairs: store size, memory and recall@k against
+    exact brute-force search on the first (reference) index.
+    """
+    reference_index = indexes[0][0]
+    truth = [_exact_ids(es, reference_index, vector, k) for vector in query_vectors]
+
+    report = []
+    for index, layout in indexes:
+        stats = _index_stats(es, index)
+        recalls = []
+        latencies = []
+        for vector, expected in zip(query_vectors, truth):
+            started = time.perf_counter()
+            found = _knn_ids(es, index, layout, vector, k, num_candidates)
+            latencies.append((time.perf_counter() - started) * 1000)
+            recalls.append(len(set(found) & set(expected)) / max(len(expected), 1))
+        report.append({
+            "index": index,
+            "layout": layout,
+            **stats,
+            "estimatedVectorMemoryBytes": estimated_vector_memory(layout, stats["documents"]),
+            f"recall@{k}": round(sum(recalls) / len(recalls), 4) if recalls else None,
+            "avgLatencyMs": round(sum(latencies) / len(latencies), 2) if latencies else None
+        })
+    return report
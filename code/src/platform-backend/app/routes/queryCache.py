@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Cosine similarity from which two query embeddings are treated as the same question
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+
+def normalize_query(text):
+    """Exact-match key of a query text: case-folded with whitespace collapsed."""
+    return " ".join(str(text).split()).casefold()
+
+
+class SemanticQueryCache:
+    """
+    LRU cache of search results keyed by query text, with a TTL and semantic lookups.
+
+    Entries are grouped by `params` (every search option that changes the results); a lookup only
+    matches entries with identical params. `get_exact` matches the normalized query text and needs no
+    embedding; `get_similar` matches the entry whose query embedding has the highest cosine similarity,
+    if it reaches `threshold`. Like ResponseCache, `invalidate()` bumps a generation counter so results
+    computed before an index change are never stored.
+    """
+
+    def __init__(self, max_entries=1000, ttl=300.0, threshold=DEFAULT_SIMILARITY_THRESHOLD, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (params, normalized text) -> (unit embedding, value, stored_at)
+        self._entries = OrderedDict()
+        self.generation = 0
+        self._exact_hits = 0
+        self._semantic_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _expired(self, entry, now):
+        return now - entry[2] >= self.ttl
+
+    def get_exact(self, text, params):
+        key = (params, normalize_query(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry, self._clock()):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self._exact_hits += 1
+            return entry[1]
+
+    def get_similar(self, embedding, params):
+        """Cached value of the most similar query with the same params, or None (counted as a miss)."""
+        vector = _unit(embedding)
+        now = self._clock()
+        with self._lock:
+            keys, vectors = [], []
+            for key, entry in list(self._entries.items()):
+                if self._expired(entry, now):
+                    del self._entries[key]
+                elif key[0] == params:
+                    keys.append(key)
+                    vectors.append(entry[0])
+            if keys:
+                similarities = np.vstack(vectors) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self._semantic_hits += 1
+                    return self._entries[keys[best]][1]
+            self._misses += 1
+            return None
+
+    def put(self, text, params, embedding, value, generation):
+        """Store a value computed while the cache was at `generation` (dropped if invalidated since)."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            key = (params, normalize_query(text))
+            self._entries[key] = (_unit(embedding), value, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._exact_hits + self._semantic_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "exactHits": self._exact_hits,
+                "semanticHits": self._semantic_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hitRatio": round((self._exact_hits + self._semantic_hits) / lookups, 4) if lookups else 0.0,
+                "threshold": self.threshold,
+                "generation": self.generation
+            }
+
+
+def _unit(embedding):
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
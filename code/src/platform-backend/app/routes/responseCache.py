@@ -0,0 +1,129 @@
+import asyncio
+import os
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    In-process cache of endpoint responses with a TTL and stale-while-revalidate. Each worker process has
+    its own; see SharedGeneration for invalidations made by other workers.
+
+    Within `ttl` an entry is served as is (HIT). For `stale` more seconds it is still served (STALE)
+    while one background task recomputes it. Older entries are recomputed inline (MISS).
+    `invalidate()` drops every entry and bumps a generation counter so refreshes that started
+    before the invalidation never store their (possibly outdated) result.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._refreshing = set()
+        self._generation = 0
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._refresh_errors = 0
+
+    def _store(self, key, value, generation):
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (value, self._clock())
+
+    async def _refresh(self, key, compute, generation):
+        try:
+            self._store(key, await compute(), generation)
+        except Exception as e:
+            # Keep serving the stale entry; the next expired request retries inline
+            self._refresh_errors += 1
+            print(f"Response cache refresh of {key} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def get(self, key, compute, ttl, stale=0.0):
+        """
+        Return (value, status, age_seconds) for `key`, where `compute` is an async callable producing
+        the value. Errors raised by an inline compute propagate to the caller and are not cached.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            generation = self._generation
+            age = now - entry[1] if entry else None
+            if entry and age < ttl:
+                self._hits += 1
+                return entry[0], "HIT", age
+            if entry and age < ttl + stale:
+                self._stale_hits += 1
+                start_refresh = key not in self._refreshing
+                self._refreshing.add(key)
+            else:
+                self._misses += 1
+                start_refresh = None
+
+        if start_refresh is None:
+            value = await compute()
+            self._store(key, value, generation)
+            return value, "MISS", 0.0
+        if start_refresh:
+            asyncio.get_running_loop().create_task(self._refresh(key, compute, generation))
+        return entry[0], "STALE", age
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def hit_ratio(self):
+        total = self._hits + self._stale_hits + self._misses
+        return (self._hits + self._stale_hits) / total if total else 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "staleHits": self._stale_hits,
+                "misses": self._misses,
+                "refreshErrors": self._refresh_errors,
+                "hitRatio": round(self.hit_ratio(), 4),
+                "generation": self._generation
+            }
+
+
+class SharedGeneration:
+    """
+    Index-change marker shared by the worker processes of a host through a file.
+
+    bump() replaces the file; changed() tells whether it was replaced (by any process) since the last
+    call, so a worker can drop caches another worker invalidated. Changes made outside the app (or by
+    workers on other hosts) are not seen: the cache TTLs bound how long those are served.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._seen = self._stamp()
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def bump(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(f"{time.time()}\n")
+        os.replace(temp_path, self.path)
+        self._seen = self._stamp()
+
+    def changed(self):
+        stamp = self._stamp()
+        if stamp == self._seen:
+            return False
+        self._seen = stamp
+        return True
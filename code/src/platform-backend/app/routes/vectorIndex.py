@@ -0,0 +1,295 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from elasticsearch import helpers
+
+from app.routes.indexLayout import hit_embedding
+
+# Below this many vectors every query is answered by one exact matrix-vector product
+DEFAULT_MIN_TRAIN_SIZE = 4096
+
+# Number of IVF lists probed per query
+DEFAULT_NPROBE = 8
+
+_NO_DATE = np.iinfo(np.int64).min
+
+# Per-row arrays, indexed like _ids
+_ROW_ARRAYS = ("_vectors", "_alive", "_assign", "_created", "_priority", "_status")
+
+
+class UnsupportedFilter(ValueError):
+    """A filter the mirror cannot evaluate like Elasticsearch would (e.g. date math): query Elasticsearch."""
+
+
+def _to_epoch_seconds(value):
+    if not value:
+        return _NO_DATE
+    ts = pd.to_datetime(value, errors="coerce")
+    return _NO_DATE if pd.isna(ts) else int(ts.timestamp())
+
+
+def _filter_bound(value):
+    # Unlike stored dates, an unparseable bound must not be ignored (or match nothing)
+    ts = pd.to_datetime(value, errors="coerce")
+    if pd.isna(ts):
+        raise UnsupportedFilter(f"Unsupported date filter: {value}")
+    return int(ts.timestamp())
+
+
+def _kmeans(data, k, iterations=10, seed=0):
+    """Spherical k-means on unit vectors (used to train the IVF coarse quantizer)."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        for c in range(k):
+            members = data[assign == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+    return centroids
+
+
+class IncidentVectorIndex:
+    """
+    In-process mirror of the incident embeddings.
+
+    Vectors live in one contiguous, L2-normalized float32 matrix. Small indexes are searched exactly;
+    once `min_train_size` vectors are loaded an IVF coarse quantizer (spherical k-means) is trained and
+    only the `nprobe` closest lists are scored. Elasticsearch stays the source of truth: the mirror is
+    filled by a scroll and kept current by write hooks. Writes made while a rebuild scrolls are recorded and
+    replayed onto the rebuilt matrix, so they are not lost when it is swapped in.
+    """
+
+    def __init__(self, dims=384, nprobe=DEFAULT_NPROBE, min_train_size=DEFAULT_MIN_TRAIN_SIZE):
+        self.dims = dims
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.ready = False
+        self.last_build_seconds = None
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        # [(method name, args)] written during a rebuild, None when no rebuild is running
+        self._replay = None
+        self._reset(capacity=1024)
+
+    def _reset(self, capacity):
+        self._vectors = np.zeros((capacity, self.dims), dtype=np.float32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._assign = np.full(capacity, -1, dtype=np.int32)
+        self._created = np.full(capacity, _NO_DATE, dtype=np.int64)
+        self._priority = np.empty(capacity, dtype=object)
+        self._status = np.empty(capacity, dtype=object)
+        self._ids = []
+        self._rows = {}
+        self._sources = {}
+        self._centroids = None
+        self._trained_size = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _grow(self, needed):
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        extra = new_capacity - capacity
+        self._vectors = np.vstack([self._vectors, np.zeros((extra, self.dims), dtype=np.float32)])
+        self._alive = np.concatenate([self._alive, np.zeros(extra, dtype=bool)])
+        self._assign = np.concatenate([self._assign, np.full(extra, -1, dtype=np.int32)])
+        self._created = np.concatenate([self._created, np.full(extra, _NO_DATE, dtype=np.int64)])
+        self._priority = np.concatenate([self._priority, np.empty(extra, dtype=object)])
+        self._status = np.concatenate([self._status, np.empty(extra, dtype=object)])
+
+    def upsert(self, ids, vectors, sources):
+        """Insert or replace documents. `sources` are the documents without their embedding."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dims)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+
+        with self._lock:
+            self._record("upsert", ids, vectors, sources)
+            self._grow(len(self._ids) + len(ids))
+            rows = []
+            for doc_id, source in zip(ids, sources):
+                row = self._rows.get(doc_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._ids.append(doc_id)
+                    self._rows[doc_id] = row
+                rows.append(row)
+                self._sources[doc_id] = source
+                self._priority[row] = source.get("priority")
+                self._status[row] = source.get("status")
+                self._created[row] = _to_epoch_seconds(source.get("createdDate"))
+
+            rows = np.asarray(rows, dtype=np.int64)
+            self._vectors[rows] = vectors
+            self._alive[rows] = True
+            if self._centroids is not None:
+                self._assign[rows] = np.argmax(vectors @ self._centroids.T, axis=1)
+
+            if len(self._rows) >= max(self.min_train_size, 2 * self._trained_size):
+                self._train()
+
+    def update_metadata(self, updates):
+        """Apply partial updates [(id, changed_fields)] without touching the vectors."""
+        with self._lock:
+            self._record("update_metadata", updates)
+            for doc_id, changes in updates:
+                row = self._rows.get(doc_id)
+                if row is None or not self._alive[row]:
+                    continue
+                source = {**self._sources[doc_id], **changes}
+                self._sources[doc_id] = source
+                self._priority[row] = source.get("priority")
+                self._status[row] = source.get("status")
+                self._created[row] = _to_epoch_seconds(source.get("createdDate"))
+
+    def remove(self, ids):
+        with self._lock:
+            self._record("remove", ids)
+            for doc_id in ids:
+                row = self._rows.pop(doc_id, None)
+                if row is not None:
+                    self._alive[row] = False
+                    self._sources.pop(doc_id, None)
+            if len(self._ids) - len(self._rows) > max(1024, len(self._rows)):
+                self._compact()
+
+    def clear(self):
+        with self._lock:
+            self._record("clear")
+            self._reset(capacity=1024)
+            self.ready = False
+
+    def _record(self, method, *args):
+        if self._replay is not None:
+            self._replay.append((method, args))
+
+    def _compact(self):
+        """Drop the rows of removed documents once they outnumber the live ones."""
+        live = np.nonzero(self._alive[:len(self._ids)])[0]
+        arrays = {name: getattr(self, name)[live] for name in _ROW_ARRAYS}
+        ids = [self._ids[row] for row in live]
+        sources, centroids, trained_size = self._sources, self._centroids, self._trained_size
+        self._reset(capacity=max(1024, 2 * len(live)))
+        for name, values in arrays.items():
+            getattr(self, name)[:len(live)] = values
+        self._ids = ids
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self._sources, self._centroids, self._trained_size = sources, centroids, trained_size
+
+    def _train(self):
+        """(Re)train the IVF quantizer on a sample and reassign every vector."""
+        live = np.nonzero(self._alive[:len(self._ids)])[0]
+        nlist = max(1, int(np.sqrt(len(live))))
+        rng = np.random.default_rng(0)
+        sample = live if len(live) <= 50000 else rng.choice(live, size=50000, replace=False)
+        self._centroids = _kmeans(self._vectors[sample], nlist)
+        self._assign[live] = np.argmax(self._vectors[live] @ self._centroids.T, axis=1)
+        self._trained_size = len(live)
+
+    def _filter_mask(self, n, priority=None, status=None, created_from=None, created_to=None):
+        mask = self._alive[:n].copy()
+        if priority:
+            mask &= np.isin(self._priority[:n], list(priority))
+        if status:
+            mask &= np.isin(self._status[:n], list(status))
+        if created_from:
+            mask &= self._created[:n] >= _filter_bound(created_from)
+        if created_to:
+            mask &= (self._created[:n] <= _filter_bound(created_to)) & (self._created[:n] != _NO_DATE)
+        return mask
+
+    def search(self, query_vector, size=10, priority=None, status=None, created_from=None, created_to=None,
+               nprobe=None):
+        """
+        Return the `size` nearest documents as Elasticsearch-shaped hits. Scores use the same
+        (1 + cosine) / 2 scale as an Elasticsearch kNN search on a cosine dense_vector.
+        Filters are applied before probing: when the probed lists hold fewer than `size` matching documents
+        (selective filters), every matching document is scored instead. Raises UnsupportedFilter for date
+        bounds it cannot parse (e.g. Elasticsearch date math).
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        with self._lock:
+            n = len(self._ids)
+            mask = self._filter_mask(n, priority, status, created_from, created_to)
+            if self._centroids is not None:
+                probes = np.argsort(-(self._centroids @ query))[:nprobe or self.nprobe]
+                probed = mask & np.isin(self._assign[:n], probes)
+                if probed.sum() >= size:
+                    mask = probed
+            rows = np.nonzero(mask)[0]
+            if not len(rows):
+                return []
+
+            scores = self._vectors[rows] @ query
+            top = min(size, len(rows))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+            return [
+                {"_id": self._ids[rows[i]], "_score": float((1.0 + scores[i]) / 2.0),
+                 "_source": self._sources[self._ids[rows[i]]]}
+                for i in best
+            ]
+
+    def build_from_elasticsearch(self, es, index_name, batch_size=1000, fetch_options=None):
+        """
+        Scroll every document of the index into a fresh matrix, then swap it in.
+        `fetch_options` are extra body options needed to read vectors kept out of _source.
+        """
+        with self._build_lock:
+            return self._build(es, index_name, batch_size, fetch_options)
+
+    def _build(self, es, index_name, batch_size, fetch_options):
+        started = time.perf_counter()
+        with self._lock:
+            self._replay = []
+        try:
+            staging = IncidentVectorIndex(self.dims, self.nprobe, self.min_train_size)
+            ids, vectors, sources = [], [], []
+            # script_fields alone would return no _source: ask for it explicitly
+            query = {"query": {"exists": {"field": "embedding"}}, "_source": True, **(fetch_options or {})}
+            for hit in helpers.scan(es, index=index_name, query=query, size=batch_size):
+                source = dict(hit.get("_source", {}))
+                source.pop("embedding", None)
+                ids.append(hit["_id"])
+                vectors.append(hit_embedding(hit))
+                sources.append(source)
+                if len(ids) >= batch_size:
+                    staging.upsert(ids, vectors, sources)
+                    ids, vectors, sources = [], [], []
+            if ids:
+                staging.upsert(ids, vectors, sources)
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        with self._lock:
+            # Swap the scrolled matrix in, then apply the writes that arrived while scrolling
+            replay, self._replay = self._replay, None
+            self.__dict__.update({key: value for key, value in staging.__dict__.items()
+                                  if key not in ("_lock", "_build_lock", "_replay")})
+            for method, args in replay:
+                getattr(self, method)(*args)
+            self.last_build_seconds = round(time.perf_counter() - started, 3)
+            self.ready = True
+        return len(self)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "documents": int(self._alive[:len(self._ids)].sum()),
+                "matrixBytes": int(self._vectors.nbytes),
+                "ivfLists": 0 if self._centroids is None else len(self._centroids),
+                "nprobe": self.nprobe,
+                "lastBuildSeconds": self.last_build_seconds
+            }
@@ -0,0 +1,369 @@
+import fcntl
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Sentinel placed on the queue to stop the worker thread
+_STOP = object()
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when the write-behind queue is at capacity (callers answer 429)."""
+
+
+class SpillFile:
+    """
+    Append-only JSON-lines journal of queued writes: {"queued": id, "record": ...} when a write is
+    accepted, {"done": [ids]} once a batch has been handled. Replaying it yields the writes that were
+    accepted but never handled (e.g. the process was restarted with a full queue).
+
+    Every process (e.g. each uvicorn worker) owns its own journal, `<base_path>.<pid>-<suffix>`, and
+    holds an exclusive lock on `<journal>.lock` while it is alive. adopt_orphans() takes over the
+    journals whose lock is free, i.e. whose process has exited.
+    """
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.path = f"{base_path}.{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        directory = os.path.dirname(base_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # A concurrent adopt_orphans() may delete the lock file between its creation and our lock: retry
+        for _ in range(3):
+            self._owner = _try_lock(f"{self.path}.lock")
+            if self._owner is not None:
+                break
+        else:
+            raise RuntimeError(f"Could not lock spill journal {self.path}")
+
+    def _append(self, *entries):
+        # fsynced before returning: a write is only acknowledged once its journal entry is on disk
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write("".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def queued(self, tracking_id, record):
+        self._append({"queued": tracking_id, "record": record})
+
+    def done(self, tracking_ids):
+        self._append({"done": list(tracking_ids)})
+
+    def pending(self):
+        """[(tracking_id, record)] accepted but not handled, in submission order."""
+        with self._lock:
+            return _read_pending(self.path)
+
+    def compact(self):
+        """Rewrite this process's journal without the writes it has already handled."""
+        with self._lock:
+            pending = _read_pending(self.path)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                for tracking_id, record in pending:
+                    f.write(json.dumps({"queued": tracking_id, "record": record}, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+    def adopt_orphans(self):
+        """
+        Move the pending writes of journals left by exited processes into this journal and delete those
+        journals. Returns the adopted [(tracking_id, record)].
+        """
+        adopted = []
+        for lock_path in sorted(glob.glob(f"{glob.escape(self.base_path)}.*.lock")):
+            path = lock_path[:-len(".lock")]
+            if path == self.path:
+                continue
+            handle = _try_lock(lock_path)
+            if handle is None:
+                # Owner still running
+                continue
+            try:
+                # Another process may have adopted (and deleted) the journal while we waited for its lock
+                pending = _read_pending(path)
+                if pending:
+                    self._append(*({"queued": tracking_id, "record": record} for tracking_id, record in pending))
+                    adopted.extend(pending)
+                for stale in (path, lock_path):
+                    try:
+                        os.remove(stale)
+                    except FileNotFoundError:
+                        pass
+            finally:
+                handle.close()
+        return adopted
+
+    def close(self):
+        """Release the journal; an empty one is deleted, one with pending writes is left for adoption."""
+        if self._owner is None:
+            return
+        with self._lock:
+            if not _read_pending(self.path):
+                for path in (self.path, f"{self.path}.lock"):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            self._owner.close()
+            self._owner = None
+
+
+def _try_lock(lock_path):
+    """Open `lock_path` and take an exclusive non-blocking lock on it. Returns the handle or None."""
+    handle = open(lock_path, "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # The file may have been deleted (by whoever held the lock before us) after we opened it
+        if os.fstat(handle.fileno()).st_ino != os.stat(lock_path).st_ino:
+            raise FileNotFoundError(lock_path)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def _read_pending(path):
+    if not os.path.exists(path):
+        return []
+    queued, done = OrderedDict(), set()
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn last line of a crashed process
+                continue
+            if "queued" in entry:
+                queued[entry["queued"]] = entry["record"]
+            done.update(entry.get("done", []))
+    # A record is journaled right after it is queued, so its "done" marker may come first
+    return [(tracking_id, record) for tracking_id, record in queued.items() if tracking_id not in done]
+
+
+class WriteBehindQueue:
+    """
+    Bounded write-behind buffer.
+
+    Callers submit records and immediately get a tracking id. A dedicated worker thread groups whatever
+    is waiting (up to `max_batch_size`, waiting at most `max_wait_ms` for more) into one `write_batch`
+    call, which returns one error (or None) per record. When `write_batch` raises (e.g. Elasticsearch is
+    unreachable) the batch is retried with backoff, up to `max_retries` times before its records are
+    written one by one and the failing ones are marked failed; meanwhile the queue fills up and submit()
+    rejects new records. With a spill file every accepted record is journaled (one journal per process next to
+    `spill_path`), and records other processes accepted but never handled are queued again by recover().
+    Statuses are kept in memory by the process that accepted the record, so with several workers a
+    tracking id is only known to the worker that returned it (and is forgotten on restart).
+    """
+
+    def __init__(self, write_batch, max_queue=10000, max_batch_size=200, max_wait_ms=500.0, spill_path=None,
+                 max_tracked=100000, retry_seconds=1.0, max_retries=5, name="write-behind"):
+        self.write_batch = write_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_tracked = max_tracked
+        self.retry_seconds = retry_seconds
+        self.max_retries = max_retries
+        self.name = name
+        self.spill = SpillFile(spill_path) if spill_path else None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        # Held while a record is queued and journaled, so the journal is never compacted in between
+        self._submit_lock = threading.Lock()
+        self._stopping = threading.Event()
+        # Tracking id -> status entry, oldest first (bounded by max_tracked)
+        self._statuses = OrderedDict()
+
+        # Counters exposed through stats()
+        self._submitted = 0
+        self._rejected = 0
+        self._written = 0
+        self._failed = 0
+        self._batches = 0
+        self._retries = 0
+        self._last_batch_size = 0
+        self._last_flush = 0.0
+
+    def start(self):
+        """Start the worker thread (called lazily on the first submit)."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop the worker after the queued records are written; unwritten records stay in the spill file."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._stopping.set()
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            thread.join(timeout)
+        if self.spill is not None:
+            self.spill.close()
+
+    def recover(self):
+        """
+        Queue the records that exited processes journaled but never wrote (they move to this process's
+        journal). Returns how many were requeued.
+        """
+        if self.spill is None:
+            return 0
+        pending = self.spill.adopt_orphans()
+        if pending:
+            # Start first: more pending records than the queue holds are drained while they are queued
+            self.start()
+        for tracking_id, record in pending:
+            self._track(tracking_id, "queued")
+            self._queue.put((tracking_id, record))
+        return len(pending)
+
+    def submit(self, record):
+        """Queue one JSON-serializable record. Returns its tracking id; raises QueueFullError when full."""
+        if self._thread is None:
+            self.start()
+        tracking_id = uuid.uuid4().hex
+        self._track(tracking_id, "queued")
+        with self._submit_lock:
+            try:
+                self._queue.put_nowait((tracking_id, record))
+            except queue.Full:
+                self._rejected += 1
+                with self._lock:
+                    self._statuses.pop(tracking_id, None)
+                raise QueueFullError(f"Write-behind queue is full ({self._queue.maxsize} records)")
+            # Journaled after queueing so a rejected record is never replayed. Writes are idempotent
+            # (documents are indexed by id), so replaying a record whose "done" marker came first is harmless.
+            if self.spill is not None:
+                self.spill.queued(tracking_id, record)
+        self._submitted += 1
+        return tracking_id
+
+    def status(self, tracking_id):
+        """Status entry of a tracking id ({"status": queued|written|failed, ...}) or None when unknown."""
+        with self._lock:
+            entry = self._statuses.get(tracking_id)
+            return dict(entry) if entry else None
+
+    def stats(self):
+        return {
+            "queueDepth": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "submitted": self._submitted,
+            "rejected": self._rejected,
+            "written": self._written,
+            "failed": self._failed,
+            "batches": self._batches,
+            "retries": self._retries,
+            "lastBatchSize": self._last_batch_size,
+            "lastFlushMs": round(self._last_flush * 1000, 3)
+        }
+
+    def _track(self, tracking_id, status, error=None):
+        with self._lock:
+            entry = self._statuses.pop(tracking_id, None) or {"submittedAt": time.time()}
+            entry["status"] = status
+            if status != "queued":
+                entry["finishedAt"] = time.time()
+            if error:
+                entry["error"] = error
+            self._statuses[tracking_id] = entry
+            while len(self._statuses) > self.max_tracked:
+                self._statuses.popitem(last=False)
+
+    def _collect_batch(self, first):
+        """Collect records following `first` until the batch is full or max_wait has elapsed."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        stop = False
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _write_with_retries(self, records):
+        """
+        Errors (or None) per record. A raising write_batch is retried with backoff up to `max_retries`
+        times; then every record is tried once on its own, so one bad record fails by itself instead of
+        blocking the queue. Returns None when the queue is stopping (the records stay in the spill file).
+        """
+        delay = self.retry_seconds
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.write_batch(records)
+            except Exception as e:
+                if self._stopping.is_set():
+                    print(f"Write-behind batch of {len(records)} records not written before shutdown: {e}")
+                    return None
+                error = e
+                if attempt < self.max_retries:
+                    self._retries += 1
+                    print(f"Write-behind batch of {len(records)} records failed, retrying in {delay:.1f}s: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+
+        if len(records) == 1:
+            return [f"Write failed after {self.max_retries} retries: {error}"]
+        print(f"Write-behind batch of {len(records)} records failed {self.max_retries + 1} times, "
+              f"writing its records one by one: {error}")
+        errors = []
+        for record in records:
+            try:
+                errors.extend(self.write_batch([record]))
+            except Exception as e:
+                errors.append(f"Write failed: {e}")
+        return errors
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
+        errors = self._write_with_retries([record for _, record in batch])
+        if errors is None:
+            return
+
+        for (tracking_id, _), error in zip(batch, errors):
+            if error:
+                self._failed += 1
+                self._track(tracking_id, "failed", error)
+            else:
+                self._written += 1
+                self._track(tracking_id, "written")
+        if self.spill is not None:
+            self.spill.done(tracking_id for tracking_id, _ in batch)
+            with self._submit_lock:
+                if self._queue.empty():
+                    # Everything accepted so far is handled: keep the journal from growing
+                    self.spill.compact()
+        self._batches += 1
+        self._last_batch_size = len(batch)
+        self._last_flush = time.perf_counter() - started
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect_batch(first)
+            self._run_batch(batch)
+            if stop:
+                return
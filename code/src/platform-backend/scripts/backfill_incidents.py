@@ -0,0 +1,59 @@
+"""
+Multi-core backfill of a large incident CSV into incidents_final.
+
+Encoding is spread over a pool of worker processes (each loads the model once); vectors come back
+through shared memory to a single bulk-indexing stage. Progress is checkpointed per chunk, so running
+the same command again after an interruption resumes with the first unfinished chunk.
+
+Usage (from code/src/platform-backend):
+    python -m scripts.backfill_incidents incidents.csv [--workers 7] [--chunk-size 2000]
+        [--checkpoint incidents.csv.checkpoint.json] [--backend torch|onnx] [--no-cache]
+"""
+import argparse
+import json
+import os
+
+from elasticsearch import Elasticsearch
+
+from app.routes.embeddingCache import EmbeddingCache, DEFAULT_CACHE_PATH
+from app.routes.incidentBackfill import run_backfill
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file_path")
+    parser.add_argument("--url", default="http://localhost:9200")
+    parser.add_argument("--index", default="incidents_final")
+    parser.add_argument("--layout", default=os.getenv("INCIDENT_INDEX_LAYOUT", "float"),
+                        help="Mapping layout if the index has to be created")
+    parser.add_argument("--workers", type=int, default=None, help="Encoder processes (default: CPUs - 1)")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"))
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--checkpoint", default=None, help="Default: <file_path>.checkpoint.json")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or fill the embedding cache")
+    args = parser.parse_args()
+
+    cache = None
+    if not args.no_cache:
+        cache = EmbeddingCache(args.model, db_path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH))
+
+    report = run_backfill(
+        Elasticsearch(args.url, request_timeout=120),
+        args.index,
+        args.file_path,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        backend=args.backend,
+        model_name=args.model,
+        threads_per_worker=args.threads_per_worker,
+        checkpoint_path=args.checkpoint or f"{args.file_path}.checkpoint.json",
+        cache=cache,
+        layout=args.layout
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Latency benchmark of the dashboard read endpoints under concurrent clients.
+
+Starts `--clients` concurrent clients against a running API; each client sends `--requests` requests
+round-robin over the endpoints. Reports p50/p99 latency, error count and throughput per endpoint, so
+runs before and after a change (for example sync vs async Elasticsearch calls) can be compared.
+The dashboard endpoints are served from the response cache once warm; the similarity search and the
+cursor-paged /incident_list (page_size) always reach Elasticsearch.
+
+Usage (from code/src/platform-backend, with the API running):
+    python -m scripts.benchmark_concurrency [--url http://localhost:8000] [--clients 50] [--requests 20]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+
+ENDPOINTS = [
+    ("GET", "/latest_seven_days_incidents"),
+    ("GET", "/latest_six_months_incidents"),
+    ("GET", "/incidents-overview"),
+    ("GET", "/incident_list?limit=6"),
+    ("GET", "/incident_list?page_size=50"),
+    ("POST", "/similarity_search?query_text=database%20connection%20timeout&mode=hybrid")
+]
+
+
+async def client(http, endpoints, requests, offset, latencies, errors):
+    for i in range(requests):
+        method, path = endpoints[(offset + i) % len(endpoints)]
+        started = time.perf_counter()
+        try:
+            response = await http.request(method, path)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            failed = True
+        latencies[path].append(time.perf_counter() - started)
+        if failed:
+            errors[path] += 1
+
+
+async def run(url, clients, requests, endpoints):
+    latencies = {path: [] for _, path in endpoints}
+    errors = {path: 0 for _, path in endpoints}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as http:
+        # Warm-up: one request per endpoint (model load, first queries)
+        for method, path in endpoints:
+            await http.request(method, path)
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http, endpoints, requests, c, latencies, errors) for c in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    results = []
+    for _, path in endpoints:
+        values = np.asarray(latencies[path]) * 1000
+        results.append({
+            "endpoint": path,
+            "requests": len(values),
+            "errors": errors[path],
+            "p50Ms": round(float(np.percentile(values, 50)), 1) if len(values) else None,
+            "p99Ms": round(float(np.percentile(values, 99)), 1) if len(values) else None
+        })
+    total = sum(len(values) for values in latencies.values())
+    return {"clients": clients, "seconds": round(elapsed, 2), "requestsPerSecond": round(total / elapsed, 1),
+            "endpoints": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--endpoints", help="comma separated 'METHOD /path' entries (default: dashboard set)")
+    args = parser.parse_args()
+
+    endpoints = ENDPOINTS
+    if args.endpoints:
+        endpoints = [tuple(entry.strip().split(" ", 1)) for entry in args.endpoints.split(",")]
+    print(json.dumps(asyncio.run(run(args.url, args.clients, args.requests, endpoints)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Throughput benchmark of the embedding backends (PyTorch vs ONNX Runtime) on CPU.
+
+Encodes a synthetic mix of short incident titles and long incident texts with each backend, with and
+without length bucketing, and reports texts/second plus the maximum deviation from the PyTorch vectors.
+
+Usage (from code/src/platform-backend):
+    python -m scripts.benchmark_encoders [--texts 2000] [--threads 4] [--batch-size 64]
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from app.routes.encoderBackends import create_encoder
+
+WORDS = ("database connection timeout router latency disk failure crash update phishing breach server power "
+         "network memory leak kafka consumer lag certificate expired deployment rollback").split()
+
+
+def synthetic_texts(count, seed=0):
+    rng = random.Random(seed)
+    texts = []
+    for i in range(count):
+        # Two thirds short titles, one third long title + description + root cause texts
+        length = rng.randint(3, 8) if i % 3 else rng.randint(60, 180)
+        texts.append(" ".join(rng.choice(WORDS) for _ in range(length)))
+    rng.shuffle(texts)
+    return texts
+
+
+def run(encoder, texts, batch_size, bucketed):
+    started = time.perf_counter()
+    if bucketed:
+        vectors = encoder.encode(texts, batch_size=batch_size)
+    else:
+        # Arrival order batches: every batch pads to its longest text
+        vectors = np.vstack([encoder._encode_batch(texts[i:i + batch_size])
+                             for i in range(0, len(texts), batch_size)])
+    return vectors, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--backends", default="torch,onnx")
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.texts)
+    results = []
+    reference = None
+    for backend in args.backends.split(","):
+        encoder = create_encoder(backend, args.model, args.threads)
+        encoder.encode(texts[:args.batch_size])  # warm-up
+        for bucketed in (False, True):
+            vectors, seconds = run(encoder, texts, args.batch_size, bucketed)
+            if reference is None:
+                reference = vectors
+            results.append({
+                "backend": backend,
+                "lengthBucketed": bucketed,
+                "threads": args.threads,
+                "textsPerSecond": round(len(texts) / seconds, 1),
+                "maxAbsDiffVsTorch": float(np.max(np.abs(vectors - reference)))
+            })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
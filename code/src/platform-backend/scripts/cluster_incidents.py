@@ -0,0 +1,51 @@
+"""
+Cluster near-duplicate incidents by embedding and store a clusterId on every document.
+
+Loads every stored embedding into memory, joins pairs with cosine similarity >= --threshold into
+clusters (see app/routes/incidentClusters.py) and bulk-updates the documents whose clusterId changed.
+With --incremental only incidents without a clusterId are compared and assigned.
+Reports counts, wall time per phase and peak memory next to the index size.
+
+Usage (from code/src/platform-backend):
+    python -m scripts.cluster_incidents [--threshold 0.95] [--block-size 2048] [--incremental]
+"""
+import argparse
+import json
+import resource
+import tracemalloc
+
+from elasticsearch import Elasticsearch
+
+from app.routes.incidentClusters import DEFAULT_BLOCK_SIZE, DEFAULT_THRESHOLD, cluster_incidents
+from app.routes.indexLayout import LAYOUTS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:9200")
+    parser.add_argument("--index", default="incidents_final")
+    parser.add_argument("--layout", choices=list(LAYOUTS), default="float",
+                        help="Embedding layout of the index (INCIDENT_INDEX_LAYOUT of the API)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--incremental", action="store_true")
+    args = parser.parse_args()
+
+    es = Elasticsearch(args.url)
+    tracemalloc.start()
+    report = cluster_incidents(es, args.index, args.layout, args.threshold, args.block_size, args.incremental)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = es.indices.stats(index=args.index, metric=["store", "docs"])["_all"]["primaries"]
+    report.update({
+        "indexDocuments": stats["docs"]["count"],
+        "indexStoreBytes": stats["store"]["size_in_bytes"],
+        "peakTracedBytes": peak,
+        "maxRssKiB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
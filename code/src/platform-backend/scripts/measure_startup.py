@@ -0,0 +1,81 @@
+"""
+Measure how long the backend takes to start.
+
+Reports, from a fresh process:
+  * import time of app.main
+  * time until uvicorn answers GET / (liveness)
+  * time until GET /api/ready returns 200 (model loaded, warm-up encode done, index present)
+  * latency of the first /api/similarity_search once ready
+
+Usage (from code/src/platform-backend):
+    python scripts/measure_startup.py [--port 8765] [--timeout 300]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def measure_import_time():
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def request(url, method="GET"):
+    req = urllib.request.Request(url, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def wait_for(url, started, timeout, expected_status=200):
+    while time.perf_counter() - started < timeout:
+        try:
+            status, body = request(url)
+            if status == expected_status:
+                return time.perf_counter() - started, body
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"{url} did not return {expected_status} within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+    base = f"http://127.0.0.1:{args.port}"
+
+    results = {"importSeconds": round(measure_import_time(), 3)}
+
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        live_seconds, _ = wait_for(f"{base}/", started, args.timeout)
+        results["liveSeconds"] = round(live_seconds, 3)
+
+        ready_seconds, body = wait_for(f"{base}/api/ready", started, args.timeout)
+        results["readySeconds"] = round(ready_seconds, 3)
+        results["ready"] = json.loads(body)
+
+        query_started = time.perf_counter()
+        status, _ = request(f"{base}/api/similarity_search?query_text=database%20connection%20timeout&size=5",
+                            method="POST")
+        results["firstSearch"] = {"status": status, "ms": round((time.perf_counter() - query_started) * 1000, 1)}
+    finally:
+        server.terminate()
+        server.wait(10)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
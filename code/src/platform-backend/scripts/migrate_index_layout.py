@@ -0,0 +1,50 @@
+"""
+Migrate incidents_final to a quantized embedding layout and compare the layouts.
+
+Steps:
+  1. create incidents_final_<layout>_<timestamp> with the new mapping (see app/routes/indexLayout.py)
+  2. reindex every document into it and check the document counts
+  3. report store size, memory and recall@k for the old and new layout side by side
+  4. with --swap, replace the old index by an alias pointing at the new one
+
+Usage (from code/src/platform-backend):
+    python -m scripts.migrate_index_layout --layout int8 [--queries 50] [--k 10] [--swap]
+
+Start the API with INCIDENT_INDEX_LAYOUT=<layout> after swapping so searches rescore at full precision.
+"""
+import argparse
+import json
+
+from elasticsearch import Elasticsearch
+
+from app.routes.indexLayout import LAYOUTS, migrate_layout, compare_layouts, sample_query_vectors, swap_alias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:9200")
+    parser.add_argument("--index", default="incidents_final")
+    parser.add_argument("--layout", choices=[layout for layout in LAYOUTS if layout != "float"], default="int8")
+    parser.add_argument("--queries", type=int, default=50, help="Number of sampled query vectors for recall")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-candidates", type=int, default=100)
+    parser.add_argument("--swap", action="store_true", help="Point the index name at the new index when done")
+    args = parser.parse_args()
+
+    es = Elasticsearch(args.url)
+
+    migration = migrate_layout(es, args.index, args.layout, swap=False)
+    print(f"Reindexed {migration['documents']} documents into {migration['target']}")
+
+    query_vectors = sample_query_vectors(es, args.index, "float", args.queries)
+    report = compare_layouts(es, [(args.index, "float"), (migration["target"], args.layout)], query_vectors,
+                             k=args.k, num_candidates=args.num_candidates)
+    print(json.dumps(report, indent=2))
+
+    if args.swap:
+        swap_alias(es, args.index, migration["target"])
+        print(f"'{args.index}' now points at {migration['target']}")
+
+
+if __name__ == "__main__":
+    main()
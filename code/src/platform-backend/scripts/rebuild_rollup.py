@@ -0,0 +1,31 @@
+"""
+Rebuild the daily incident rollup (incidents_daily_rollup) from incidents_final.
+
+The rollup is maintained incrementally by the API when it runs with INCIDENT_ROLLUP=1; run this to
+create it for existing data or to repair drift (for example after writes made with the rollup disabled).
+
+Usage (from code/src/platform-backend):
+    python -m scripts.rebuild_rollup [--url http://localhost:9200] [--index incidents_final]
+"""
+import argparse
+import time
+
+from elasticsearch import Elasticsearch
+
+from app.routes.incidentRollup import ROLLUP_INDEX, rebuild_rollup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:9200")
+    parser.add_argument("--index", default="incidents_final")
+    parser.add_argument("--rollup-index", default=ROLLUP_INDEX)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows = rebuild_rollup(Elasticsearch(args.url), args.index, args.rollup_index)
+    print(f"Wrote {rows} rollup rows into {args.rollup_index} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
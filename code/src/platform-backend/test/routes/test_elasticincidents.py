@@ -1,3 +1,5 @@
+import os
+
 import pytest
 from fastapi import HTTPException, APIRouter
 from fastapi.testclient import TestClient
@@ -22,6 +24,30 @@ def mock_sentence_transformer():
         yield mock_model
 
 
+# Aggregation response of /incidents-overview for one resolved network incident
+OVERVIEW_RESPONSE = {
+    "hits": {"total": {"value": 1}, "hits": []},
+    "aggregations": {
+        "severity": {"buckets": [{"key": "High", "doc_count": 1}]},
+        "types": {"buckets": {"Network": {"doc_count": 1}, "Hardware": {"doc_count": 0},
+                              "Software": {"doc_count": 0}, "Security": {"doc_count": 0}}},
+        "recent": {"months": {"buckets": []}},
+        "latest": {"hits": {"hits": [{"_source": {"title": "Test Incident", "status": "Resolved",
+                                                  "priority": "High", "createdDate": "2023-10-01T12:00:00"}}]}}
+    }
+}
+
+# Single aggregation response of /latest_seven_days_incidents
+SEVEN_DAYS_RESPONSE = {
+    "hits": {"total": {"value": 100}, "hits": []},
+    "aggregations": {
+        "lastWeek": {"days": {"buckets": [{"key_as_string": "2023-10-01", "doc_count": 1}]}},
+        "resolved": {"resolutionHours": {"value": 24.0}},
+        "statuses": {"buckets": {"New": {"doc_count": 10}, "Resolved": {"doc_count": 30},
+                                 "Closed": {"doc_count": 20}, "Unresolved": {"doc_count": 50}}}
+    }
+}
+
 # Test index creation
 def test_index_creation(mock_elasticsearch):
     mock_elasticsearch.indices.exists.return_value = False
@@ -95,22 +121,7 @@ def test_get_incident_by_id(mock_elasticsearch):
 
 # Test incidents_overview endpoint
 def test_incidents_overview(mock_elasticsearch):
-    mock_elasticsearch.search.return_value = {
-        "hits": {
-            "hits": [
-                {
-                    "_source": {
-                        "title": "Test Incident",
-                        "status": "Resolved",
-                        "priority": "High",
-                        "createdDate": "2023-10-01T12:00:00",
-                        "closedDate": "2023-10-02T12:00:00",
-                        "description": "network issue"
-                    }
-                }
-            ]
-        }
-    }
+    mock_elasticsearch.search.return_value = OVERVIEW_RESPONSE
 
     response = client.get("/incidents-overview")
     assert response.status_code == 200
@@ -175,11 +186,7 @@ def test_latest_incidents(mock_elasticsearch):
 
 # Test latest_seven_days_incidents endpoint
 def test_latest_seven_days_incidents(mock_elasticsearch):
-    mock_elasticsearch.search.side_effect = [
-        {"hits": {"total": {"value": 100}}},  # Total incidents
-        {"hits": {"hits": [{"_source": {"createdDate": "2023-10-01T12:00:00", "status": "Resolved"}}]}},  # Last 7 days
-        {"hits": {"hits": [{"_source": {"createdDate": "2023-10-01T12:00:00", "closedDate": "2023-10-02T12:00:00"}}]}}  # Resolution times
-    ]
+    mock_elasticsearch.search.return_value = SEVEN_DAYS_RESPONSE
 
     response = client.get("/latest_seven_days_incidents")
     assert response.status_code == 200
@@ -254,4 +261,579 @@ def test_similarity_search(mock_elasticsearch, mock_sentence_transformer):
     response = client.post("/similarity_search", json={"query_text": "Test Query", "size": 1})
     assert response.status_code == 200
     assert len(response.json()) == 1
-    assert response.json()[0]["id"] == "1"
\ No newline at end of file
+    assert response.json()[0]["id"] == "1"
+
+# Client bound to the real elasticIncidents router (startup events are not run)
+@pytest.fixture
+def incidents_client():
+    from fastapi import FastAPI
+    from app.routes import elasticIncidents
+
+    test_app = FastAPI()
+    test_app.include_router(elasticIncidents.router)
+    return TestClient(test_app)
+
+
+class AsyncFacade:
+    """Awaitable view of a MagicMock, so sync and async client calls are recorded on the same mock."""
+
+    def __init__(self, mock):
+        self._mock = mock
+
+    def __getattr__(self, name):
+        method = getattr(self._mock, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+# Mock the module-level Elasticsearch clients and embedding cache of elasticIncidents and reset start-up state
+@pytest.fixture
+def mock_incidents_es(tmp_path):
+    from app.routes import elasticIncidents
+    from app.routes.embeddingCache import EmbeddingCache
+    from app.routes.responseCache import SharedGeneration
+
+    state = dict(elasticIncidents.warmup_state)
+    # Memory-only embedding cache and a temporary index-change marker: tests never read or write the
+    # on-disk files in the home directory
+    with patch("app.routes.elasticIncidents.es") as mock_es, \
+            patch("app.routes.elasticIncidents.es_async", AsyncFacade(mock_es)), \
+            patch("app.routes.elasticIncidents.embedding_cache",
+                  EmbeddingCache(elasticIncidents.MODEL_NAME, db_path=None)), \
+            patch("app.routes.elasticIncidents.index_generation",
+                  SharedGeneration(str(tmp_path / "index_generation"))):
+        elasticIncidents.invalidate_index_caches()
+        yield mock_es
+        elasticIncidents.invalidate_index_caches()
+    elasticIncidents.warmup_state.update(state)
+
+
+# Test importing the routes constructs neither the model nor the Elasticsearch clients; the startup hooks do
+def test_import_is_lazy(tmp_path, monkeypatch):
+    import importlib.util
+    import sys
+    import time
+    from app.routes import elasticIncidents
+
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings.sqlite3"))
+    monkeypatch.setenv("ADD_EXCEPTION_SPILL_PATH", str(tmp_path / "spill.jsonl"))
+    sentence_transformers = MagicMock()
+    transformer = sentence_transformers.SentenceTransformer
+    with patch("elasticsearch.Elasticsearch") as sync_client, \
+            patch("elasticsearch.AsyncElasticsearch") as async_client, \
+            patch.dict(sys.modules, {"torch": MagicMock(), "sentence_transformers": sentence_transformers}):
+        # Fresh copy of the module, so the shared one used by the other tests keeps its state
+        spec = importlib.util.spec_from_file_location("lazy_elasticIncidents", elasticIncidents.__file__)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        assert (module.es, module.es_async, module.model) == (None, None, None)
+        sync_client.assert_not_called()
+        async_client.assert_not_called()
+        transformer.assert_not_called()
+
+        for hook in module.router.on_startup:
+            hook()
+        sync_client.assert_called_once_with(module.ELASTICSEARCH_URL)
+        async_client.assert_called_once()
+        # The model is loaded by the warm-up thread the startup hooks started
+        deadline = time.monotonic() + 5
+        while not module.warmup_state["modelLoaded"] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        transformer.assert_called_once()
+
+        module.stop_exception_writer()
+        module.stop_embedding_service()
+
+
+# Test /ready reports 503 until warm-up has finished
+def test_ready_endpoint(incidents_client, mock_incidents_es):
+    from app.routes import elasticIncidents
+
+    elasticIncidents.warmup_state.update({"modelLoaded": False, "warmupEncodeMs": None, "indexPresent": False})
+    response = incidents_client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+
+    elasticIncidents.warmup_state.update({"modelLoaded": True, "warmupEncodeMs": 12.5, "indexPresent": True})
+    response = incidents_client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["ready"] is True
+
+
+# Test the index bootstrap runs once per process
+def test_ensure_index_runs_once(mock_incidents_es):
+    from app.routes import elasticIncidents
+
+    elasticIncidents.warmup_state["indexPresent"] = False
+    mock_incidents_es.indices.exists.return_value = False
+
+    elasticIncidents.ensure_index()
+    elasticIncidents.ensure_index()
+
+    mock_incidents_es.indices.create.assert_called_once()
+    assert elasticIncidents.warmup_state["indexPresent"] is True
+
+
+# Test /incidents-overview is answered from one aggregation query
+def test_incidents_overview_aggregations(incidents_client, mock_incidents_es):
+    from datetime import datetime
+    from app.routes.incidentAggregations import month_starts
+
+    this_month = month_starts(datetime.utcnow())[-1].strftime("%Y-%m")
+    mock_incidents_es.search.return_value = {
+        "hits": {"total": {"value": 6}, "hits": []},
+        "aggregations": {
+            "severity": {"buckets": [{"key": "High", "doc_count": 4}, {"key": "Low", "doc_count": 2}]},
+            "types": {"buckets": {"Network": {"doc_count": 2}, "Hardware": {"doc_count": 1},
+                                  "Software": {"doc_count": 0}, "Security": {"doc_count": 0}}},
+            "recent": {"months": {"buckets": [
+                {"key_as_string": this_month, "doc_count": 5,
+                 "resolved": {"doc_count": 2, "resolutionDays": {"value": 2.5}}}
+            ]}},
+            "latest": {"hits": {"hits": [{"_source": {"title": "Router down", "status": "New", "priority": "High",
+                                                      "createdDate": "2023-10-01T12:00:00"}}]}}
+        }
+    }
+
+    response = incidents_client.get("/incidents-overview")
+
+    assert response.status_code == 200
+    metrics = response.json()["metrics"]
+    assert mock_incidents_es.search.call_count == 1
+    assert mock_incidents_es.search.call_args.kwargs["body"]["size"] == 0
+    assert metrics["severityCounts"] == [2, 0, 4, 0]
+    # 3 uncategorized incidents spread evenly over the 4 categories
+    assert metrics["typeCounts"] == [3, 2, 1, 0]
+    assert len(metrics["timestamps"]) == 6
+    assert metrics["incidentCount"] == [0, 0, 0, 0, 0, 5]
+    assert metrics["resolutionTimes"] == [0, 0, 0, 0, 0, 2]
+    assert response.json()["summary"][0]["color"] == "danger"
+    assert mock_incidents_es.search.call_args.kwargs["body"]["aggs"]["latest"]["top_hits"]["size"] == 4
+
+    # limit caps the latest incidents of the summary
+    incidents_client.get("/incidents-overview", params={"limit": 2})
+    assert mock_incidents_es.search.call_args.kwargs["body"]["aggs"]["latest"]["top_hits"]["size"] == 2
+
+
+# Test /latest_seven_days_incidents makes one round-trip and folds daily buckets onto weekdays
+def test_latest_seven_days_incidents_single_query(incidents_client, mock_incidents_es):
+    from datetime import datetime, timedelta
+
+    today = datetime.today()
+    week_ago = today - timedelta(days=7)  # Same weekday as today, folded into today's bucket
+    response_body = {
+        "hits": {"total": {"value": 20}, "hits": []},
+        "aggregations": {
+            "lastWeek": {"days": {"buckets": [
+                {"key_as_string": week_ago.strftime("%Y-%m-%d"), "doc_count": 1},
+                {"key_as_string": today.strftime("%Y-%m-%d"), "doc_count": 3}
+            ]}},
+            "resolved": {"resolutionHours": {"value": 10.123}},
+            "statuses": {"buckets": {"New": {"doc_count": 5}, "Resolved": {"doc_count": 3},
+                                     "Closed": {"doc_count": 2}, "Unresolved": {"doc_count": 15}}}
+        }
+    }
+    mock_incidents_es.search.return_value = response_body
+
+    response = incidents_client.get("/latest_seven_days_incidents")
+
+    assert response.status_code == 200
+    assert mock_incidents_es.search.call_count == 1
+    body = response.json()
+    assert body["labels"][-1] == today.strftime("%A")
+    assert body["datasets"][0]["data"][-1] == 4
+    assert body["percentage"] == 20.0
+    assert body["averageResolutionTime"] == 10.12
+    assert body["incidentResolutionRate"] == 25.0
+    assert body["incidentStatusCounts"] == {"New": 5, "Resolved": 3, "Unresolved": 15, "Closed": 2}
+
+
+# Test dashboard responses are cached, reported in headers and invalidated by writes
+def test_dashboard_cache(incidents_client, mock_incidents_es):
+    mock_incidents_es.search.return_value = SEVEN_DAYS_RESPONSE
+
+    first = incidents_client.get("/latest_seven_days_incidents")
+    second = incidents_client.get("/latest_seven_days_incidents")
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert "X-Cache-Age" in second.headers
+    assert 0 < float(second.headers["X-Cache-Hit-Ratio"]) <= 1
+    assert second.json() == first.json()
+    assert mock_incidents_es.search.call_count == 1
+
+    mock_incidents_es.indices.exists.return_value = True
+    incidents_client.delete("/delete_index")
+    third = incidents_client.get("/latest_seven_days_incidents")
+    assert third.headers["X-Cache"] == "MISS"
+    assert mock_incidents_es.search.call_count == 2
+
+
+# Test a write handled by another worker (a marker bump from another process) drops this worker's cache
+def test_dashboard_cache_invalidated_by_other_worker(incidents_client, mock_incidents_es):
+    from app.routes import elasticIncidents
+    from app.routes.responseCache import SharedGeneration
+
+    mock_incidents_es.search.return_value = SEVEN_DAYS_RESPONSE
+    incidents_client.get("/latest_seven_days_incidents")
+    assert incidents_client.get("/latest_seven_days_incidents").headers["X-Cache"] == "HIT"
+
+    SharedGeneration(elasticIncidents.index_generation.path).bump()
+    assert incidents_client.get("/latest_seven_days_incidents").headers["X-Cache"] == "MISS"
+    assert incidents_client.get("/latest_seven_days_incidents").headers["X-Cache"] == "HIT"
+
+
+# Test cursor pagination and NDJSON streaming of /incident_list
+def test_incident_list_pagination_and_stream(incidents_client, mock_incidents_es):
+    import json
+
+    def page(ids):
+        return {"hits": {"hits": [{"_id": i, "sort": [i], "_source": {"IncidentId": i, "status": "New",
+                                                                      "priority": "High",
+                                                                      "createdDate": "2023-10-01T12:00:00"}}
+                                  for i in ids]}}
+
+    mock_incidents_es.open_point_in_time.return_value = {"id": "pit"}
+    mock_incidents_es.search.side_effect = [page(["INC1", "INC2"]), page(["INC3"])]
+
+    first = incidents_client.get("/incident_list", params={"page_size": 2}).json()
+    assert [i["incident"]["name"] for i in first["incidents"]] == ["INC1", "INC2"]
+    second = incidents_client.get("/incident_list", params={"page_size": 2, "cursor": first["nextCursor"]}).json()
+    assert [i["incident"]["name"] for i in second["incidents"]] == ["INC3"]
+    assert second["nextCursor"] is None
+
+    assert incidents_client.get("/incident_list", params={"cursor": "bad"}).status_code == 400
+
+    mock_incidents_es.search.side_effect = [page(["INC1"])]
+    response = incidents_client.get("/incident_list", params={"stream": "true"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["incident"]["name"] == "INC1"
+
+
+# Test hybrid search starts the BM25 query before the embedding is ready and fuses both result lists
+def test_similarity_search_hybrid_concurrent(incidents_client, mock_incidents_es):
+    import asyncio
+    from app.routes import elasticIncidents
+
+    calls = []
+
+    async def slow_embed(text):
+        await asyncio.sleep(0.01)
+        calls.append("embedding")
+        return [0.1] * 384
+
+    def search(index, body):
+        calls.append("knn" if "knn" in body or "knn" in body.get("query", {}) else "lexical")
+        doc = "a" if calls[-1] == "knn" else "b"
+        return {"hits": {"hits": [{"_id": doc, "_score": 1.0, "_source": {"title": doc}}]}}
+
+    mock_incidents_es.search.side_effect = search
+    with patch.object(elasticIncidents, "embed_text", slow_embed):
+        response = incidents_client.post("/similarity_search", params={"query_text": "router", "mode": "hybrid"})
+
+    assert response.status_code == 200
+    assert calls == ["lexical", "embedding", "knn"]
+    assert {hit["id"] for hit in response.json()} == {"a", "b"}
+
+
+# Test the in-process mirror answers plain kNN searches, and date math it cannot evaluate goes to Elasticsearch
+def test_similarity_search_mirror_date_math_fallback(incidents_client, mock_incidents_es, monkeypatch):
+    from app.routes import elasticIncidents
+    from app.routes.vectorIndex import IncidentVectorIndex
+
+    mirror = IncidentVectorIndex(dims=384)
+    mirror.upsert(["m1"], [[0.1] * 384], [{"title": "mirrored", "createdDate": "2024-01-01T00:00:00"}])
+    mirror.ready = True
+    monkeypatch.setattr(elasticIncidents, "VECTOR_MIRROR_ENABLED", True)
+    monkeypatch.setattr(elasticIncidents, "vector_index", mirror)
+
+    async def embed(text):
+        return [0.1] * 384
+
+    mock_incidents_es.search.return_value = {"hits": {"hits": [{"_id": "e1", "_score": 1.0,
+                                                                 "_source": {"title": "from es"}}]}}
+    with patch.object(elasticIncidents, "embed_text", embed):
+        mirrored = incidents_client.post("/similarity_search", params={"query_text": "router"})
+        fallback = incidents_client.post("/similarity_search",
+                                         params={"query_text": "router", "created_from": "now-7d/d"})
+
+    assert [hit["id"] for hit in mirrored.json()] == ["m1"]
+    assert [hit["id"] for hit in fallback.json()] == ["e1"]
+    mock_incidents_es.search.assert_called_once()
+
+
+# Test single lookups use an exact term query for IncidentId and a document get for sysId
+def test_get_incident_by_id_exact(incidents_client, mock_incidents_es):
+    from elasticsearch import NotFoundError
+
+    mock_incidents_es.search.return_value = {"hits": {"hits": [{"_source": {"IncidentId": "INC-1"}}]}}
+    response = incidents_client.get("/incidents_elastic", params={"incident_id": "INC-1"})
+    assert response.json() == {"IncidentId": "INC-1"}
+    body = mock_incidents_es.search.call_args.kwargs["body"]
+    assert body["query"]["bool"]["filter"] == [{"terms": {"IncidentId.keyword": ["INC-1"]}}]
+
+    mock_incidents_es.get.return_value = {"_source": {"sysId": "abc"}}
+    assert incidents_client.get("/incidents_elastic", params={"sys_id": "abc"}).json() == {"sysId": "abc"}
+
+    mock_incidents_es.get.side_effect = NotFoundError("not found", MagicMock(status=404), {})
+    assert incidents_client.get("/incidents_elastic", params={"sys_id": "gone"}).json() is None
+    assert incidents_client.get("/incidents_elastic").status_code == 400
+
+
+# Test incidents indexed before the keyword subfield are still found through the legacy match query
+def test_incident_lookups_legacy_fallback(incidents_client, mock_incidents_es):
+    missed = {"hits": {"hits": []}}
+    legacy = {"hits": {"hits": [{"_id": "old", "_source": {"IncidentId": "INC-10"}},
+                                {"_id": "older", "_source": {"IncidentId": "INC-1"}}]}}
+
+    mock_incidents_es.search.side_effect = [missed, legacy]
+    response = incidents_client.get("/incidents_elastic", params={"incident_id": "INC-1"})
+    assert response.json() == {"IncidentId": "INC-1"}
+
+    mock_incidents_es.search.side_effect = [missed, legacy]
+    response = incidents_client.post("/incidents_elastic/batch", json={"incidentIds": ["INC-1", "INC-2"]})
+    assert response.json()["incidentIds"] == {"INC-1": {"IncidentId": "INC-1"}, "INC-2": None}
+
+    similar = {"hits": {"hits": [{"_id": "def", "_score": 0.9, "_source": {"title": "Router flapping"}}]}}
+    mock_incidents_es.search.side_effect = [missed, legacy, similar]
+    response = incidents_client.get("/similar_incidents", params={"incident_id": "INC-1"})
+    assert response.status_code == 200
+    assert response.json()["source"]["id"] == "older"
+
+    mock_incidents_es.search.side_effect = [missed, {"hits": {"hits": [{"_source": {"IncidentId": "INC-10"}}]}}]
+    assert incidents_client.get("/similar_incidents", params={"incident_id": "INC-1"}).status_code == 404
+
+
+# Test the batch lookup resolves IncidentIds and sysIds in one request each and reports unknown ids
+def test_get_incidents_by_ids(incidents_client, mock_incidents_es):
+    mock_incidents_es.search.return_value = {"hits": {"hits": [{"_source": {"IncidentId": "INC-2"}}]}}
+    mock_incidents_es.mget.return_value = {"docs": [{"_id": "a", "found": True, "_source": {"sysId": "a"}},
+                                                    {"_id": "b", "found": False}]}
+
+    response = incidents_client.post("/incidents_elastic/batch",
+                                     json={"incidentIds": ["INC-1", "INC-2", "INC-2"], "sysIds": ["a", "b"]})
+    assert response.status_code == 200
+    assert response.json() == {
+        "incidentIds": {"INC-1": None, "INC-2": {"IncidentId": "INC-2"}},
+        "sysIds": {"a": {"sysId": "a"}, "b": None},
+        "missing": ["INC-1", "b"]
+    }
+    # INC-1 was missed by the terms query: one legacy match lookup for it
+    assert mock_incidents_es.search.call_count == 2
+    legacy = mock_incidents_es.search.call_args.kwargs["body"]["query"]["bool"]["should"]
+    assert len(legacy) == 1
+    assert mock_incidents_es.mget.call_args.kwargs["ids"] == ["a", "b"]
+
+    too_many = {"incidentIds": [f"INC-{i}" for i in range(1001)]}
+    assert incidents_client.post("/incidents_elastic/batch", json=too_many).status_code == 400
+
+
+# Test batch similarity search encodes once, sends one msearch and groups results per query
+def test_similarity_search_batch(incidents_client, mock_incidents_es):
+    import numpy as np
+    from app.routes import elasticIncidents
+
+    def hit(doc_id, score):
+        return {"_id": doc_id, "_score": score, "_source": {"title": doc_id}}
+
+    mock_incidents_es.msearch.return_value = {"responses": [
+        {"hits": {"hits": [hit("a", 0.9), hit("b", 0.8)]}},
+        {"error": {"type": "search_phase_execution_exception"}},
+        {"hits": {"hits": [hit("b", 0.7)]}}
+    ]}
+    encode = MagicMock(return_value=np.full((3, 384), 0.1, dtype=np.float32))
+    with patch.object(elasticIncidents, "generate_embeddings", encode):
+        response = incidents_client.post("/similarity_search/batch", json={
+            "queries": [{"queryText": "kafka lag", "size": 2},
+                        {"queryText": "disk full", "priority": ["High"]},
+                        {"queryText": "consumer lag"}],
+            "dedupe": True
+        })
+
+    assert response.status_code == 200
+    encode.assert_called_once_with(["kafka lag", "disk full", "consumer lag"])
+    searches = mock_incidents_es.msearch.call_args.kwargs["searches"]
+    assert len(searches) == 6
+    assert searches[3]["knn"]["filter"] == [{"terms": {"priority": ["High"]}}]
+
+    body = response.json()
+    assert [[h["id"] for h in result["hits"]] for result in body["results"]] == [["a", "b"], [], ["b"]]
+    assert "error" in body["results"][1]
+    assert body["merged"][0]["id"] == "b"
+    assert body["merged"][0]["queries"] == [0, 2]
+
+    assert incidents_client.post("/similarity_search/batch", json={"queries": []}).status_code == 400
+
+
+# Test similar incidents reuse the stored vector and fall back to more_like_this without one
+def test_similar_incidents(incidents_client, mock_incidents_es):
+    from app.routes import elasticIncidents
+
+    source = {"_id": "abc", "_source": {"IncidentId": "INC-1", "title": "Router down", "embedding": [0.1] * 384}}
+    similar = {"hits": {"hits": [{"_id": "def", "_score": 0.9, "_source": {"title": "Router flapping"}}]}}
+    mock_incidents_es.search.side_effect = [{"hits": {"hits": [source]}}, similar]
+
+    with patch.object(elasticIncidents, "embed_text") as embed:
+        response = incidents_client.get("/similar_incidents", params={"incident_id": "INC-1", "size": 5})
+    embed.assert_not_called()
+    assert response.status_code == 200
+    assert response.json()["method"] == "knn"
+    assert response.json()["source"] == {"id": "abc", "IncidentId": "INC-1", "title": "Router down"}
+    assert [hit["id"] for hit in response.json()["hits"]] == ["def"]
+    knn = mock_incidents_es.search.call_args.kwargs["body"]["knn"]
+    assert knn["filter"] == [{"bool": {"must_not": [{"ids": {"values": ["abc"]}}]}}]
+
+    no_vector = {"_id": "abc", "_source": {"IncidentId": "INC-1"}}
+    mock_incidents_es.search.side_effect = [{"hits": {"hits": [no_vector]}}, similar]
+    response = incidents_client.get("/similar_incidents", params={"sys_id": "abc"})
+    assert response.json()["method"] == "more_like_this"
+
+    mock_incidents_es.search.side_effect = [{"hits": {"hits": []}}]
+    assert incidents_client.get("/similar_incidents", params={"sys_id": "gone"}).status_code == 404
+
+
+# Test the semantic query cache serves repeated and rephrased questions without searching again
+def test_similarity_search_query_cache(incidents_client, mock_incidents_es):
+    from app.routes import elasticIncidents
+
+    async def embed(text):
+        return [1.0, 0.0] if "lag" in text else [0.0, 1.0]
+
+    mock_incidents_es.search.return_value = {"hits": {"hits": [{"_id": "a", "_score": 1.0, "_source": {}}]}}
+    with patch.object(elasticIncidents, "QUERY_CACHE_ENABLED", True), \
+            patch.object(elasticIncidents, "embed_text", side_effect=embed) as embed_text:
+        first = incidents_client.post("/similarity_search", params={"query_text": "kafka consumer lag"})
+        exact = incidents_client.post("/similarity_search", params={"query_text": "Kafka consumer  lag"})
+        rephrased = incidents_client.post("/similarity_search", params={"query_text": "consumer lag on kafka"})
+        other = incidents_client.post("/similarity_search", params={"query_text": "disk full"})
+
+        assert [r.headers["X-Query-Cache"] for r in (first, exact, rephrased, other)] == \
+            ["MISS", "EXACT", "SEMANTIC", "MISS"]
+        assert exact.json() == first.json()
+        assert mock_incidents_es.search.call_count == 2
+        assert embed_text.call_count == 3
+
+        elasticIncidents.invalidate_index_caches()
+        again = incidents_client.post("/similarity_search", params={"query_text": "kafka consumer lag"})
+        assert again.headers["X-Query-Cache"] == "MISS"
+
+
+EXCEPTION_PAYLOAD = {"sysId": "abc", "IncidentId": "INC-1", "title": "Router down", "description": "router crash",
+                     "rootCause": "power", "createdDate": "2024-01-01 10:00:00", "priority": "High"}
+
+
+# Test write-behind mode answers 202 with a tracking id, reports its status and answers 429 when full
+def test_add_exception_write_behind(incidents_client, mock_incidents_es):
+    from app.routes import elasticIncidents
+    from app.routes.writeBehind import QueueFullError
+
+    writer = MagicMock()
+    writer.submit.return_value = "t1"
+    writer.status.side_effect = lambda tracking_id: {"status": "queued"} if tracking_id == "t1" else None
+    with patch.object(elasticIncidents, "exception_writer", writer):
+        response = incidents_client.post("/add_exception", params={"write_behind": "true"}, json=EXCEPTION_PAYLOAD)
+        assert response.status_code == 202
+        assert response.json()["trackingId"] == "t1"
+        assert writer.submit.call_args.args[0]["createdDate"] == "2024-01-01T10:00:00"
+        mock_incidents_es.index.assert_not_called()
+
+        assert incidents_client.get("/add_exception/status/t1").json() == {"trackingId": "t1", "status": "queued"}
+        assert incidents_client.get("/add_exception/status/t2").status_code == 404
+
+        writer.submit.side_effect = QueueFullError("full")
+        response = incidents_client.post("/add_exception", params={"write_behind": "true"}, json=EXCEPTION_PAYLOAD)
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+
+        bad_date = {**EXCEPTION_PAYLOAD, "createdDate": "01/01/2024"}
+        response = incidents_client.post("/add_exception", params={"write_behind": "true"}, json=bad_date)
+        assert response.status_code == 400
+
+
+# Test a write-behind flush encodes the batch once and bulk indexes it, reporting per-record failures
+def test_write_exception_batch(mock_incidents_es):
+    import numpy as np
+    from app.routes import elasticIncidents
+
+    records = [{**EXCEPTION_PAYLOAD, "createdDate": "2024-01-01T10:00:00"},
+               {**EXCEPTION_PAYLOAD, "sysId": "def", "createdDate": "2024-01-01T10:00:00"}]
+    encode = MagicMock(return_value=np.full((2, 384), 0.1, dtype=np.float32))
+    bulk = MagicMock(return_value=(1, [{"sysId": "def", "error": "mapper_parsing_exception"}], {"def"}))
+    elasticIncidents.warmup_state["indexPresent"] = True
+    with patch.object(elasticIncidents, "generate_embeddings", encode), \
+            patch.object(elasticIncidents, "bulk_index_documents", bulk):
+        errors = elasticIncidents.write_exception_batch(records)
+
+    assert errors == [None, "mapper_parsing_exception"]
+    encode.assert_called_once_with(["router crash", "router crash"])
+    docs = bulk.call_args.args[2]
+    assert [doc["sysId"] for doc in docs] == ["abc", "def"]
+    assert docs[0]["category"] == "Network"
+    assert len(docs[0]["embedding"]) == 384
+
+
+# Test the on-disk embedding cache is opened by the startup hook, at the configured path
+def test_embedding_cache_opened_at_startup(tmp_path, monkeypatch):
+    from app.routes import elasticIncidents
+
+    path = tmp_path / "embeddings.sqlite3"
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(path))
+    monkeypatch.setattr(elasticIncidents, "embedding_cache", None)
+    assert not path.exists()
+
+    elasticIncidents.start_embedding_cache()
+    assert elasticIncidents.embedding_cache.db_path == str(path)
+    assert path.exists()
+    elasticIncidents.embedding_cache.close()
+
+
+# Test the write-behind queue and its spill journal are created by the startup hook, not at import
+def test_exception_writer_created_at_startup(tmp_path, monkeypatch):
+    from app.routes import elasticIncidents
+
+    path = str(tmp_path / "spill.jsonl")
+    monkeypatch.setattr(elasticIncidents, "ADD_EXCEPTION_SPILL_PATH", path)
+    monkeypatch.setattr(elasticIncidents, "exception_writer", None)
+
+    elasticIncidents.start_exception_writer()
+    writer = elasticIncidents.exception_writer
+    assert writer.spill.path.startswith(f"{path}.")
+    assert os.path.exists(f"{writer.spill.path}.lock")
+    elasticIncidents.stop_exception_writer()
+    assert not os.path.exists(f"{writer.spill.path}.lock")
+
+
+# Test PUT /categories rejects mappings whose values are not non-empty lists of keyword strings
+def test_put_categories_validation(incidents_client, mock_incidents_es):
+    from app.routes import incidentCategories
+
+    active = incidentCategories.get_categorizer()
+    for mapping in ({"Network": "router"}, {"Network": []}, {"Network": [""]}, {"Network": [1]}):
+        response = incidents_client.put("/categories", json={"mapping": mapping})
+        assert response.status_code == 422
+    assert incidentCategories.get_categorizer() is active
+
+
+# Test the dashboards average the stored resolution fields only once no document lacks them
+def test_seven_days_uses_derived_fields_when_complete(incidents_client, mock_incidents_es, monkeypatch):
+    from app.routes import elasticIncidents
+
+    monkeypatch.setattr(elasticIncidents, "derived_fields_state", {"complete": False, "checkedAt": None})
+    mock_incidents_es.search.return_value = SEVEN_DAYS_RESPONSE
+    mock_incidents_es.count.return_value = {"count": 3}
+    incidents_client.get("/latest_seven_days_incidents")
+    resolution = mock_incidents_es.search.call_args.kwargs["body"]["aggs"]["resolved"]["aggs"]["resolutionHours"]
+    assert "script" in resolution["avg"]
+
+    # Backfill done (e.g. by another worker): the next check after the recheck interval switches over
+    mock_incidents_es.count.return_value = {"count": 0}
+    elasticIncidents.derived_fields_state["checkedAt"] = None
+    elasticIncidents.invalidate_index_caches()
+    incidents_client.get("/latest_seven_days_incidents")
+    resolution = mock_incidents_es.search.call_args.kwargs["body"]["aggs"]["resolved"]["aggs"]["resolutionHours"]
+    assert resolution == {"avg": {"field": "resolutionHours"}}
+    assert mock_incidents_es.count.call_args.kwargs["query"]["bool"]["must_not"][0]["term"]["derivedVersion"] == 2
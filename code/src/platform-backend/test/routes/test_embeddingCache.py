@@ -0,0 +1,77 @@
+import numpy as np
+from unittest.mock import MagicMock
+
+from app.routes.embeddingCache import EmbeddingCache, normalize_text
+
+
+def fake_encode(texts):
+    return np.array([[float(len(text)), 1.0, 2.0] for text in texts], dtype=np.float32)
+
+
+# Test keys ignore whitespace differences but include the model name
+def test_key_normalization():
+    cache = EmbeddingCache("model-a", db_path=None)
+    other = EmbeddingCache("model-b", db_path=None)
+    assert normalize_text("  kafka   consumer\nlag ") == "kafka consumer lag"
+    assert cache.key("kafka consumer lag") == cache.key(" kafka  consumer lag\n")
+    assert cache.key("kafka consumer lag") != other.key("kafka consumer lag")
+
+
+# Test only misses are encoded, and in one batch
+def test_encode_only_misses():
+    cache = EmbeddingCache("model", db_path=None)
+    encode = MagicMock(side_effect=fake_encode)
+
+    first = cache.encode(["a", "bb", "a"], encode)
+    second = cache.encode(["a", "bb", "ccc"], encode)
+
+    assert encode.call_count == 2
+    assert encode.call_args_list[0][0][0] == ["a", "bb"]
+    assert encode.call_args_list[1][0][0] == ["ccc"]
+    assert first.shape == (3, 3)
+    np.testing.assert_array_equal(second[:, 0], [1.0, 2.0, 3.0])
+    stats = cache.stats()
+    assert stats["misses"] == 4
+    assert stats["memoryHits"] == 2
+
+
+# Test the memory tier stays within its byte budget
+def test_memory_budget_evicts_lru():
+    cache = EmbeddingCache("model", db_path=None, max_bytes=3 * (12 + 160))
+    cache.put_many(["a", "b", "c"], fake_encode(["a", "b", "c"]))
+    cache.get("a")
+    cache.put("d", fake_encode(["d"])[0])
+
+    stats = cache.stats()
+    assert stats["memoryEntries"] == 3
+    assert stats["memoryBytes"] <= cache.max_bytes
+    assert cache.peek("b") is None
+    assert cache.peek("a") is not None
+
+
+# Test cached vectors are copies, not views that keep (or alias) the caller's buffer
+def test_put_many_stores_copies():
+    cache = EmbeddingCache("model", db_path=None)
+    matrix = np.ones((1000, 3), dtype=np.float32)
+    cache.put_many(["a"], matrix[:1])
+    matrix[:] = 0
+
+    cached = cache.peek("a")
+    assert cached.base is None
+    np.testing.assert_array_equal(cached, [1.0, 1.0, 1.0])
+    assert cache.stats()["memoryBytes"] == 12 + 160
+
+
+# Test the disk tier survives a restart
+def test_disk_tier_persists(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache("model", db_path=path)
+    cache.put("incident text", [0.5, 0.25, 0.125])
+    cache.close()
+
+    reopened = EmbeddingCache("model", db_path=path)
+    np.testing.assert_array_equal(reopened.get("incident  text"), [0.5, 0.25, 0.125])
+    stats = reopened.stats()
+    assert stats["diskHits"] == 1
+    assert stats["diskEntries"] == 1
+    reopened.close()
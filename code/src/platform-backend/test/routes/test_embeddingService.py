@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.routes.embeddingService import EmbeddingService
+
+
+# Encoder that blocks until released so requests pile up in the queue
+class GatedEncoder:
+    def __init__(self):
+        self.gate = threading.Event()
+        self.batches = []
+
+    def __call__(self, texts):
+        self.gate.wait(2)
+        self.batches.append(list(texts))
+        return [[float(len(text))] * 3 for text in texts]
+
+
+@pytest.fixture
+def encoder():
+    return GatedEncoder()
+
+
+@pytest.fixture
+def service(encoder):
+    svc = EmbeddingService(encoder, max_batch_size=8, max_wait_ms=50)
+    yield svc
+    encoder.gate.set()
+    svc.stop()
+
+
+# Test concurrent requests are grouped into a single batch
+def test_concurrent_requests_are_batched(service, encoder):
+    async def run():
+        tasks = [asyncio.ensure_future(service.encode("x" * i)) for i in range(1, 6)]
+        await asyncio.sleep(0.01)
+        encoder.gate.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(run())
+
+    assert results == [[float(i)] * 3 for i in range(1, 6)]
+    assert sum(len(batch) for batch in encoder.batches) == 5
+    assert len(encoder.batches) <= 2
+    stats = service.stats()
+    assert stats["requests"] == 5
+    assert stats["maxBatchSize"] >= 4
+    assert stats["queueDepth"] == 0
+
+
+# Test batches never exceed max_batch_size
+def test_max_batch_size_is_respected(service, encoder):
+    futures = [service.submit(str(i)) for i in range(20)]
+    encoder.gate.set()
+    assert [f.result(2) for f in futures] == [[1.0] * 3] * 10 + [[2.0] * 3] * 10
+    assert max(len(batch) for batch in encoder.batches) <= 8
+
+
+# Test encoder errors are propagated to every caller of the batch
+def test_encoder_error_is_propagated():
+    def failing(texts):
+        raise RuntimeError("model unavailable")
+
+    svc = EmbeddingService(failing, max_wait_ms=1)
+    try:
+        with pytest.raises(RuntimeError):
+            svc.encode_sync("text", timeout=2)
+        assert svc.stats()["failedBatches"] == 1
+    finally:
+        svc.stop()
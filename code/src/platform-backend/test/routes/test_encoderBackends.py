@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from app.routes.encoderBackends import EncoderBackend, length_bucketed_batches, create_encoder
+
+TEXTS = [
+    "Database connection timeout",
+    "Title: Router down. Description: Core router in DC1 stopped forwarding packets after a firmware update, "
+    "causing network latency across all services. Root Cause: faulty firmware. Priority: High. Status: New.",
+    "Disk full",
+    "Title: Phishing. Description: Several users reported a phishing email asking for VPN credentials. "
+    "Root Cause: unknown. Priority: Medium. Status: Resolved.",
+]
+
+
+# Encoder returning the text length so batching can be checked without a model
+class LengthEncoder(EncoderBackend):
+    name = "length"
+
+    def __init__(self):
+        super().__init__("fake")
+        self.batches = []
+
+    def _encode_batch(self, texts):
+        self.batches.append(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+# Test batches group texts of similar length
+def test_length_bucketed_batches():
+    batches = list(length_bucketed_batches(TEXTS, batch_size=2))
+    assert [positions for positions, _ in batches] == [[2, 0], [3, 1]]
+
+
+# Test results are returned in the caller's order
+def test_encode_restores_order():
+    encoder = LengthEncoder()
+    vectors = encoder.encode(TEXTS, batch_size=2)
+    np.testing.assert_array_equal(vectors[:, 0], [len(text) for text in TEXTS])
+    assert encoder.batches[0] == ["Disk full", "Database connection timeout"]
+    assert encoder.encode("single").shape == (2,)
+
+
+# Test unknown backends are rejected
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_encoder("tensorrt", "all-MiniLM-L6-v2")
+
+
+# Test the ONNX backend matches the PyTorch backend within tolerance
+def test_onnx_matches_torch(tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("sentence_transformers")
+    hub = pytest.importorskip("huggingface_hub")
+    if not hub.try_to_load_from_cache("sentence-transformers/all-MiniLM-L6-v2", "config.json"):
+        pytest.skip("all-MiniLM-L6-v2 is not in the local Hugging Face cache")
+
+    torch_encoder = create_encoder("torch", "all-MiniLM-L6-v2", threads=2)
+    onnx_encoder = create_encoder("onnx", "all-MiniLM-L6-v2", threads=2,
+                                  onnx_path=str(tmp_path / "all-MiniLM-L6-v2.onnx"))
+
+    expected = torch_encoder.encode(TEXTS)
+    actual = onnx_encoder.encode(TEXTS, batch_size=2)
+
+    assert np.max(np.abs(expected - actual)) < 1e-4
+    assert np.min(np.sum(expected * actual, axis=1)) > 0.9999
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from app.routes.hitTransforms import (parse_dates, activity_strings, progress_values, status_colors,
+                                      resolution_hours, weekday_counts, format_incident_list)
+
+NOW = pd.Timestamp("2023-10-10T12:00:00", tz="UTC")
+
+
+def hit(incident_id, created, status="New", priority="High"):
+    return {"_source": {"IncidentId": incident_id, "createdDate": created, "status": status, "priority": priority}}
+
+
+# Test relative activity strings for every unit and missing dates
+def test_activity_strings():
+    created = parse_dates(["2023-10-10T11:59:30", "2023-10-10T11:15:00", "2023-10-10T07:00:00",
+                           "2023-10-07T12:00:00", None, "garbage"])
+    assert list(activity_strings(created, NOW)) == ["30 sec ago", "45 min ago", "5 hrs ago", "3 days ago", None,
+                                                    None]
+
+
+# Test progress values stay in each status' range and colors match the per-row helper
+def test_progress_and_colors():
+    statuses = ["New", "Closed", "Resolved", "Unresolved", "On Hold"] * 20
+    values = progress_values(statuses, np.random.default_rng(0)).reshape(-1, 5)
+    assert (values[:, 0] == 0).all() and (values[:, 1] == 100).all()
+    assert values[:, 2].min() >= 70 and values[:, 2].max() <= 90
+    assert values[:, 3].min() >= 40 and values[:, 3].max() <= 60
+    assert values[:, 4].min() >= 10 and values[:, 4].max() <= 30
+    assert list(status_colors(["New", "Closed", "On Hold"])) == ["blue", "gray", "yellow"]
+
+
+# Test resolution hours and weekday folding
+def test_resolution_hours_and_weekdays():
+    created = parse_dates(["2023-10-02T08:00:00", "2023-10-02T08:00:00"])
+    closed = parse_dates(["2023-10-03T14:30:00", None])
+    hours = resolution_hours(created, closed)
+    assert hours[0] == 30.5 and np.isnan(hours[1])
+
+    days = parse_dates(["2023-10-02T00:00:00", "2023-10-09T00:00:00", "2023-10-03T00:00:00"])
+    assert weekday_counts(days, [1, 2, 5], ["Monday", "Tuesday", "Sunday"]) == [3, 5, 0]
+
+
+# Test the page transform produces the original /incident_list row shape
+def test_format_incident_list():
+    rows = format_incident_list([hit("INC1", "2023-10-09T12:00:00"), hit("INC2", "2023-10-10T11:00:00", "Closed")],
+                                now=NOW)
+    assert rows[0] == {
+        "avatar": {"src": "avatar1.png", "status": "success"},
+        "incident": {"name": "INC1", "new": True, "registered": "2023-10-09T12:00:00"},
+        "progress": {"value": 0, "period": "2023-10-09T12:00:00", "color": "blue"},
+        "priority": "High",
+        "activity": "1 days ago"
+    }
+    assert rows[1]["progress"] == {"value": 100, "period": "2023-10-10T11:00:00", "color": "gray"}
+    assert rows[1]["activity"] == "1 hrs ago"
+    assert format_incident_list([]) == []
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from app.routes.incidentAggregations import (month_starts, category_filters, build_overview_query,
+                                             build_seven_days_query, even_split)
+
+
+# Test the last six calendar months wrap around the year boundary
+def test_month_starts():
+    months = month_starts(datetime(2024, 2, 15))
+    assert [m.strftime("%Y-%m") for m in months] == ["2023-09", "2023-10", "2023-11", "2023-12", "2024-01",
+                                                     "2024-02"]
+
+
+# Test categories use the stored category, else exclusive keyword matches in mapping order
+def test_category_filters():
+    filters = category_filters({"Network": ["router"], "Hardware": ["hard disk"]})
+    stored, unstored = filters["Hardware"]["bool"]["should"]
+    assert stored == {"term": {"category": "Hardware"}}
+    network_keywords = filters["Network"]["bool"]["should"][1]["bool"]["filter"][0]
+    assert unstored["bool"]["must_not"] == [{"exists": {"field": "category"}}, network_keywords]
+    assert unstored["bool"]["filter"][0]["bool"]["should"][0] == {"match_phrase": {"description": "hard disk"}}
+
+
+# Test the overview is a single size-0 aggregation query
+def test_build_overview_query():
+    body = build_overview_query({"Network": ["router"]}, datetime(2024, 2, 15))
+    assert body["size"] == 0
+    assert set(body["aggs"]) == {"severity", "types", "recent", "latest"}
+    assert body["aggs"]["latest"]["top_hits"]["size"] == 4
+    assert body["aggs"]["recent"]["aggs"]["months"]["date_histogram"]["extended_bounds"] == {"min": "2023-09",
+                                                                                             "max": "2024-02"}
+    resolved = body["aggs"]["recent"]["aggs"]["months"]["aggs"]["resolved"]["aggs"]
+    assert "script" in resolved["resolutionDays"]["avg"]
+    body = build_overview_query({"Network": ["router"]}, datetime(2024, 2, 15), derived_fields=True)
+    resolved = body["aggs"]["recent"]["aggs"]["months"]["aggs"]["resolved"]["aggs"]
+    assert resolved["resolutionDays"] == {"avg": {"field": "resolutionDays"}}
+
+
+# Test resolution averages are scripted unless every document is known to carry the derived fields
+def test_resolution_averages():
+    assert "script" in build_seven_days_query()["aggs"]["resolved"]["aggs"]["resolutionHours"]["avg"]
+    assert build_seven_days_query(derived_fields=True)["aggs"]["resolved"]["aggs"]["resolutionHours"] == \
+        {"avg": {"field": "resolutionHours"}}
+
+
+# Test even distribution of a remainder
+def test_even_split():
+    assert even_split(7, ["a", "b", "c"]) == {"a": 3, "b": 2, "c": 2}
+    assert even_split(0, ["a", "b"]) == {"a": 0, "b": 0}
@@ -0,0 +1,154 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from unittest.mock import patch, MagicMock
+
+from app.routes import incidentBackfill
+from app.routes.embeddingCache import EmbeddingCache
+from app.routes.incidentBackfill import Checkpoint, _encode_chunk, read_shared_vectors, run_backfill
+
+CSV_HEADER = "sysId,IncidentId,title,description,rootCause,createdDate,priority,status,closedDate\n"
+
+
+class FakeEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[float(len(text))] * 4 for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def mock_elasticsearch():
+    es = MagicMock()
+    es.indices.exists.return_value = True
+    es.indices.get_settings.return_value = {}
+    yield es
+
+
+@pytest.fixture
+def incident_csv(tmp_path):
+    rows = [f"{i},INC{i},Title {i},Description {i},Cause,2024-01-01 10:00:00,High,New,\n" for i in range(5)]
+    path = tmp_path / "incidents.csv"
+    path.write_text(CSV_HEADER + "".join(rows))
+    return str(path)
+
+
+# Bulk helper replacement recording every action it receives
+class FakeStreamingBulk:
+    def __init__(self, failing_ids=()):
+        self.actions = []
+        self.failing_ids = set(failing_ids)
+
+    def __call__(self, client, actions, **kwargs):
+        for action in actions:
+            self.actions.append(action)
+            if action["_id"] in self.failing_ids:
+                yield False, {"index": {"_id": action["_id"], "error": {"type": "es_rejected_execution_exception"}}}
+            else:
+                yield True, {"index": {"_id": action["_id"]}}
+
+
+# Test vectors travel through shared memory
+def test_encode_chunk_shared_memory():
+    incidentBackfill._worker_encoder = FakeEncoder()
+    chunk_number, name, shape = _encode_chunk(3, ["a", "bbb"])
+
+    vectors, block = read_shared_vectors(name, shape)
+    try:
+        assert chunk_number == 3
+        np.testing.assert_array_equal(vectors[:, 0], [1.0, 3.0])
+    finally:
+        block.close()
+        block.unlink()
+
+
+# Test the checkpoint is only reused for the same file and chunk size
+def test_checkpoint_resume(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path, "incidents.csv", 100)
+    checkpoint.mark(0)
+    checkpoint.mark(2)
+
+    assert Checkpoint(path, "incidents.csv", 100).completed == {0, 2}
+    assert Checkpoint(path, "incidents.csv", 50).completed == set()
+    assert json.load(open(path))["completed"] == [0, 2]
+
+
+# Test a backfill indexes every chunk, checkpoints it and skips completed chunks on resume
+def test_run_backfill_resumes(tmp_path, mock_elasticsearch, incident_csv):
+    encoder = FakeEncoder()
+    bulk = FakeStreamingBulk()
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    Checkpoint(checkpoint_path, incident_csv, 2).mark(1)
+
+    with patch.object(incidentBackfill, "ProcessPoolExecutor", ThreadPoolExecutor), \
+            patch.object(incidentBackfill, "create_encoder", return_value=encoder), \
+            patch("app.routes.incidentIngest.helpers.streaming_bulk", bulk):
+        report = run_backfill(mock_elasticsearch, "incidents_final", incident_csv, chunk_size=2, workers=2,
+                              checkpoint_path=checkpoint_path, log=lambda message: None)
+
+    assert report["totalRows"] == 5
+    assert report["skippedChunks"] == 1
+    assert report["indexed"] == 3
+    assert sorted(action["_id"] for action in bulk.actions) == ["0", "1", "4"]
+    assert Checkpoint(checkpoint_path, incident_csv, 2).completed == {0, 1, 2}
+
+
+# Test a chunk with bulk failures is not checkpointed, so the next run retries it
+def test_run_backfill_does_not_checkpoint_failed_chunks(tmp_path, mock_elasticsearch, incident_csv):
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    with patch.object(incidentBackfill, "ProcessPoolExecutor", ThreadPoolExecutor), \
+            patch.object(incidentBackfill, "create_encoder", return_value=FakeEncoder()), \
+            patch("app.routes.incidentIngest.helpers.streaming_bulk", FakeStreamingBulk(failing_ids={"3"})):
+        report = run_backfill(mock_elasticsearch, "incidents_final", incident_csv, chunk_size=2, workers=1,
+                              checkpoint_path=checkpoint_path, log=lambda message: None)
+
+    assert (report["indexed"], report["failed"]) == (4, 1)
+    assert report["retryChunks"] == [1]
+    assert Checkpoint(checkpoint_path, incident_csv, 2).completed == {0, 2}
+
+
+# Test cached embeddings are not sent to the encoder workers
+def test_run_backfill_uses_cache(mock_elasticsearch, incident_csv):
+    encoder = FakeEncoder()
+    bulk = FakeStreamingBulk()
+    cache = EmbeddingCache("all-MiniLM-L6-v2", db_path=None)
+    cache.put("Title: Title 0. Description: Description 0. Root Cause: Cause. Priority: High. Status: New.",
+              [9.0] * 4)
+
+    with patch.object(incidentBackfill, "ProcessPoolExecutor", ThreadPoolExecutor), \
+            patch.object(incidentBackfill, "create_encoder", return_value=encoder), \
+            patch("app.routes.incidentIngest.helpers.streaming_bulk", bulk):
+        report = run_backfill(mock_elasticsearch, "incidents_final", incident_csv, chunk_size=10, workers=1,
+                              cache=cache, log=lambda message: None)
+
+    assert report["indexed"] == 5
+    assert sum(len(call) for call in encoder.calls) == 4
+    first_doc = next(action for action in bulk.actions if action["_id"] == "0")
+    assert first_doc["_source"]["embedding"] == [9.0] * 4
+
+
+# Test vectors cached from one chunk stay valid after its shared memory block is unlinked
+def test_run_backfill_cache_outlives_shared_memory(tmp_path, mock_elasticsearch):
+    path = tmp_path / "incidents.csv"
+    path.write_text(CSV_HEADER + "".join(f"{i},INC{i},Same title,Same description,Cause,2024-01-01 10:00:00,"
+                                         f"High,New,\n" for i in range(3)))
+    encoder = FakeEncoder()
+    bulk = FakeStreamingBulk()
+    cache = EmbeddingCache("all-MiniLM-L6-v2", db_path=None)
+
+    with patch.object(incidentBackfill, "ProcessPoolExecutor", ThreadPoolExecutor), \
+            patch.object(incidentBackfill, "create_encoder", return_value=encoder), \
+            patch("app.routes.incidentIngest.helpers.streaming_bulk", bulk):
+        run_backfill(mock_elasticsearch, "incidents_final", str(path), chunk_size=1, workers=1, cache=cache,
+                     log=lambda message: None)
+
+    embeddings = [action["_source"]["embedding"] for action in bulk.actions]
+    assert len(encoder.calls[0]) == 1
+    assert embeddings[0] == embeddings[1] == embeddings[2]
+    assert embeddings[0][0] > 0
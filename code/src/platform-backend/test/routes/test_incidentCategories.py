@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from app.routes import incidentCategories
+from app.routes.incidentCategories import Categorizer, CATEGORY_MAPPING, configure, keyword_centroids
+
+
+# Restore the default categorizer after tests that reconfigure it
+@pytest.fixture
+def restore_categorizer():
+    active = incidentCategories.get_categorizer()
+    yield
+    incidentCategories._active = active
+
+
+# Test the compiled categorizer keeps the first-category-wins rule of the original loop
+def test_first_category_wins():
+    categorizer = Categorizer(CATEGORY_MAPPING)
+    # "crash" (Software) appears before "router" (Network) in the text, Network is listed first
+    assert categorizer.categorize("Crash after the ROUTER firmware update") == "Network"
+    assert categorizer.categorize("Hard Disk failed") == "Hardware"
+    assert categorizer.categorize("nothing to see") is None
+    assert categorizer.categorize(None) is None
+
+
+# Test overlapping keywords and keywords sharing a start are all seen, like the substring checks of the loop
+def test_overlapping_keywords():
+    categorizer = Categorizer(CATEGORY_MAPPING)
+    # "server" (Hardware) overlaps "router" (Network)
+    assert categorizer.categorize("serverouter unreachable") == "Network"
+
+    # "update" starts where the shorter, higher-priority "up" does
+    assert Categorizer({"Availability": ["up"], "Software": ["update"]}).categorize("Update failed") == "Availability"
+
+
+# Test batches match the one-by-one loop of the original implementation
+def test_categorize_many_matches_loop():
+    descriptions = ["network latency", "power failure in DC", "phishing mail", "bug in update", "misc", ""]
+
+    def loop(description):
+        for category, keywords in CATEGORY_MAPPING.items():
+            if any(keyword in description.lower() for keyword in keywords):
+                return category
+        return None
+
+    assert Categorizer(CATEGORY_MAPPING).categorize_many(descriptions) == [loop(d) for d in descriptions]
+
+
+# Test the centroid fallback assigns uncategorized incidents by cosine similarity
+def test_centroid_fallback():
+    centroids = {"Network": [1.0, 0.0], "Hardware": [0.0, 1.0]}
+    categorizer = Categorizer({"Network": ["router"], "Hardware": ["server"]}, centroids, min_similarity=0.5)
+
+    result = categorizer.categorize_many(["router down", "odd noise", "odd noise", "odd noise"],
+                                         [[0.0, 1.0], [0.1, 0.9], [0.9, 0.1], [-1.0, 0.0]])
+
+    assert result == ["Network", "Hardware", "Network", None]
+
+
+# Test keyword centroids and runtime configuration
+def test_configure(restore_categorizer):
+    def encode(texts):
+        return np.eye(3, dtype=np.float32)[[0 if "a" in t else 1 for t in texts]]
+
+    centroids = keyword_centroids({"A": ["alpha", "beta"]}, encode)
+    assert np.allclose(centroids["A"], [1.0, 0.0, 0.0])
+
+    categorizer = configure({"Custom": ["widget"]}, centroid_fallback=True, encode_batch=encode)
+    assert incidentCategories.categorize("Widget broke") == "Custom"
+    assert categorizer.config()["centroidFallback"] is True
+
+    for invalid in ({"Empty": []}, {"Text": "router"}, {"Numbers": [1, 2]}, {"Blank": ["router", " "]},
+                    {"": ["router"]}):
+        with pytest.raises(ValueError):
+            configure(invalid)
+    assert incidentCategories.get_categorizer() is categorizer
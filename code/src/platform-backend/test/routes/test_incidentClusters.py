@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from unittest.mock import patch, MagicMock
+
+from app.routes.incidentClusters import (UnionFind, cluster_embeddings, cluster_incidents, order_for_incremental,
+                                         similar_pairs, write_cluster_ids)
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+# Three near-duplicates of one incident (a, b, c), one unrelated incident (d)
+IDS = ["a", "b", "c", "d"]
+MATRIX = np.vstack([unit(1, 0, 0), unit(1, 0.05, 0), unit(1, 0.1, 0), unit(0, 0, 1)])
+
+
+# Bulk helper replacement recording every action it receives
+@pytest.fixture
+def recorded_actions():
+    written = []
+
+    def streaming_bulk(es, actions, **kwargs):
+        for action in actions:
+            written.append(action)
+            yield True, {"update": {"_id": action["_id"]}}
+
+    with patch("app.routes.incidentIngest.helpers.streaming_bulk", streaming_bulk):
+        yield written
+
+
+# Test union-find joins transitively
+def test_union_find():
+    union_find = UnionFind(5)
+    assert union_find.union(0, 1)
+    assert union_find.union(1, 2)
+    assert not union_find.union(0, 2)
+    roots = union_find.roots()
+    assert roots[0] == roots[1] == roots[2]
+    assert len({roots[0], roots[3], roots[4]}) == 3
+
+
+# Test blocked similarities find exactly the pairs of a full similarity matrix, for any block size
+@pytest.mark.parametrize("block_size", [1, 2, 3, 64])
+def test_similar_pairs_match_brute_force(block_size):
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(20, 8)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix[5] = matrix[3]
+    matrix[17] = matrix[3]
+
+    similarities = matrix @ matrix.T
+    expected = {(row, col) for row in range(20) for col in range(row) if similarities[row, col] >= 0.5}
+    found = {(row, col) for rows, cols in similar_pairs(matrix, 0.5, block_size)
+             for row, col in zip(rows.tolist(), cols.tolist())}
+    assert found == expected
+    assert {(5, 3), (17, 3), (17, 5)} <= found
+
+
+# Test a full run labels each near-duplicate group with its smallest id and singletons with their own
+def test_cluster_embeddings_full():
+    labels, pairs = cluster_embeddings(IDS, MATRIX, threshold=0.99, block_size=2)
+    assert labels == ["a", "a", "a", "d"]
+    assert pairs == 3
+
+
+# Test incremental runs only compare new documents and keep existing cluster ids
+def test_cluster_embeddings_incremental():
+    ids, matrix, stored = order_for_incremental(["new", "b", "d"], MATRIX[[0, 1, 3]], [None, "x", "d"])
+    assert ids == ["b", "d", "new"]
+
+    labels, pairs = cluster_embeddings(ids, matrix, threshold=0.99, block_size=2, stored_labels=stored)
+    assert labels == ["x", "d", "x"]
+    assert pairs == 1
+
+
+# Test quantized layouts rewrite documents with their stored vector while float layouts get partial updates
+def test_write_cluster_ids(recorded_actions):
+    write_cluster_ids(MagicMock(), "incidents_final", {"a": "a"}, layout="float")
+    assert recorded_actions[-1] == {"_op_type": "update", "_index": "incidents_final", "_id": "a",
+                                    "doc": {"clusterId": "a"}}
+
+    with patch("app.routes.incidentClusters.fetch_stored_sources", return_value={"b": {"title": "B"}}), \
+            patch("app.routes.incidentClusters.fetch_embeddings", return_value={"b": [0.1, 0.2]}):
+        write_cluster_ids(MagicMock(), "incidents_final", {"b": "a"}, layout="int8")
+    assert recorded_actions[-1]["_source"] == {"title": "B", "clusterId": "a", "embedding": [0.1, 0.2]}
+
+
+# Test the job only writes documents whose cluster id changed and reports its timings
+def test_cluster_incidents(recorded_actions):
+    hits = [{"_id": doc_id, "_source": {"embedding": vector.tolist(), **({"clusterId": "d"} if doc_id == "d" else {})}}
+            for doc_id, vector in zip(IDS, MATRIX)]
+    with patch("app.routes.incidentClusters.helpers.scan", return_value=hits):
+        report = cluster_incidents(MagicMock(), "incidents_final", threshold=0.99, block_size=2)
+
+    assert [action["_id"] for action in recorded_actions] == ["a", "b", "c"]
+    assert report["documents"] == 4
+    assert report["clusters"] == 1
+    assert report["largestCluster"] == 3
+    assert report["updated"] == 3
+    assert report["wallSeconds"] >= 0
@@ -0,0 +1,274 @@
+import pandas as pd
+import pytest
+from unittest.mock import patch, MagicMock
+
+from app.routes.incidentIngest import (convert_dates_to_iso, prepare_chunk, build_chunk_documents,
+                                       content_fingerprint, derive_incident_fields, backfill_derived_fields,
+                                       stream_index_incidents)
+
+CSV_HEADER = "sysId,IncidentId,title,description,rootCause,createdDate,priority,status,closedDate\n"
+
+
+# Mock Elasticsearch client with bulk results for every action
+@pytest.fixture
+def mock_elasticsearch():
+    es = MagicMock()
+    es.indices.get_settings.return_value = {"incidents_final": {"settings": {"index": {"refresh_interval": "1s"}}}}
+    yield es
+
+
+def fake_encode(texts):
+    return [[0.1] * 384 for _ in texts]
+
+
+# Test vectorized date conversion accepts both formats and flags bad values
+def test_convert_dates_to_iso():
+    series = pd.Series(["2023-10-01 12:00:00", "2023-10-02T08:30:00", "not a date", None])
+    result = convert_dates_to_iso(series).tolist()
+    assert result == ["2023-10-01T12:00:00", "2023-10-02T08:30:00", None, None]
+
+
+# Test bad rows are reported instead of aborting the chunk
+def test_prepare_chunk_reports_invalid_rows():
+    chunk = pd.DataFrame([
+        {"sysId": "1", "IncidentId": "INC1", "title": "t", "description": "d", "rootCause": "r",
+         "createdDate": "2023-10-01 12:00:00", "priority": "High", "status": "New", "closedDate": None},
+        {"sysId": "2", "IncidentId": "INC2", "title": "t", "description": "d", "rootCause": "r",
+         "createdDate": "01/10/2023", "priority": "High", "status": "New", "closedDate": None},
+        {"sysId": "3", "IncidentId": "INC3", "title": "t", "description": "d", "rootCause": "r",
+         "createdDate": "2023-10-01 12:00:00", "priority": "Low", "status": "Closed", "closedDate": "bad"},
+    ])
+
+    records, created, closed, errors, invalid_count = prepare_chunk(chunk, first_row_number=10)
+
+    assert [r["sysId"] for r in records] == ["1"]
+    assert created == ["2023-10-01T12:00:00"]
+    assert closed == [None]
+    assert invalid_count == 2
+    assert [e["row"] for e in errors] == [11, 12]
+    assert "createdDate" in errors[0]["error"]
+    assert "closedDate" in errors[1]["error"]
+
+
+# Test a chunk is encoded with one batched call
+def test_build_chunk_documents_encodes_once():
+    encode = MagicMock(side_effect=fake_encode)
+    records = [
+        {"sysId": "1", "IncidentId": "INC1", "title": "a", "description": "b", "rootCause": "c",
+         "priority": "High", "status": "New"},
+        {"sysId": "2", "IncidentId": "INC2", "title": "d", "description": "e", "rootCause": float("nan"),
+         "priority": "Low", "status": "Closed"},
+    ]
+
+    docs = build_chunk_documents(records, ["2023-10-01T12:00:00"] * 2, [None, None], encode)
+
+    encode.assert_called_once()
+    assert len(encode.call_args[0][0]) == 2
+    assert docs[1]["rootCause"] is None
+    assert len(docs[0]["embedding"]) == 384
+
+
+# Test streaming ingestion returns a per-chunk report and restores the refresh interval
+def test_stream_index_incidents(tmp_path, mock_elasticsearch):
+    csv_file = tmp_path / "incidents.csv"
+    csv_file.write_text(
+        CSV_HEADER
+        + "1,INC1,Router down,network latency,cable,2023-10-01 12:00:00,High,New,\n"
+        + "2,INC2,Disk,hard disk failure,disk,bad-date,Low,New,\n"
+        + "3,INC3,Crash,software crash,bug,2023-10-01T12:00:00,Medium,Closed,2023-10-02 12:00:00\n"
+    )
+
+    def fake_streaming_bulk(client, actions, **kwargs):
+        for action in actions:
+            yield True, {"index": {"_id": action["_id"]}}
+
+    with patch("app.routes.incidentIngest.helpers.streaming_bulk", side_effect=fake_streaming_bulk):
+        report = stream_index_incidents(mock_elasticsearch, "incidents_final", str(csv_file), fake_encode,
+                                        chunk_size=2)
+
+    assert report["totalRows"] == 3
+    assert report["indexed"] == 2
+    assert report["failed"] == 1
+    assert [c["rows"] for c in report["chunks"]] == [2, 1]
+    assert report["chunks"][0]["errors"][0]["sysId"] == "2"
+    mock_elasticsearch.indices.put_settings.assert_called_with(
+        index="incidents_final", settings={"index": {"refresh_interval": "1s"}})
+    mock_elasticsearch.indices.refresh.assert_called_once_with(index="incidents_final")
+
+
+# Test the content fingerprint ignores whitespace differences and treats missing values as empty
+def test_content_fingerprint():
+    assert content_fingerprint("Router  down ", "latency", None) == content_fingerprint("Router down", "latency", "")
+    assert content_fingerprint("Router down", "latency", None) != content_fingerprint("Router down", "loss", None)
+
+
+# Test incremental ingestion re-embeds changed text, partially updates metadata and skips identical rows;
+# counts only include writes the bulk response acknowledged
+@pytest.mark.parametrize("failing, expected", [
+    (set(), {"created": 1, "reembedded": 1, "metadataUpdated": 1, "skipped": 1, "indexed": 4, "failed": 0}),
+    ({"2", "4"}, {"created": 0, "reembedded": 1, "metadataUpdated": 0, "skipped": 1, "indexed": 2, "failed": 2})
+])
+def test_stream_index_incidents_incremental(tmp_path, mock_elasticsearch, failing, expected):
+    csv_file = tmp_path / "incidents.csv"
+    csv_file.write_text(
+        CSV_HEADER
+        + "1,INC1,Router down,network latency,cable,2023-10-01 12:00:00,High,New,\n"
+        + "2,INC2,Disk,hard disk failure,disk,2023-10-01 12:00:00,Low,Closed,2023-10-02 12:00:00\n"
+        + "3,INC3,Crash,software crash,bug,2023-10-01 12:00:00,Medium,New,\n"
+        + "4,INC4,Memory,memory leak,bug,2023-10-01 12:00:00,Low,New,\n"
+    )
+    stored = {
+        # Same text and metadata
+        "1": {"sysId": "1", "IncidentId": "INC1", "title": "Router down", "description": "network latency",
+              "rootCause": "cable", "createdDate": "2023-10-01T12:00:00", "priority": "High", "status": "New",
+              "closedDate": None, "contentHash": content_fingerprint("Router down", "network latency", "cable")},
+        # Same text, now closed; stored by an older version without contentHash
+        "2": {"sysId": "2", "IncidentId": "INC2", "title": "Disk", "description": "hard disk failure",
+              "rootCause": "disk", "createdDate": "2023-10-01T12:00:00", "priority": "Low", "status": "New",
+              "closedDate": None},
+        # Description changed
+        "3": {"sysId": "3", "IncidentId": "INC3", "title": "Crash", "description": "crash",
+              "rootCause": "bug", "createdDate": "2023-10-01T12:00:00", "priority": "Medium", "status": "New",
+              "closedDate": None, "contentHash": content_fingerprint("Crash", "crash", "bug")},
+    }
+    mock_elasticsearch.mget.side_effect = lambda index, ids, **kwargs: {"docs": [
+        {"_id": doc_id, "found": True, "_source": stored[doc_id]} if doc_id in stored
+        else {"_id": doc_id, "found": False} for doc_id in ids
+    ]}
+    actions = []
+
+    def fake_streaming_bulk(client, bulk_actions, **kwargs):
+        for action in bulk_actions:
+            actions.append(action)
+            yield action["_id"] not in failing, {action.get("_op_type", "index"): {"_id": action["_id"]}}
+
+    encode = MagicMock(side_effect=fake_encode)
+    updated = []
+    with patch("app.routes.incidentIngest.helpers.streaming_bulk", side_effect=fake_streaming_bulk):
+        report = stream_index_incidents(mock_elasticsearch, "incidents_final", str(csv_file), encode,
+                                        chunk_size=10, incremental=True, on_metadata_updated=updated.extend)
+
+    assert {key: report[key] for key in expected} == expected
+    # Only the new and the changed incident are encoded
+    assert len(encode.call_args[0][0]) == 2
+    update = next(a for a in actions if a.get("_op_type") == "update")
+    assert update["_id"] == "2"
+    assert update["doc"]["status"] == "Closed"
+    assert update["doc"]["closedDate"] == "2023-10-02T12:00:00"
+    assert "contentHash" in update["doc"]
+    assert {a["_id"] for a in actions if "_op_type" not in a} == {"3", "4"}
+    assert [doc_id for doc_id, _ in updated] == ([] if "2" in failing else ["2"])
+
+
+# Test quantized layouts rewrite metadata changes with the stored vector instead of a partial update
+def test_stream_index_incidents_incremental_quantized(tmp_path, mock_elasticsearch):
+    csv_file = tmp_path / "incidents.csv"
+    csv_file.write_text(CSV_HEADER + "1,INC1,Router down,network latency,cable,2023-10-01 12:00:00,Low,New,\n")
+    stored = {"sysId": "1", "IncidentId": "INC1", "title": "Router down", "description": "network latency",
+              "rootCause": "cable", "createdDate": "2023-10-01T12:00:00", "priority": "High", "status": "New",
+              "closedDate": None, "contentHash": content_fingerprint("Router down", "network latency", "cable")}
+    mock_elasticsearch.mget.return_value = {"docs": [{"_id": "1", "found": True, "_source": stored}]}
+    mock_elasticsearch.search.return_value = {"hits": {"hits": [{"_id": "1", "fields": {"embedding": [[0.5] * 384]}}]}}
+    actions = []
+
+    def fake_streaming_bulk(client, bulk_actions, **kwargs):
+        for action in bulk_actions:
+            actions.append(action)
+            yield True, {"index": {"_id": action["_id"]}}
+
+    with patch("app.routes.incidentIngest.helpers.streaming_bulk", side_effect=fake_streaming_bulk):
+        report = stream_index_incidents(mock_elasticsearch, "incidents_final", str(csv_file), fake_encode,
+                                        incremental=True, layout="int8")
+
+    assert report["metadataUpdated"] == 1
+    assert "_op_type" not in actions[0]
+    assert actions[0]["_source"]["priority"] == "Low"
+    assert actions[0]["_source"]["embedding"] == [0.5] * 384
+
+
+# Test derived analytics fields computed at write time
+def test_derive_incident_fields():
+    fields = derive_incident_fields("Router latency spike", "2023-10-02T08:00:00", "2023-10-03T14:30:00")
+    assert fields["category"] == "Network"
+    assert fields["resolutionHours"] == 30.5
+    assert fields["resolutionDays"] == 1
+    assert fields["createdMonth"] == "2023-10"
+    assert fields["createdWeekday"] == "Monday"
+
+    open_incident = derive_incident_fields("something odd", "2023-10-02T08:00:00", None)
+    assert open_incident["category"] is None
+    assert open_incident["resolutionHours"] is None
+    assert open_incident["resolutionDays"] is None
+
+
+# Test the backfill sends partial updates in the float layout and full documents in quantized layouts
+@pytest.mark.parametrize("layout", ["float", "int8"])
+def test_backfill_derived_fields(mock_elasticsearch, layout):
+    hit = {"_id": "1", "_source": {"sysId": "1", "description": "disk crash", "createdDate": "2023-10-02T08:00:00",
+                                   "closedDate": None},
+           "fields": {"embedding": [[0.5] * 384]}}
+    actions = []
+
+    def fake_streaming_bulk(client, bulk_actions, **kwargs):
+        for action in bulk_actions:
+            actions.append(action)
+            yield True, {"update": {"_id": action["_id"]}}
+
+    with patch("app.routes.incidentIngest.helpers.scan", return_value=iter([hit])) as scan, \
+            patch("app.routes.incidentIngest.helpers.streaming_bulk", side_effect=fake_streaming_bulk):
+        report = backfill_derived_fields(mock_elasticsearch, "incidents_final", layout)
+
+    assert report == {"updated": 1, "failed": 0, "errors": []}
+    assert "derivedVersion" in str(scan.call_args.kwargs["query"]["query"])
+    if layout == "float":
+        assert actions[0]["_op_type"] == "update"
+        assert actions[0]["doc"]["category"] == "Software"
+    else:
+        assert "_op_type" not in actions[0]
+        assert actions[0]["_source"]["category"] == "Software"
+        assert actions[0]["_source"]["embedding"] == [0.5] * 384
+
+
+# Test on_changed receives each written document with the version it replaced
+def test_stream_index_incidents_on_changed(tmp_path, mock_elasticsearch):
+    csv_file = tmp_path / "incidents.csv"
+    csv_file.write_text(
+        CSV_HEADER
+        + "1,INC1,Router down,network latency,cable,2023-10-01 12:00:00,High,Closed,2023-10-02 12:00:00\n"
+        + "2,INC2,Disk,hard disk failure,disk,2023-10-01 12:00:00,Low,New,\n"
+    )
+    previous = {"sysId": "1", "status": "New", "createdDate": "2023-10-01T12:00:00"}
+    mock_elasticsearch.mget.return_value = {"docs": [{"_id": "1", "found": True, "_source": previous},
+                                                     {"_id": "2", "found": False}]}
+
+    def fake_streaming_bulk(client, actions, **kwargs):
+        for action in actions:
+            yield True, {"index": {"_id": action["_id"]}}
+
+    changes = []
+    with patch("app.routes.incidentIngest.helpers.streaming_bulk", side_effect=fake_streaming_bulk):
+        stream_index_incidents(mock_elasticsearch, "incidents_final", str(csv_file), fake_encode,
+                               on_changed=changes.extend)
+
+    assert [(old, new["sysId"]) for old, new in changes] == [(previous, "1"), (None, "2")]
+
+
+# Test overlapping loads keep refresh disabled until the last one ends and never restore "-1"
+def test_relaxed_refresh_overlapping_loads():
+    from app.routes.incidentIngest import relaxed_refresh
+
+    es = MagicMock()
+    es.indices.get_settings.return_value = {"incidents_final": {"settings": {"index": {"refresh_interval": "5s"}}}}
+    with relaxed_refresh(es, "incidents_final"):
+        with relaxed_refresh(es, "incidents_final"):
+            pass
+        es.indices.put_settings.assert_called_once_with(
+            index="incidents_final", settings={"index": {"refresh_interval": "-1"}})
+    es.indices.put_settings.assert_called_with(index="incidents_final", settings={"index": {"refresh_interval": "5s"}})
+    assert es.indices.get_settings.call_count == 1
+
+    # A crashed load left "-1" behind: fall back to the index default
+    es.indices.get_settings.return_value = {"incidents_final": {"settings": {"index": {"refresh_interval": "-1"}}}}
+    with relaxed_refresh(es, "incidents_final"):
+        pass
+    es.indices.put_settings.assert_called_with(index="incidents_final", settings={"index": {"refresh_interval": None}})
@@ -0,0 +1,96 @@
+from unittest.mock import patch, MagicMock
+
+from app.routes.incidentLookup import (backfill_id_keywords, build_incident_id_query,
+                                       build_legacy_incident_id_query, build_source_lookup, by_document_id,
+                                       by_incident_id, exact_hits, unique_ids)
+from app.routes.indexLayout import build_index_mapping
+
+
+# Test identifier fields keep their text mapping and gain a keyword subfield
+def test_id_fields_have_keyword_subfield():
+    properties = build_index_mapping("float")["mappings"]["properties"]
+    for field in ("sysId", "IncidentId"):
+        assert properties[field]["type"] == "text"
+        assert properties[field]["fields"] == {"keyword": {"type": "keyword"}}
+
+
+# Test the IncidentId query is an exact terms filter collapsed to one hit per id
+def test_build_incident_id_query():
+    body = build_incident_id_query(["INC-1", "INC-2", "INC-1", ""])
+    assert body["size"] == 2
+    assert body["query"]["bool"]["filter"] == [{"terms": {"IncidentId.keyword": ["INC-1", "INC-2"]}}]
+    assert body["collapse"] == {"field": "IncidentId.keyword"}
+
+
+# Test the legacy lookup matches IncidentId only on documents without the keyword subfield
+def test_build_legacy_incident_id_query():
+    body = build_legacy_incident_id_query(["INC-1", "INC-2", "INC-1"])
+    clauses = body["query"]["bool"]["should"]
+    assert [clause["bool"]["filter"] for clause in clauses] == [
+        [{"match": {"IncidentId": {"query": "INC-1", "operator": "and"}}}],
+        [{"match": {"IncidentId": {"query": "INC-2", "operator": "and"}}}]
+    ]
+    assert clauses[0]["bool"]["must_not"] == [{"exists": {"field": "IncidentId.keyword"}}]
+
+    # The match also hits ids sharing its tokens: only exact ids are kept
+    hits = [{"_source": {"IncidentId": "INC-1-A"}}, {"_source": {"IncidentId": "INC-1"}}]
+    assert exact_hits(hits, "INC-1") == [hits[1]]
+    assert by_incident_id(hits, ["INC-1"]) == {"INC-1": {"IncidentId": "INC-1"}}
+
+    body = build_source_lookup(incident_id="INC-1", legacy=True)
+    assert body["query"]["bool"]["filter"][0]["bool"]["must_not"] == [{"exists": {"field": "IncidentId.keyword"}}]
+
+
+# Test lookup results are keyed by the requested ids in request order
+def test_lookup_results_in_request_order():
+    hits = [{"_source": {"IncidentId": "INC-2", "title": "b"}}]
+    assert list(by_incident_id(hits, ["INC-3", "INC-2"]).items()) == [("INC-3", None),
+                                                                      ("INC-2", {"IncidentId": "INC-2", "title": "b"})]
+    docs = [{"_id": "x", "found": False}, {"_id": "y", "found": True, "_source": {"sysId": "y"}}]
+    assert by_document_id(docs) == {"x": None, "y": {"sysId": "y"}}
+    assert unique_ids(["b", None, "a", "b"]) == ["b", "a"]
+
+
+# Test the backfill rewrites quantized documents together with their stored vector
+def test_backfill_id_keywords_quantized():
+    hits = [{"_id": "1", "_source": {"sysId": "1", "IncidentId": "INC-1"}, "fields": {"embedding": [[0.5, 0.5]]}}]
+    written = []
+
+    def streaming_bulk(es, actions, **kwargs):
+        for action in actions:
+            written.append(action)
+            yield True, {"index": {"_id": action["_id"]}}
+
+    with patch("app.routes.incidentLookup.helpers.scan", return_value=hits) as scan, \
+            patch("app.routes.incidentIngest.helpers.streaming_bulk", streaming_bulk):
+        report = backfill_id_keywords(MagicMock(), "incidents_final", layout="int8")
+
+    assert report == {"updated": 1, "failed": 0, "errors": []}
+    assert written[0]["_source"] == {"sysId": "1", "IncidentId": "INC-1", "embedding": [0.5, 0.5]}
+    assert "script_fields" in scan.call_args.kwargs["query"]
+    assert scan.call_args.kwargs["query"]["_source"] is True
+
+
+# Test the backfill leaves float documents to _update_by_query instead of sending them back
+def test_backfill_id_keywords_update_by_query():
+    es = MagicMock()
+    es.update_by_query.return_value = {"updated": 3, "failures": [{"id": "x", "cause": {"type": "mapper"}}]}
+
+    report = backfill_id_keywords(es, "incidents_final", batch_size=100)
+
+    assert report == {"updated": 3, "failed": 1, "errors": [{"sysId": "x", "error": "{'type': 'mapper'}"}]}
+    kwargs = es.update_by_query.call_args.kwargs
+    assert (kwargs["conflicts"], kwargs["scroll_size"]) == ("proceed", 100)
+    es.bulk.assert_not_called()
+
+
+# Test the source lookup reads the stored vector from _source or script_fields depending on the layout
+def test_build_source_lookup():
+    body = build_source_lookup(incident_id="INC-1")
+    assert body["query"]["bool"]["filter"] == [{"term": {"IncidentId.keyword": "INC-1"}}]
+    assert "embedding" in body["_source"]
+
+    body = build_source_lookup(sys_id="abc", layout="bbq")
+    assert body["query"]["bool"]["filter"] == [{"ids": {"values": ["abc"]}}]
+    assert "embedding" not in body["_source"]
+    assert "script_fields" in body
@@ -0,0 +1,57 @@
+import pytest
+from unittest.mock import MagicMock
+
+from app.routes.incidentPaging import (CursorError, encode_cursor, decode_cursor, search_page, iter_hits)
+
+
+def page(ids, pit_id="pit-1"):
+    return {"pit_id": pit_id, "hits": {"hits": [{"_id": i, "_source": {"IncidentId": i}, "sort": [i, 0]}
+                                                for i in ids]}}
+
+
+# Mock Elasticsearch client with an open point in time
+@pytest.fixture
+def mock_elasticsearch():
+    es = MagicMock()
+    es.open_point_in_time.return_value = {"id": "pit-1"}
+    yield es
+
+
+# Test cursors round-trip and bad cursors are rejected
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("pit", ["2023-10-01", 5])) == ("pit", ["2023-10-01", 5])
+    with pytest.raises(CursorError):
+        decode_cursor("not-a-cursor")
+
+
+# Test a full page returns a cursor continuing after its last sort values
+def test_search_page_first_and_next(mock_elasticsearch):
+    mock_elasticsearch.search.side_effect = [page(["a", "b"], "pit-2"), page(["c"], "pit-2")]
+
+    hits, cursor = search_page(mock_elasticsearch, "incidents_final", 2, ["IncidentId"])
+    assert [h["_id"] for h in hits] == ["a", "b"]
+    assert decode_cursor(cursor) == ("pit-2", ["b", 0])
+    mock_elasticsearch.open_point_in_time.assert_called_once()
+
+    hits, cursor = search_page(mock_elasticsearch, "incidents_final", 2, ["IncidentId"], cursor)
+    body = mock_elasticsearch.search.call_args.kwargs["body"]
+    assert body["search_after"] == ["b", 0]
+    assert body["pit"]["id"] == "pit-2"
+    assert [h["_id"] for h in hits] == ["c"]
+    assert cursor is None
+    mock_elasticsearch.close_point_in_time.assert_called_once_with(id="pit-2")
+
+
+# Test iterating every hit pages through the index and closes the PIT when stopped early
+def test_iter_hits(mock_elasticsearch):
+    mock_elasticsearch.search.side_effect = [page(["a", "b"]), page(["c", "d"]), page([])]
+    assert [h["_id"] for h in iter_hits(mock_elasticsearch, "incidents_final", 2, [])] == ["a", "b", "c", "d"]
+    assert mock_elasticsearch.search.call_count == 3
+    mock_elasticsearch.close_point_in_time.assert_called_once()
+
+    mock_elasticsearch.reset_mock()
+    mock_elasticsearch.search.side_effect = [page(["a", "b"]), page(["c", "d"])]
+    hits = iter_hits(mock_elasticsearch, "incidents_final", 2, [])
+    next(hits)
+    hits.close()
+    mock_elasticsearch.close_point_in_time.assert_called_once()
@@ -0,0 +1,161 @@
+import pytest
+from unittest.mock import patch, MagicMock
+
+from app.routes.incidentRollup import (contribution, rollup_deltas, apply_rollup_changes, rebuild_rollup,
+                                       seven_days_from_rollup, six_months_from_rollup)
+
+
+def incident(status="New", closed=None, priority="High", category="Network"):
+    return {"createdDate": "2023-10-02T08:00:00", "closedDate": closed, "priority": priority, "status": status,
+            "description": "router down", "category": category}
+
+
+# Mock Elasticsearch client
+@pytest.fixture
+def mock_elasticsearch():
+    yield MagicMock()
+
+
+# Test the contribution of one incident, with a missing category bucketed as Unknown like the rebuild does
+def test_contribution():
+    key, values = contribution(incident("Closed", "2023-10-03T10:00:00"))
+    assert key == ("2023-10-02", "High", "Closed", "Network")
+    assert values == {"count": 1, "resolutionHoursSum": 26.0, "resolutionCount": 1}
+    assert contribution(incident(category=None))[0] == ("2023-10-02", "High", "New", "Unknown")
+    assert contribution({"createdDate": None, "priority": "High"}) is None
+
+
+# Test a status change moves the incident from one row to another
+def test_rollup_deltas_moves_updated_incident():
+    deltas = rollup_deltas([
+        (incident("New"), incident("Closed", "2023-10-02T10:00:00")),
+        (None, incident("New", priority="Low")),
+        (incident("New", priority="Medium"), incident("New", priority="Medium"))  # Unchanged: no delta
+    ])
+    assert deltas[("2023-10-02", "High", "New", "Network")]["count"] == -1
+    assert deltas[("2023-10-02", "High", "Closed", "Network")] == {"count": 1, "resolutionHoursSum": 2.0,
+                                                                   "resolutionCount": 1}
+    assert deltas[("2023-10-02", "Low", "New", "Network")]["count"] == 1
+    assert ("2023-10-02", "Medium", "New", "Network") not in deltas
+
+
+# Test deltas are applied with scripted upserts
+def test_apply_rollup_changes(mock_elasticsearch):
+    with patch("app.routes.incidentRollup.helpers.bulk") as bulk:
+        rows = apply_rollup_changes(mock_elasticsearch, [(None, incident())])
+
+    assert rows == 1
+    action = bulk.call_args[0][1][0]
+    assert action["_op_type"] == "update"
+    assert action["_id"] == "2023-10-02|High|New|Network"
+    assert action["script"]["params"]["count"] == 1
+    # New rows start at zero and go through the script, so a negative delta never stores a negative count
+    assert action["scripted_upsert"] is True
+    assert action["upsert"]["day"] == "2023-10-02"
+    assert action["upsert"]["count"] == 0
+
+
+def rollup_row(count, category="Network"):
+    return {"_source": {"day": "2023-10-02", "priority": "High", "status": "New", "category": category,
+                        "count": count, "resolutionHoursSum": 0.0, "resolutionCount": 0},
+            "sort": ["2023-10-02", "High", "New", category]}
+
+
+# Test the rebuild pages through the composite aggregation into a new index and switches the alias to it
+def test_rebuild_rollup(mock_elasticsearch):
+    def page(buckets, after_key):
+        return {"aggregations": {"rows": {"buckets": buckets, "after_key": after_key}}}
+
+    bucket = {"key": {"day": "2023-10-02", "priority": "High", "status": "Closed", "category": None},
+              "doc_count": 3, "resolved": {"doc_count": 2, "hours": {"value": 10.0}}}
+    old = "incidents_daily_rollup-1"
+    reads = iter([
+        {"hits": {"hits": [rollup_row(5)]}},                     # current rows at the point in time
+        {"hits": {"hits": [rollup_row(6)]}},                     # one upsert arrived during the rebuild
+        {"hits": {"hits": [rollup_row(6), rollup_row(1, "Hardware")]}}  # another before the alias switch
+    ])
+    pages = iter([page([bucket], {"day": 1}), page([], None)])
+    mock_elasticsearch.search.side_effect = lambda **kwargs: next(pages if "aggs" in kwargs["body"] else reads)
+    mock_elasticsearch.indices.exists.return_value = True
+    mock_elasticsearch.indices.get.return_value = {old: {}}
+    mock_elasticsearch.open_point_in_time.return_value = {"id": "pit"}
+    written = []
+
+    def fake_bulk(client, actions, **kwargs):
+        written.extend(actions)
+        return len(written), []
+
+    with patch("app.routes.incidentRollup.helpers.bulk", side_effect=fake_bulk):
+        rows = rebuild_rollup(mock_elasticsearch, "incidents_final")
+
+    assert rows == 1
+    new_index = written[0]["_index"]
+    assert new_index.startswith("incidents_daily_rollup-") and new_index != old
+    assert written[0]["_id"] == "2023-10-02|High|Closed|Unknown"
+    assert written[0]["_source"]["resolutionCount"] == 2
+    # Upserts the old index took meanwhile are replayed: before the switch into the new index, after it
+    # through the alias
+    assert [(a["_index"], a["_id"], a["script"]["params"]["count"]) for a in written[1:]] == [
+        (new_index, "2023-10-02|High|New|Network", 1),
+        ("incidents_daily_rollup", "2023-10-02|High|New|Hardware", 1)
+    ]
+    mock_elasticsearch.indices.update_aliases.assert_called_once_with(actions=[
+        {"remove": {"index": old, "alias": "incidents_daily_rollup"}},
+        {"add": {"index": new_index, "alias": "incidents_daily_rollup"}}
+    ])
+    mock_elasticsearch.indices.delete.assert_called_once_with(index=[old])
+    mock_elasticsearch.close_point_in_time.assert_called_once_with(id="pit")
+    aggregation = mock_elasticsearch.search.call_args_list[0].kwargs["body"]
+    assert aggregation["query"]["bool"]["must_not"] == [{"terms": {"_index": [old]}}]
+    assert mock_elasticsearch.search.call_args_list[1].kwargs["body"]["aggs"]["rows"]["composite"]["after"] == {
+        "day": 1}
+
+
+# Test a rollup index created before the alias is replaced by the alias in the same request
+def test_rebuild_rollup_replaces_unaliased_index(mock_elasticsearch):
+    mock_elasticsearch.search.return_value = {"aggregations": {"rows": {"buckets": []}}, "hits": {"hits": []}}
+    mock_elasticsearch.indices.exists.return_value = True
+    mock_elasticsearch.indices.get.return_value = {"incidents_daily_rollup": {}}
+    mock_elasticsearch.open_point_in_time.return_value = {"id": "pit"}
+
+    with patch("app.routes.incidentRollup.helpers.bulk", return_value=(0, [])):
+        rebuild_rollup(mock_elasticsearch, "incidents_final")
+
+    actions = mock_elasticsearch.indices.update_aliases.call_args.kwargs["actions"]
+    assert actions[0] == {"remove_index": {"index": "incidents_daily_rollup"}}
+    mock_elasticsearch.indices.delete.assert_not_called()
+
+
+# Test a failed rebuild drops the half-built index and leaves the alias alone
+def test_rebuild_rollup_failure_keeps_alias(mock_elasticsearch):
+    mock_elasticsearch.indices.exists.return_value = True
+    mock_elasticsearch.indices.get.return_value = {"incidents_daily_rollup-1": {}}
+    mock_elasticsearch.open_point_in_time.return_value = {"id": "pit"}
+    mock_elasticsearch.search.side_effect = ConnectionError("Elasticsearch unreachable")
+
+    with pytest.raises(ConnectionError):
+        rebuild_rollup(mock_elasticsearch, "incidents_final")
+
+    mock_elasticsearch.indices.update_aliases.assert_not_called()
+    new_index = mock_elasticsearch.indices.create.call_args.kwargs["index"]
+    mock_elasticsearch.indices.delete.assert_called_once_with(index=new_index, ignore_unavailable=True)
+
+
+# Test rollup responses are reshaped like the incident-index aggregations
+def test_rollup_reshaping():
+    seven_days = seven_days_from_rollup({"aggregations": {
+        "total": {"value": 10.0},
+        "lastWeek": {"days": {"buckets": [{"key_as_string": "2023-10-02", "count": {"value": 4.0}}]}},
+        "resolutionHoursSum": {"value": 30.0},
+        "resolutionCount": {"value": 3.0},
+        "statuses": {"buckets": [{"key": "Closed", "count": {"value": 3.0}}, {"key": "New", "count": {"value": 7.0}}]}
+    }})
+    assert seven_days["hits"]["total"]["value"] == 10
+    assert seven_days["aggregations"]["lastWeek"]["days"]["buckets"][0]["doc_count"] == 4
+    assert seven_days["aggregations"]["resolved"]["resolutionHours"]["value"] == 10.0
+    assert seven_days["aggregations"]["statuses"]["buckets"]["Unresolved"]["doc_count"] == 7
+
+    six_months = six_months_from_rollup({"aggregations": {"monthly_statuses": {"buckets": [
+        {"key_as_string": "2023-10", "New": {"count": {"value": 2.0}}, "Closed": {"count": {"value": 1.0}}}
+    ]}}}, ["New", "Closed"])
+    assert six_months["aggregations"]["monthly_statuses"]["buckets"][0]["New"]["doc_count"] == 2
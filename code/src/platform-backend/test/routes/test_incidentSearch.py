@@ -0,0 +1,84 @@
+import pytest
+
+from app.routes.incidentSearch import (build_filters, build_knn_search, build_exact_search, build_lexical_search,
+                                       build_more_like_this, build_msearch, exclude_documents,
+                                       merge_query_results, reciprocal_rank_fusion, format_hits)
+
+VECTOR = [0.1] * 384
+
+
+# Test filter clauses for priority, status and createdDate range
+def test_build_filters():
+    filters = build_filters(priority=["High"], status=["New", "Resolved"], created_from="2024-01-01")
+    assert filters == [
+        {"terms": {"priority": ["High"]}},
+        {"terms": {"status": ["New", "Resolved"]}},
+        {"range": {"createdDate": {"gte": "2024-01-01"}}}
+    ]
+    assert build_filters() == []
+
+
+# Test kNN body uses pre-filtering and never asks for fewer candidates than k
+def test_build_knn_search():
+    body = build_knn_search(VECTOR, size=20, num_candidates=10, filters=[{"terms": {"status": ["New"]}}])
+    assert body["size"] == 20
+    assert body["knn"]["k"] == 20
+    assert body["knn"]["num_candidates"] == 20
+    assert body["knn"]["filter"] == [{"terms": {"status": ["New"]}}]
+    assert "filter" not in build_knn_search(VECTOR, 5, 50)["knn"]
+
+
+# Test exact mode keeps the original script_score query
+def test_build_exact_search():
+    body = build_exact_search(VECTOR, 5)
+    assert body["query"]["script_score"]["query"] == {"match_all": {}}
+    filtered = build_exact_search(VECTOR, 5, filters=[{"terms": {"priority": ["Low"]}}])
+    assert filtered["query"]["script_score"]["query"] == {"bool": {"filter": [{"terms": {"priority": ["Low"]}}]}}
+
+
+# Test lexical search targets title, description and root cause
+def test_build_lexical_search():
+    body = build_lexical_search("kafka lag", 10)
+    assert body["query"]["bool"]["must"][0]["multi_match"]["query"] == "kafka lag"
+    assert "filter" not in body["query"]["bool"]
+
+
+# Test reciprocal rank fusion rewards documents found by both searches
+def test_reciprocal_rank_fusion():
+    vector_hits = [{"_id": "a", "_score": 0.9, "_source": {}}, {"_id": "b", "_score": 0.8, "_source": {}}]
+    lexical_hits = [{"_id": "b", "_score": 12.0, "_source": {}}, {"_id": "c", "_score": 9.0, "_source": {}}]
+
+    fused = reciprocal_rank_fusion([vector_hits, lexical_hits], size=2, rank_constant=60)
+
+    assert [hit["_id"] for hit in fused] == ["b", "a"]
+    assert fused[0]["_score"] == 1 / 62 + 1 / 61
+    assert format_hits(fused)[1] == {"id": "a", "score": 1 / 61, "data": {}}
+
+
+# Test msearch requests pair every body with an index header
+def test_build_msearch():
+    searches = build_msearch("incidents_final", [{"size": 1}, {"size": 2}])
+    assert searches == [{"index": "incidents_final"}, {"size": 1}, {"index": "incidents_final"}, {"size": 2}]
+
+
+# Test deduplicated batch results sum the scores of incidents matching several queries
+def test_merge_query_results():
+    first = [{"id": "a", "score": 0.9, "data": {}}, {"id": "b", "score": 0.8, "data": {}}]
+    second = [{"id": "b", "score": 0.7, "data": {}}]
+    merged = merge_query_results([first, second])
+    assert [entry["id"] for entry in merged] == ["b", "a"]
+    assert merged[0]["score"] == pytest.approx(1.5)
+    assert merged[0]["maxScore"] == 0.8
+    assert merged[0]["queries"] == [0, 1]
+    assert len(merge_query_results([first, second], size=1)) == 1
+
+
+# Test the source incident is excluded from kNN and more_like_this searches
+def test_exclude_source_incident():
+    filters = exclude_documents([{"terms": {"status": ["New"]}}], ["abc"])
+    assert filters[-1] == {"bool": {"must_not": [{"ids": {"values": ["abc"]}}]}}
+    assert build_knn_search(VECTOR, 5, 50, filters)["knn"]["filter"] == filters
+
+    body = build_more_like_this("incidents_final", "abc", 5, filters)
+    assert body["query"]["bool"]["must"][0]["more_like_this"]["like"] == [{"_index": "incidents_final", "_id": "abc"}]
+    assert body["query"]["bool"]["filter"] == filters
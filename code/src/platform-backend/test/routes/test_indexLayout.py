@@ -0,0 +1,69 @@
+import pytest
+from unittest.mock import MagicMock
+
+from app.routes.indexLayout import (build_index_mapping, embedding_fetch_options, hit_embedding, migrate_layout,
+                                    estimated_vector_memory)
+from app.routes.incidentSearch import build_knn_search
+
+
+# Test the float layout keeps the original mapping
+def test_float_layout_mapping():
+    mapping = build_index_mapping("float")["mappings"]
+    assert "_source" not in mapping
+    assert "index_options" not in mapping["properties"]["embedding"]
+    assert embedding_fetch_options("float") == {}
+
+
+# Test quantized layouts use quantized HNSW and keep vectors out of _source
+@pytest.mark.parametrize("layout, index_type", [("int8", "int8_hnsw"), ("bbq", "bbq_hnsw")])
+def test_quantized_layout_mapping(layout, index_type):
+    mapping = build_index_mapping(layout)["mappings"]
+    assert mapping["properties"]["embedding"]["index_options"] == {"type": index_type}
+    assert mapping["_source"] == {"excludes": ["embedding"]}
+    assert "script_fields" in embedding_fetch_options(layout)
+
+
+# Test unknown layouts are rejected
+def test_unknown_layout():
+    with pytest.raises(ValueError):
+        build_index_mapping("fp16")
+
+
+# Test embeddings are read from _source or script_fields
+def test_hit_embedding():
+    assert hit_embedding({"_source": {"embedding": [0.1, 0.2]}}) == [0.1, 0.2]
+    assert hit_embedding({"_source": {}, "fields": {"embedding": [[0.3, 0.4]]}}) == [0.3, 0.4]
+    assert hit_embedding({"_source": {}}) is None
+
+
+# Test quantized kNN searches rescore candidates at full precision
+def test_knn_search_with_rescore():
+    body = build_knn_search([0.1] * 384, size=10, num_candidates=50, rescore_window=30)
+    assert "knn" in body["query"]
+    assert body["rescore"]["window_size"] == 30
+    assert body["_source"] == {"excludes": ["embedding"]}
+
+
+# Test memory estimates shrink with quantization
+def test_estimated_vector_memory():
+    assert estimated_vector_memory("float", 1000) == 1000 * 384 * 4
+    assert estimated_vector_memory("int8", 1000) == 1000 * 388
+    assert estimated_vector_memory("bbq", 1000) < estimated_vector_memory("int8", 1000)
+
+
+# Test migration reindexes into a new index and refuses to continue on count mismatch
+def test_migrate_layout():
+    es = MagicMock()
+    es.reindex.return_value = {"failures": []}
+    es.count.return_value = {"count": 42}
+
+    result = migrate_layout(es, "incidents_final", "int8")
+
+    assert result["documents"] == 42
+    assert result["target"].startswith("incidents_final_int8_")
+    es.indices.create.assert_called_once()
+    es.indices.delete.assert_not_called()
+
+    es.count.side_effect = [{"count": 42}, {"count": 41}]
+    with pytest.raises(RuntimeError):
+        migrate_layout(es, "incidents_final", "int8")
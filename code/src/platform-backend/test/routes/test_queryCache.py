@@ -0,0 +1,72 @@
+import pytest
+
+from app.routes.queryCache import SemanticQueryCache, normalize_query
+
+PARAMS = ("knn", 10)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# Cache with a controllable clock
+@pytest.fixture
+def cache_and_clock():
+    clock = FakeClock()
+    yield SemanticQueryCache(max_entries=2, ttl=60, threshold=0.9, clock=clock), clock
+
+
+# Test exact lookups ignore case and whitespace but not the search params
+def test_exact_hit(cache_and_clock):
+    cache, _ = cache_and_clock
+    cache.put("Kafka  consumer lag", PARAMS, [1.0, 0.0], ["result"], cache.generation)
+
+    assert normalize_query(" Kafka\tconsumer LAG ") == "kafka consumer lag"
+    assert cache.get_exact("kafka consumer lag", PARAMS) == ["result"]
+    assert cache.get_exact("kafka consumer lag", ("knn", 5)) is None
+
+
+# Test rephrased queries hit when their embeddings are similar enough
+def test_semantic_hit(cache_and_clock):
+    cache, _ = cache_and_clock
+    cache.put("kafka consumer lag", PARAMS, [1.0, 0.0], ["lag"], cache.generation)
+    cache.put("disk full", PARAMS, [0.0, 1.0], ["disk"], cache.generation)
+
+    assert cache.get_similar([0.95, 0.1], PARAMS) == ["lag"]
+    assert cache.get_similar([0.7, 0.7], PARAMS) is None
+    assert cache.get_similar([0.95, 0.1], ("hybrid", 10)) is None
+    assert cache.stats()["semanticHits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+# Test entries expire after the TTL and the least recently used entry is evicted
+def test_ttl_and_lru(cache_and_clock):
+    cache, clock = cache_and_clock
+    cache.put("a", PARAMS, [1.0, 0.0], "A", cache.generation)
+    cache.put("b", PARAMS, [0.0, 1.0], "B", cache.generation)
+    cache.get_exact("a", PARAMS)
+    cache.put("c", PARAMS, [0.6, 0.8], "C", cache.generation)
+
+    assert cache.get_exact("b", PARAMS) is None
+    assert cache.get_exact("a", PARAMS) == "A"
+    assert cache.stats()["evictions"] == 1
+
+    clock.now = 61
+    assert cache.get_exact("a", PARAMS) is None
+    assert cache.get_similar([0.6, 0.8], PARAMS) is None
+
+
+# Test invalidation drops entries and results computed before it
+def test_invalidate(cache_and_clock):
+    cache, _ = cache_and_clock
+    generation = cache.generation
+    cache.put("a", PARAMS, [1.0, 0.0], "A", generation)
+    cache.invalidate()
+
+    assert cache.get_exact("a", PARAMS) is None
+    cache.put("b", PARAMS, [1.0, 0.0], "B", generation)
+    assert cache.stats()["entries"] == 0
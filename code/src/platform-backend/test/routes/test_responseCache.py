@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from app.routes.responseCache import ResponseCache, SharedGeneration
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# Cache with a controllable clock
+@pytest.fixture
+def cache_and_clock():
+    clock = FakeClock()
+    yield ResponseCache(clock=clock), clock
+
+
+def counter():
+    calls = {"count": 0}
+
+    async def compute():
+        calls["count"] += 1
+        return calls["count"]
+    return compute, calls
+
+
+# Test fresh entries are hits and expired entries are recomputed inline
+def test_hit_and_miss(cache_and_clock):
+    cache, clock = cache_and_clock
+    compute, calls = counter()
+
+    async def run():
+        assert await cache.get("k", compute, ttl=10) == (1, "MISS", 0.0)
+        clock.now = 5
+        assert await cache.get("k", compute, ttl=10) == (1, "HIT", 5)
+        clock.now = 11
+        assert (await cache.get("k", compute, ttl=10))[:2] == (2, "MISS")
+
+    asyncio.run(run())
+    assert calls["count"] == 2
+    assert cache.stats()["hits"] == 1
+
+
+# Test stale entries are served while one background refresh runs
+def test_stale_while_revalidate(cache_and_clock):
+    cache, clock = cache_and_clock
+    compute, calls = counter()
+
+    async def run():
+        await cache.get("k", compute, ttl=10, stale=30)
+        clock.now = 15
+        assert await cache.get("k", compute, ttl=10, stale=30) == (1, "STALE", 15)
+        assert (await cache.get("k", compute, ttl=10, stale=30))[1] == "STALE"
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return await cache.get("k", compute, ttl=10, stale=30)
+
+    value, status, _ = asyncio.run(run())
+    assert (value, status) == (2, "HIT")
+    assert calls["count"] == 2  # Only one background refresh
+
+
+# Test invalidation drops entries and discards refreshes started before it
+def test_invalidate(cache_and_clock):
+    cache, clock = cache_and_clock
+    compute, calls = counter()
+
+    async def run():
+        await cache.get("k", compute, ttl=10, stale=30)
+        clock.now = 15
+        await cache.get("k", compute, ttl=10, stale=30)
+        cache.invalidate()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return await cache.get("k", compute, ttl=10, stale=30)
+
+    value, status, _ = asyncio.run(run())
+    assert status == "MISS"
+    assert value == 3
+
+
+# Test errors of an inline compute are raised and not cached
+def test_compute_error_not_cached(cache_and_clock):
+    cache, _ = cache_and_clock
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get("k", failing, ttl=10))
+    assert cache.stats()["entries"] == 0
+
+
+# Test a marker bumped by one process is seen once by every other process sharing the file
+def test_shared_generation(tmp_path):
+    path = str(tmp_path / "cache" / "generation")
+    worker_a, worker_b = SharedGeneration(path), SharedGeneration(path)
+    assert not worker_b.changed()
+
+    worker_a.bump()
+    assert not worker_a.changed()
+    assert worker_b.changed()
+    assert not worker_b.changed()
+
+    worker_a.bump()
+    worker_a.bump()
+    assert worker_b.changed()
@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+from unittest.mock import patch, MagicMock
+
+from app.routes.vectorIndex import IncidentVectorIndex, UnsupportedFilter
+
+DIMS = 16
+
+
+def random_vectors(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, DIMS)).astype(np.float32)
+
+
+def sources(n, **overrides):
+    return [{"IncidentId": f"INC{i}", "priority": "High" if i % 2 else "Low", "status": "New",
+             "createdDate": f"2024-01-{i % 28 + 1:02d}T00:00:00", **overrides} for i in range(n)]
+
+
+# Test exact search on a small index returns the query document first
+def test_exact_search_small_index():
+    index = IncidentVectorIndex(dims=DIMS, min_train_size=1000)
+    vectors = random_vectors(50)
+    index.upsert([str(i) for i in range(50)], vectors, sources(50))
+
+    hits = index.search(vectors[7], size=3)
+
+    assert hits[0]["_id"] == "7"
+    assert hits[0]["_score"] == pytest.approx(1.0)
+    assert hits[0]["_source"]["IncidentId"] == "INC7"
+    assert len(hits) == 3
+
+
+# Test filters on priority, status and createdDate
+def test_search_filters():
+    index = IncidentVectorIndex(dims=DIMS, min_train_size=1000)
+    vectors = random_vectors(40)
+    index.upsert([str(i) for i in range(40)], vectors, sources(40))
+
+    hits = index.search(vectors[0], size=40, priority=["High"], created_to="2024-01-05T00:00:00")
+
+    assert hits
+    assert all(hit["_source"]["priority"] == "High" for hit in hits)
+    assert all(hit["_source"]["createdDate"] <= "2024-01-05T00:00:00" for hit in hits)
+    assert index.search(vectors[0], size=5, status=["Closed"]) == []
+
+
+# Test a selective filter still returns every matching document although they sit outside the probed lists
+def test_selective_filter_widens_probe():
+    index = IncidentVectorIndex(dims=DIMS, nprobe=1, min_train_size=500)
+    vectors = random_vectors(2000)
+    docs = sources(2000)
+    rare = {"17", "901", "1444"}
+    for i in map(int, rare):
+        docs[i] = {**docs[i], "status": "Escalated"}
+    index.upsert([str(i) for i in range(2000)], vectors, docs)
+
+    hits = index.search(vectors[0], size=10, status=["Escalated"])
+
+    assert index.stats()["ivfLists"] > 1
+    assert {hit["_id"] for hit in hits} == rare
+
+
+# Test date bounds the mirror cannot parse (Elasticsearch date math) are rejected instead of ignored
+def test_date_math_filter_unsupported():
+    index = IncidentVectorIndex(dims=DIMS, min_train_size=1000)
+    vectors = random_vectors(5)
+    index.upsert([str(i) for i in range(5)], vectors, sources(5))
+
+    for bounds in ({"created_from": "now-7d/d"}, {"created_to": "now-1M"}):
+        with pytest.raises(UnsupportedFilter):
+            index.search(vectors[0], size=5, **bounds)
+
+
+# Test upsert replaces in place and remove hides documents
+def test_upsert_and_remove():
+    index = IncidentVectorIndex(dims=DIMS, min_train_size=1000)
+    vectors = random_vectors(10)
+    index.upsert([str(i) for i in range(10)], vectors, sources(10))
+    index.upsert(["3"], [vectors[5]], sources(1, status="Closed"))
+    index.remove(["5"])
+
+    hits = index.search(vectors[5], size=1)
+
+    assert len(index) == 9
+    assert hits[0]["_id"] == "3"
+    assert hits[0]["_source"]["status"] == "Closed"
+
+
+# Test removed rows are compacted away once they outnumber the live ones, and clear resets readiness
+def test_remove_compacts_and_clear():
+    index = IncidentVectorIndex(dims=DIMS, min_train_size=100000)
+    vectors = random_vectors(3000)
+    index.upsert([str(i) for i in range(3000)], vectors, sources(3000))
+    index.remove([str(i) for i in range(2500)])
+
+    assert len(index) == 500
+    assert len(index._ids) == 500
+    assert index.search(vectors[2900], size=1)[0]["_id"] == "2900"
+    assert index.search(vectors[2900], size=1, priority=["Low"])[0]["_source"]["priority"] == "Low"
+
+    index.ready = True
+    index.clear()
+    assert not index.ready
+    assert len(index) == 0
+
+
+# Test the IVF structure is trained once the index is large enough and keeps good recall
+def test_ivf_recall():
+    index = IncidentVectorIndex(dims=DIMS, nprobe=8, min_train_size=500)
+    vectors = random_vectors(2000, seed=1)
+    index.upsert([str(i) for i in range(2000)], vectors, sources(2000))
+
+    assert index.stats()["ivfLists"] > 1
+    found = sum(index.search(vectors[i], size=1)[0]["_id"] == str(i) for i in range(0, 2000, 50))
+    assert found >= 36
+
+
+# Test building the mirror from an Elasticsearch scroll
+def test_build_from_elasticsearch():
+    vectors = random_vectors(3)
+    hits = [{"_id": str(i), "_source": {"embedding": vectors[i].tolist(), **sources(3)[i]}} for i in range(3)]
+    index = IncidentVectorIndex(dims=DIMS)
+
+    with patch("app.routes.vectorIndex.helpers.scan", return_value=iter(hits)) as scan:
+        count = index.build_from_elasticsearch(MagicMock(), "incidents_final")
+
+    assert count == 3
+    assert scan.call_args.kwargs["query"]["_source"] is True
+    assert index.ready
+    assert "embedding" not in index.search(vectors[2], size=1)[0]["_source"]
+
+
+# Test writes made while a rebuild scrolls are replayed onto the rebuilt matrix
+def test_build_replays_concurrent_writes():
+    vectors = random_vectors(4)
+    index = IncidentVectorIndex(dims=DIMS)
+
+    def scan(*args, **kwargs):
+        yield {"_id": "0", "_source": sources(1)[0], "fields": {"embedding": [vectors[0].tolist()]}}
+        yield {"_id": "1", "_source": sources(1)[0], "fields": {"embedding": [vectors[1].tolist()]}}
+        # Written while the scroll runs: one new document and one deletion
+        index.upsert(["3"], [vectors[3]], sources(1))
+        index.remove(["1"])
+
+    with patch("app.routes.vectorIndex.helpers.scan", side_effect=scan):
+        count = index.build_from_elasticsearch(MagicMock(), "incidents_final")
+
+    assert count == 2
+    assert index.search(vectors[3], size=1)[0]["_id"] == "3"
+    assert "1" not in [hit["_id"] for hit in index.search(vectors[1], size=4)]
+    assert index._replay is None
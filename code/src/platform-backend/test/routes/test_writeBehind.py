@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+
+import pytest
+
+from app.routes.writeBehind import QueueFullError, WriteBehindQueue
+
+
+# Writer that blocks until released so records pile up in the queue
+class GatedWriter:
+    def __init__(self, fail_times=0):
+        self.gate = threading.Event()
+        self.batches = []
+        self.fail_times = fail_times
+
+    def __call__(self, records):
+        self.gate.wait(2)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError("Elasticsearch unreachable")
+        self.batches.append(list(records))
+        return ["mapping error" if record.get("bad") else None for record in records]
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+@pytest.fixture
+def writer():
+    return GatedWriter()
+
+
+# Test queued records are written in one batch and their statuses are tracked
+def test_batches_and_statuses(writer):
+    queue = WriteBehindQueue(writer, max_batch_size=10, max_wait_ms=50)
+    ids = [queue.submit({"n": i}) for i in range(3)] + [queue.submit({"bad": True})]
+    assert queue.status(ids[0])["status"] == "queued"
+
+    writer.gate.set()
+    wait_for(lambda: queue.stats()["written"] == 3)
+    assert writer.batches == [[{"n": 0}, {"n": 1}, {"n": 2}, {"bad": True}]]
+    assert queue.status(ids[0])["status"] == "written"
+    failed = queue.status(ids[3])
+    assert (failed["status"], failed["error"]) == ("failed", "mapping error")
+    assert queue.status("unknown") is None
+    queue.stop()
+
+
+# Test a full queue rejects new records instead of growing
+def test_backpressure(writer):
+    queue = WriteBehindQueue(writer, max_queue=2, max_batch_size=1, max_wait_ms=0)
+    queue.submit({"n": 0})
+    wait_for(lambda: queue.stats()["queueDepth"] == 0)  # taken by the blocked writer
+    queue.submit({"n": 1})
+    queue.submit({"n": 2})
+
+    with pytest.raises(QueueFullError):
+        queue.submit({"n": 3})
+    assert queue.stats()["rejected"] == 1
+    writer.gate.set()
+    queue.stop()
+
+
+# Test failed batches are retried instead of being dropped
+def test_retry_on_error():
+    writer = GatedWriter(fail_times=1)
+    writer.gate.set()
+    queue = WriteBehindQueue(writer, max_wait_ms=0, retry_seconds=0.01)
+    tracking_id = queue.submit({"n": 0})
+
+    wait_for(lambda: queue.status(tracking_id)["status"] == "written")
+    assert queue.stats()["retries"] == 1
+    queue.stop()
+
+
+# Test a record that keeps failing its batch is isolated and marked failed instead of blocking the queue
+def test_retries_are_capped():
+    def writer(records):
+        if any(record.get("poison") for record in records):
+            raise ValueError("cannot serialize record")
+        return [None] * len(records)
+
+    queue = WriteBehindQueue(writer, max_batch_size=10, max_wait_ms=50, retry_seconds=0.01, max_retries=2)
+    ids = [queue.submit({"n": 0}), queue.submit({"poison": True}), queue.submit({"n": 1})]
+
+    wait_for(lambda: queue.stats()["written"] == 2)
+    failed = queue.status(ids[1])
+    assert failed["status"] == "failed"
+    assert "cannot serialize record" in failed["error"]
+    assert [queue.status(ids[i])["status"] for i in (0, 2)] == ["written", "written"]
+    assert queue.stats()["retries"] == 2
+
+    # The queue keeps going after the poisoned batch
+    tracking_id = queue.submit({"n": 2})
+    wait_for(lambda: queue.status(tracking_id)["status"] == "written")
+    queue.stop()
+
+
+# Test records a dead process accepted but never wrote are requeued from its journal after a restart
+def test_spill_file_recovery(tmp_path, writer):
+    path = str(tmp_path / "spill.jsonl")
+    first = WriteBehindQueue(writer, max_batch_size=1, max_wait_ms=0, spill_path=path)
+    first_id = first.submit({"n": 0})
+    writer.gate.set()
+    wait_for(lambda: first.status(first_id)["status"] == "written")
+    first.stop()
+    assert not os.path.exists(first.spill.path)
+
+    # Journal of a process that accepted two records and died before writing them
+    dead = f"{path}.999-dead"
+    with open(dead, "w") as f:
+        f.write('{"queued":"lost-1","record":{"n":1}}\n{"queued":"lost-2","record":{"n":2}}\n'
+                '{"done":["lost-1"]}\n{"queued": "torn"')
+    open(f"{dead}.lock", "w").close()
+
+    restarted = WriteBehindQueue(writer, max_wait_ms=0, spill_path=path)
+    assert restarted.recover() == 1
+    assert not os.path.exists(dead)
+    wait_for(lambda: (restarted.status("lost-2") or {}).get("status") == "written")
+    assert writer.batches[-1] == [{"n": 2}]
+    wait_for(lambda: restarted.spill.pending() == [])
+    restarted.stop()
+
+
+# Test queues sharing a spill path keep separate journals: draining one never drops the other's records,
+# and a live queue's records are only adopted (once) after it is gone
+def test_spill_file_per_process(tmp_path):
+    path = str(tmp_path / "spill.jsonl")
+    fast, slow = GatedWriter(), GatedWriter()
+    fast.gate.set()
+    first = WriteBehindQueue(fast, max_wait_ms=0, spill_path=path)
+    second = WriteBehindQueue(slow, max_batch_size=1, max_wait_ms=0, spill_path=path)
+    assert first.spill.path != second.spill.path
+
+    second.submit({"n": 1})
+    second.submit({"n": 2})
+    first_id = first.submit({"n": 0})
+    wait_for(lambda: first.status(first_id)["status"] == "written")
+    wait_for(lambda: first.spill.pending() == [])
+    assert [record for _, record in second.spill.pending()] == [{"n": 1}, {"n": 2}]
+
+    other = WriteBehindQueue(fast, max_wait_ms=0, spill_path=path)
+    assert other.recover() == 0
+
+    # The second process dies: its lock is released, its journal stays
+    second.spill._owner.close()
+    assert other.recover() == 2
+    assert WriteBehindQueue(fast, max_wait_ms=0, spill_path=path).recover() == 0
+    wait_for(lambda: [record for batch in fast.batches for record in batch][-2:] == [{"n": 1}, {"n": 2}])
+    slow.gate.set()
+    first.stop()
+    other.stop()